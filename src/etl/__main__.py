@@ -5,7 +5,7 @@ import os
 import baselog
 
 from .config import ETLConf
-from .process import run_etl
+from .process import commits_per_step, run_etl
 from .util.db import create_engine_from_args
 from .util.memory import set_gc_threshold_mult
 
@@ -43,10 +43,16 @@ def main() -> None:
     try:
         logger.info("connecting to database...")
         with target_engine.connect() as cnxn:
-            with cnxn.begin():
+            if commits_per_step(config):
+                # every step commits by itself, the run is made visible at
+                # once through the publish schema
                 logger.info("starting ETL run")
                 run_etl(config, cnxn)
-                logger.info("run complete, beginning database commit")
+            else:
+                with cnxn.begin():
+                    logger.info("starting ETL run")
+                    run_etl(config, cnxn)
+                    logger.info("run complete, beginning database commit")
     except KeyboardInterrupt:
         logger.error("KeyboardInterrupt detected, exiting")
         print("\n")
@@ -0,0 +1,288 @@
+"""Checkpoints of the transformation steps, to resume or skip the steps
+whose inputs did not change since an earlier run"""
+
+import hashlib
+import inspect
+import logging
+import sys
+import time
+from types import ModuleType
+from typing import Any, Callable, Dict, Final, Iterator, List, Set, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from .context import ETLContext
+from .sql.run_state import (
+    SQL_CLEAR,
+    SQL_CREATE,
+    SQL_EXISTS,
+    SQL_INSERT,
+    SQL_LAST_RUN,
+    SQL_PUBLISHED,
+    SQL_UPDATE,
+)
+
+logger = logging.getLogger(__name__)
+
+STATUS_PENDING: Final[str] = "pending"
+STATUS_DONE: Final[str] = "done"
+STATUS_FAILED: Final[str] = "failed"
+# completed by an earlier run, the step did not run again
+STATUS_SKIPPED: Final[str] = "skipped"
+# the results were moved to the publish schema
+STATUS_PUBLISHED: Final[str] = "published"
+
+COMPLETED_STATUSES: Final[Set[str]] = {STATUS_DONE, STATUS_SKIPPED}
+# the steps an unfinished run did not get to, or failed
+UNFINISHED_STATUSES: Final[Set[str]] = {STATUS_PENDING, STATUS_FAILED}
+
+# the package whose modules make up the code of a step
+PACKAGE: Final[str] = __name__.partition(".")[0]
+
+
+def _strings(value: Any) -> Iterator[str]:
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            yield from _strings(item)
+    elif isinstance(value, dict):
+        for key, item in value.items():
+            yield from _strings(key)
+            yield from _strings(item)
+
+
+def _package_modules(module: ModuleType) -> List[ModuleType]:
+    """module and the modules of the package it imports, transitively
+
+    A module imports the modules among its globals and the modules of the
+    functions, classes and objects among them.
+    """
+    found = {module.__name__: module}
+    todo = [module]
+    while todo:
+        for value in vars(todo.pop()).values():
+            name = (
+                value.__name__
+                if isinstance(value, ModuleType)
+                else getattr(value, "__module__", None)
+            )
+            if (
+                isinstance(name, str)
+                and name.partition(".")[0] == PACKAGE
+                and name not in found
+                and name in sys.modules
+            ):
+                found[name] = sys.modules[name]
+                todo.append(found[name])
+    return [found[name] for name in sorted(found)]
+
+
+def code_digest(func: Callable) -> str:
+    """SHA-256 of the code of a step: the source of its module and of the
+    modules of the package it imports, and the SQL they render, i.e. the
+    strings among their globals"""
+    sha = hashlib.sha256()
+    module = inspect.getmodule(func)
+    if module is None:
+        sha.update(func.__qualname__.encode())
+        return sha.hexdigest()
+    for imported in _package_modules(module):
+        try:
+            sha.update(inspect.getsource(imported).encode())
+        except (OSError, TypeError):
+            sha.update(imported.__name__.encode())
+        for name, value in sorted(vars(imported).items()):
+            if not name.startswith("__"):
+                for string in _strings(value):
+                    sha.update(string.encode())
+    return sha.hexdigest()
+
+
+def _outputs(func: Callable) -> Set[str]:
+    return set(getattr(func, "writes", ())) | set(getattr(func, "appends", ()))
+
+
+def step_fingerprints(
+    steps: Dict[str, Callable],
+    dependencies: Dict[str, List[str]],
+    inputs: Dict[str, str],
+    options: str = "",
+) -> Dict[str, str]:
+    """The fingerprint of every step, a hash of its inputs
+
+    The inputs of a step are its code, the options, the fingerprints of the
+    steps it depends on and, for the tables no earlier step writes, their
+    hash in inputs, e.g. the hash of the source files for the source data
+    kept in memory.
+    """
+    fingerprints: Dict[str, str] = {}
+    written: Set[str] = set()
+    for stepname, func in steps.items():
+        sha = hashlib.sha256()
+        for part in (stepname, code_digest(func), options):
+            sha.update(part.encode())
+        tables = set(getattr(func, "reads", ())) | _outputs(func)
+        for table in sorted(tables - written):
+            sha.update(f"{table}:{inputs.get(table, '')}".encode())
+        for dep in dependencies[stepname]:
+            sha.update(fingerprints[dep].encode())
+        written |= _outputs(func)
+        fingerprints[stepname] = sha.hexdigest()
+    return fingerprints
+
+
+def _shares_outputs(first: Callable, second: Callable) -> bool:
+    if not all(hasattr(f, "writes") for f in (first, second)):
+        return True
+    return bool(_outputs(first) & _outputs(second))
+
+
+def reusable_steps(
+    steps: Dict[str, Callable],
+    dependencies: Dict[str, List[str]],
+    fingerprints: Dict[str, str],
+    last_run: Dict[str, Tuple[str, str]],
+) -> Set[str]:
+    """The steps whose results the last run left in place for the same
+    inputs
+
+    Those are the steps the last run completed with the same fingerprint.
+    The steps an unfinished last run did not complete are resumed. Every
+    other step runs again over results that already exist, so the earlier
+    steps sharing its output tables have to run again with it, as do the
+    steps depending on it.
+    """
+    reusable = set()
+    stale = []
+    for stepname, fingerprint in fingerprints.items():
+        status, last_fingerprint = last_run.get(stepname, ("", ""))
+        if status in COMPLETED_STATUSES and last_fingerprint == fingerprint:
+            reusable.add(stepname)
+        elif status not in UNFINISHED_STATUSES:
+            stale.append(stepname)
+    while stale:
+        stepname = stale.pop()
+        for other in sorted(reusable):
+            if stepname in dependencies[other] or (
+                other in dependencies[stepname]
+                and _shares_outputs(steps[stepname], steps[other])
+            ):
+                reusable.discard(other)
+                stale.append(other)
+    return reusable
+
+
+def steps_to_skip(
+    completed: Set[str],
+    volatile: Set[str],
+    dependencies: Dict[str, List[str]],
+) -> Set[str]:
+    """The completed steps a new run leaves out
+
+    Volatile steps have results the last run may have lost, such as the
+    data kept in memory, which a new run has to build again unless every
+    step depending on them is left out as well.
+    """
+    skipped = set(completed) & set(dependencies)
+    changed = True
+    while changed:
+        changed = False
+        for stepname in volatile & skipped:
+            if any(
+                stepname in deps and other not in skipped
+                for other, deps in dependencies.items()
+            ):
+                skipped.discard(stepname)
+                changed = True
+    return skipped
+
+
+def clear_run_state(cnxn: Connection) -> None:
+    """Forget the earlier runs, whose results a run without checkpoints
+    replaces"""
+    if cnxn.execute(text(SQL_EXISTS)).scalar() is not None:
+        cnxn.execute(text(SQL_CLEAR))
+
+
+class Checkpoints:
+    """The run state of the steps of a checkpointed run
+
+    Every step runs in its own transaction, which also marks it done in the
+    etl_run_state table: a step is either committed and recorded as done,
+    or rolled back and recorded as failed.
+    """
+
+    def __init__(self, fingerprints: Dict[str, str]) -> None:
+        self.fingerprints = fingerprints
+        self.run_id = 0
+
+    def last_run(self, cnxn: Connection) -> Dict[str, Tuple[str, str]]:
+        """The status and fingerprint of the steps of the last run"""
+        cnxn.execute(text(SQL_CREATE))
+        return {
+            row.step_name: (row.status, row.fingerprint)
+            for row in cnxn.execute(text(SQL_LAST_RUN))
+        }
+
+    def begin(self, cnxn: Connection, skipped: Set[str]) -> None:
+        """Record a new run of the steps, the skipped ones as completed"""
+        cnxn.execute(text(SQL_CREATE))
+        self.run_id = 1 + max(
+            (row.run_id for row in cnxn.execute(text(SQL_LAST_RUN))), default=0
+        )
+        cnxn.execute(
+            text(SQL_INSERT),
+            [
+                dict(
+                    run_id=self.run_id,
+                    step_name=stepname,
+                    status=(STATUS_SKIPPED if stepname in skipped else STATUS_PENDING),
+                    fingerprint=fingerprint,
+                )
+                for stepname, fingerprint in self.fingerprints.items()
+            ],
+        )
+        logger.info("checkpointed run %s", self.run_id)
+
+    def _update(
+        self, cnxn: Connection, stepname: str, status: str, duration: float
+    ) -> None:
+        cnxn.execute(
+            text(SQL_UPDATE),
+            dict(
+                run_id=self.run_id,
+                step_name=stepname,
+                status=status,
+                duration=duration,
+            ),
+        )
+
+    def run_step(
+        self,
+        stepname: str,
+        func: Callable[[ETLContext], None],
+        ctxt: ETLContext,
+    ) -> None:
+        """Run a step and record its state, in the same transaction"""
+        start = time.time()
+        try:
+            with ctxt.transaction() as cnxn:
+                func(ctxt)
+                self._update(cnxn, stepname, STATUS_DONE, time.time() - start)
+        except Exception:
+            with ctxt.cnxn.engine.begin() as cnxn:
+                self._update(cnxn, stepname, STATUS_FAILED, time.time() - start)
+            raise
+
+    def published(self, cnxn: Connection, stepnames: Set[str]) -> None:
+        """Record that the results of the steps left the target schema"""
+        cnxn.execute(
+            text(SQL_PUBLISHED),
+            dict(
+                run_id=self.run_id,
+                step_names=sorted(stepnames),
+                status=STATUS_PUBLISHED,
+            ),
+        )
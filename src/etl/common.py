@@ -1,7 +1,7 @@
 """All common functions and definitions used in SQL statements here"""
 
 from datetime import date
-from typing import Final
+from typing import Final, List
 
 CONCEPT_ID_CHRONIC_DISEASE: Final = 4015728
 CONCEPT_ID_DATE_DIAGNOSIS: Final = 4160852
@@ -46,3 +46,9 @@ CONCEPT_ID_VIB_SENSE: Final = 4262161
 CONCEPT_ID_YES: Final = 4188539
 
 DEFAULT_DATE: Final = date(1700, 1, 1)
+
+# Days between two intervals of the same concept still forming one era
+ERA_GAP_DAYS: Final = 30
+
+# Cell values in the source exports that stand for a missing value
+NULL_STRINGS: Final[List[str]] = ["nan", "none", "<not performed>"]
@@ -30,6 +30,11 @@ class ETLConf(BaseCfg):
         doc="directory where vocabulary files are located",
         parser=pathparse,
     )
+    cache_dir: Path = opt(
+        default=Path("/cache"),
+        doc="directory where data cached between runs is kept",
+        parser=pathparse,
+    )
 
     # general operating params -----------------------------------------------
     verbosity_level: str = opt(
@@ -47,6 +52,15 @@ class ETLConf(BaseCfg):
         default=";",
         doc="delimiter used in the internal lookup csv files",
     )
+    loader_workers: int = opt(
+        default=1,
+        doc="number of threads used to parse the source and lookup csv files",
+    )
+    chunksize: int = opt(
+        default=0,
+        doc="stream the source files into the database in chunks of this many"
+        " rows instead of loading them fully into memory (0 disables)",
+    )
     lookup_standard_concept_col: str = opt(
         default="standard_concept_id",
         doc="name of standard concept_id column in the lookup csv file",
@@ -57,12 +71,75 @@ class ETLConf(BaseCfg):
         default=False,
         doc="enable vocab load",
     )
+    bulk_load: bool = opt(
+        default=False,
+        doc="load the staging tables with minimal WAL: unlogged source tables,"
+        " TRUNCATE and COPY FREEZE, followed by ANALYZE",
+    )
+    step_workers: int = opt(
+        default=1,
+        doc="number of transformation steps run at the same time; with more"
+        " than one every step commits on its own database connection",
+    )
+    shards: int = opt(
+        default=1,
+        doc="number of worker processes the patients are hash-partitioned"
+        " over; with more than one every shard loads and transforms its"
+        " patients on its own connection into the shared OMOP CDM tables,"
+        " which the run merges at the end, every step commits on its own",
+    )
+    insert_partitions: int = opt(
+        default=1,
+        doc="number of person_id ranges the large INSERT ... SELECT statements"
+        " of the observation, measurement and visit_occurrence steps are"
+        " split in, run at the same time on their own database connections;"
+        " with more than one every step commits on its own",
+    )
+    checkpoint: bool = opt(
+        default=False,
+        doc="commit every transformation step on its own and record its"
+        " state in the etl_run_state table, so that a failed run can resume",
+    )
+    resume: bool = opt(
+        default=False,
+        doc="leave out the steps whose inputs did not change since the last"
+        " checkpointed run completed them, failed or not (implies checkpoint)",
+    )
+    incremental: bool = opt(
+        default=False,
+        doc="rebuild only the patients whose source rows changed since the"
+        " last incremental run, keeping the OMOP CDM tables of the others; a"
+        " run without it or with publish_schema makes the next one build all",
+    )
+    era_engine: str = opt(
+        default="sql",
+        doc="where the condition and drug eras are built: sql on the database"
+        " server, numpy in the ETL process from the streamed intervals",
+        choices=["sql", "numpy"],
+    )
+    publish_schema: str = opt(
+        default="",
+        doc="schema the OMOP CDM tables are moved to in one transaction once"
+        " the run succeeds (empty keeps them in the target schema)",
+    )
     run_integration_tests: bool = opt(
         default=True,
         doc="run etl integration tests as part of testsuite",
     )
 
     # database settings--------------------------------------------------------
+    copy_format: str = opt(
+        default="csv",
+        doc="data format used to COPY the source and lookup tables into the"
+        " database, binary falls back to csv for columns it cannot encode",
+        choices=["csv", "binary"],
+    )
+    copy_workers: int = opt(
+        default=1,
+        doc="number of database connections used to COPY the source and lookup"
+        " tables; with more than one they are loaded in parallel through a"
+        " staging schema",
+    )
     db_dbms: str = opt(
         default="postgresql",
         doc="database management system used on the db_server",
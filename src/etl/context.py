@@ -8,6 +8,7 @@ import pandas as pd
 from sqlalchemy.engine import Connection
 
 from .config import ETLConf
+from .loader import Loader
 
 
 class ETLContext:
@@ -16,6 +17,11 @@ class ETLContext:
     config: ETLConf
     lookups: Dict[str, pd.DataFrame] = {}
     sources: Dict[str, pd.DataFrame] = {}
+    source_loader: Optional[Loader] = None
+    # the digest of the inputs of the run but the source data
+    inputs_digest: str = ""
+    # the shard of the patients transformed, with more than one shard
+    shard: int = 0
     cnxn: Connection
     logger: logging.Logger
 
@@ -26,6 +32,9 @@ class ETLContext:
         lookups: Optional[Dict[str, pd.DataFrame]] = None,
         sources: Optional[Dict[str, pd.DataFrame]] = None,
         logger: Optional[logging.Logger] = None,
+        source_loader: Optional[Loader] = None,
+        inputs_digest: Optional[str] = None,
+        shard: Optional[int] = None,
     ) -> None:
         self.config = config
         if cnxn:
@@ -36,6 +45,12 @@ class ETLContext:
             self.sources = sources
         if logger:
             self.logger = logger
+        if source_loader:
+            self.source_loader = source_loader
+        if inputs_digest:
+            self.inputs_digest = inputs_digest
+        if shard:
+            self.shard = shard
 
     @contextmanager
     def transaction(self):
@@ -1,16 +1,112 @@
 """Load files into memory"""
 
+import hashlib
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from importlib.resources.abc import Traversable
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Callable, Dict, Iterator
 
+import numpy as np
 import pandas as pd
+from sqlalchemy import Float, Integer
 
+from .common import NULL_STRINGS
 from .util.exceptions import ETLFatalErrorException
 
 logger = logging.getLogger(__name__)
 
+# Number of offending values quoted when a column fails type coercion
+COERCION_EXAMPLES: int = 5
+
+# Bytes read at a time when hashing the input files
+DIGEST_BLOCK_SIZE: int = 1 << 20
+
+
+def model_usecols(model: Any) -> Callable[[str], bool]:
+    """Select the file columns the model knows, matched case-insensitively"""
+    wanted = {column.name.lower() for column in model.__table__.columns}
+
+    def usecols(header: str) -> bool:
+        return header.lower() in wanted
+
+    return usecols
+
+
+def numeric_dtypes(model: Any) -> Dict[str, str]:
+    """Target dtypes of the integer and float columns of a model"""
+    dtypes = {}
+    for column in model.__table__.columns:
+        if isinstance(column.type, Integer):
+            dtypes[column.name] = "Int64"
+        elif isinstance(column.type, Float):
+            dtypes[column.name] = "float64"
+    return dtypes
+
+
+def coerce_types(tablename: str, model: Any, input_df: pd.DataFrame) -> pd.DataFrame:
+    """Convert the numeric columns to their model type
+
+    Values that cannot be converted become missing, they are reported per
+    column. The usual null markers are not counted as failures.
+    """
+    dtypes = numeric_dtypes(model)
+    for column in input_df.columns:
+        dtype = dtypes.get(column.lower())
+        if dtype is None:
+            continue
+        values = input_df[column]
+        converted = pd.to_numeric(values, errors="coerce")
+        failed = (
+            converted.isna()
+            & values.notna()
+            & ~values.str.strip().str.lower().isin(NULL_STRINGS + [""])
+        )
+        if dtype == "Int64":
+            fractional = converted.notna() & (converted % 1 != 0)
+            failed |= fractional
+            converted = converted.mask(fractional)
+        if failed.any():
+            logger.warning(
+                "Table %s, column %s: %s value(s) could not be converted to %s"
+                " and were set to missing, e.g. %s",
+                tablename,
+                column,
+                failed.sum(),
+                dtype,
+                list(values[failed].unique()[:COERCION_EXAMPLES]),
+            )
+        input_df[column] = converted.astype(dtype)
+    return input_df
+
+
+def patient_shards(patient_ids: pd.Series, shards: int) -> np.ndarray:
+    """The shard of every patient id, from a hash of the id
+
+    The ids are hashed rather than taken modulo the shard count, so the
+    shards stay balanced whatever the pattern of the ids. The rows without
+    a patient all fall in the same shard.
+    """
+    hashes = pd.util.hash_pandas_object(patient_ids, index=False)
+    return (hashes % shards).to_numpy()
+
+
+def shard_rows(
+    model: Any, input_df: pd.DataFrame, shard: int, shards: int
+) -> pd.DataFrame:
+    """The rows of the patients in shard, all of them with a single shard"""
+    if shards == 1:
+        return input_df
+    patient_id = model.patient_id.name.lower()
+    columns = [c for c in input_df.columns if c.lower() == patient_id]
+    patient_ids = (
+        input_df[columns[0]]
+        if columns
+        else pd.Series(pd.NA, index=input_df.index, dtype="Int64")
+    )
+    in_shard = patient_shards(patient_ids, shards) == shard
+    return input_df[in_shard].reset_index(drop=True)
+
 
 class Loader:
     """An empty loader to load in csv files"""
@@ -41,6 +137,14 @@ class Loader:
     def data(self) -> Dict[str, Any]:
         return self.file_data
 
+    def digest(self) -> str:
+        """A hash of the inputs, empty for loaders without any"""
+        return ""
+
+    def iter_chunks(self, model: Any, chunksize: int) -> Iterator[pd.DataFrame]:
+        """Read the data of a model in chunks of chunksize rows, none here"""
+        return iter(())
+
 
 EmptyLoader = Loader
 
@@ -54,40 +158,90 @@ class CSVFileLoader(Loader):
         models: Dict,
         delimiter: str = ",",
         extension: str = ".csv",
+        workers: int = 1,
+        shard: int = 0,
+        shards: int = 1,
     ) -> None:
         super().__init__(models)
         self.directory = directory
         self.delimiter = delimiter
         self.extension = extension
         self.encoding = "utf-8"
-
-    def load(self) -> Loader:
-        """Load from source csv files"""
-        self.reset()
-        for model in self.models:
-            tablename = model.__tablename__
-            input_file = self.directory.joinpath(f"{tablename}{self.extension}")
-            if not input_file.is_file():
-                logger.error(
-                    "The following table is expected but is missing: %s, please check input data",
-                    tablename,
-                )
-                raise ETLFatalErrorException(
-                    f"Table: {tablename} missing. Expected file name: {input_file}."
-                )
-            logger.info(
-                "Loading: %s, into memory",
+        self.workers = max(workers, 1)
+        # with several shards only the rows of the patients in shard are kept
+        self.shard = shard
+        self.shards = max(shards, 1)
+
+    def _input_file(self, model: Any) -> Path | Traversable:
+        tablename = model.__tablename__
+        input_file = self.directory.joinpath(f"{tablename}{self.extension}")
+        if not input_file.is_file():
+            logger.error(
+                "The following table is expected but is missing: %s, please check input data",
                 tablename,
             )
-            logger.debug("Using encoding: %s", self.encoding)
-            self._update(
-                tablename,
-                pd.read_csv(
-                    input_file,
-                    sep=self.delimiter,
-                    encoding=self.encoding,
-                    low_memory=False,
-                ),
+            raise ETLFatalErrorException(
+                f"Table: {tablename} missing. Expected file name: {input_file}."
             )
+        return input_file
+
+    def _read_csv(self, model: Any, **kwargs) -> Any:
+        logger.debug("Using encoding: %s", self.encoding)
+        # every column is read as text, the numeric ones are coerced
+        # afterwards so that conversion failures can be reported
+        return pd.read_csv(
+            self._input_file(model),
+            sep=self.delimiter,
+            encoding=self.encoding,
+            usecols=model_usecols(model),
+            dtype=str,
+            **kwargs,
+        )
+
+    def check(self) -> None:
+        """Make sure an input file exists for every model"""
+        for model in self.models:
+            self._input_file(model)
+
+    def digest(self) -> str:
+        """SHA-256 of the input files, in model order"""
+        sha = hashlib.sha256()
+        for model in self.models:
+            sha.update(model.__tablename__.encode())
+            with self._input_file(model).open("rb") as input_file:
+                while block := input_file.read(DIGEST_BLOCK_SIZE):
+                    sha.update(block)
+        return sha.hexdigest()
+
+    def _load_model(self, model: Any) -> pd.DataFrame:
+        tablename = model.__tablename__
+        logger.info(
+            "Loading: %s, into memory",
+            tablename,
+        )
+        input_df = self._read_csv(model)
+        input_df = coerce_types(tablename, model, input_df)
+        return shard_rows(model, input_df, self.shard, self.shards)
+
+    def load(self) -> Loader:
+        """Load from source csv files, using up to self.workers threads"""
+        self.reset()
+        # fail on the first missing file before any parsing starts
+        self.check()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            # map yields in model order, keeping the data dict deterministic
+            for model, input_df in zip(
+                self.models, executor.map(self._load_model, self.models)
+            ):
+                self._update(model.__tablename__, input_df)
 
         return self
+
+    def iter_chunks(self, model: Any, chunksize: int) -> Iterator[pd.DataFrame]:
+        """Read the csv file of a model in chunks of chunksize rows"""
+        tablename = model.__tablename__
+        logger.info("Streaming: %s, in chunks of %s rows", tablename, chunksize)
+        with self._read_csv(model, chunksize=chunksize) as reader:
+            for chunk in reader:
+                chunk = coerce_types(tablename, model, chunk)
+                yield shard_rows(model, chunk, self.shard, self.shards)
@@ -5,7 +5,14 @@
 from typing import Any, Dict, Final, List
 
 from ..models.lookupmodels import CodeLogger
-from ..models.modelutils import FK, CharField, Column, IntField, make_model_base
+from ..models.modelutils import (
+    FK,
+    CharField,
+    Column,
+    FloatField,
+    IntField,
+    make_model_base,
+)
 from ..models.omopcdm54.clinical import Person
 from ..models.omopcdm54.registry import TARGET_SCHEMA
 
@@ -49,6 +56,35 @@ class ETLLogger(LoggerModelBase):
     error_code_level: Final[Column] = CharField(200)
 
 
+# not registered: the run state is kept across runs, create_logger leaves it
+class ETLRunState(LoggerModelBase):
+    """
+    The state of the transformation steps of the checkpointed runs
+    """
+
+    __tablename__ = "etl_run_state"
+    __table_args__ = {"schema": TARGET_SCHEMA}
+
+    run_id: Final[Column] = IntField(primary_key=True, autoincrement=False)
+    step_name: Final[Column] = CharField(50, primary_key=True)
+    status: Final[Column] = CharField(20, nullable=False)
+    fingerprint: Final[Column] = CharField(64, nullable=False)
+    duration: Final[Column] = FloatField()
+
+
+# not registered either, kept across the incremental runs
+class ETLPatientState(LoggerModelBase):
+    """
+    The hash of the source rows of every patient the OMOP CDM tables hold
+    """
+
+    __tablename__ = "etl_patient_state"
+    __table_args__ = {"schema": TARGET_SCHEMA}
+
+    patient_id: Final[Column] = IntField(primary_key=True, autoincrement=False)
+    row_hash: Final[Column] = CharField(32, nullable=False)
+
+
 # pylint: disable=no-member
 LOGGER_MODELS: Final[Dict[str, LoggerModelBase]] = (  # type: ignore
     LoggerModelRegistry().registered
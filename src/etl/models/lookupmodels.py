@@ -2,11 +2,22 @@
 
 # pylint: disable=too-many-lines
 # pylint: disable=invalid-name
+from enum import Enum
 from typing import Any, Dict, Final, List
 
-from ..models.modelutils import FK, CharField, Column, IntField, make_model_base
+from sqlalchemy import Computed, Index
+
+from ..models.modelutils import (
+    FK,
+    CharField,
+    Column,
+    DateField,
+    IntField,
+    make_model_base,
+)
 from ..models.omopcdm54.registry import TARGET_SCHEMA
 from ..models.omopcdm54.vocabulary import Concept
+from ..models.source import SOURCE_SCHEMA
 
 LookupModelBase: Any = make_model_base()
 
@@ -28,18 +39,40 @@ def register_lookup_model(cls: Any) -> Any:
     return cls
 
 
+class LookupFilter(Enum):
+    """Enum for the filters of the concept lookup, see ConceptLookup.filter_key"""
+
+    CONDITION = "condition"
+    DRUG_EXPOSURE = "drug_exposure"
+    LOCATION = "location"
+    PROCEDURE = "procedure"
+    STOP_REASON = "stop_reason"
+    VAC = "vac"
+
+
 @register_lookup_model
 class ConceptLookup(LookupModelBase):
-    """Lookup table to map source concepts to target concept_ids"""
+    """Lookup table to map source concepts to target concept_ids
+
+    The lookups join on concept_key and filter_key, the lower case forms of
+    concept_string and filter, which the database computes on insert.
+    """
 
     __tablename__: Final = "concept_lookup"
-    __table_args__ = {"schema": TARGET_SCHEMA}
+    __table_args__ = (
+        Index("ix_concept_lookup_keys", "concept_key", "filter_key"),
+        {"schema": TARGET_SCHEMA},
+    )
 
     lookup_id: Final[Column] = IntField(primary_key=True)
     concept_string: Final[Column] = CharField(200)
     standard_concept_id: Final[Column] = IntField(FK(Concept.concept_id))
     domain: Final[Column] = CharField(20)
     filter: Final[Column] = CharField(50)
+    concept_key: Final[Column] = CharField(
+        200, Computed("LOWER(concept_string)", persisted=True)
+    )
+    filter_key: Final[Column] = CharField(50, Computed("LOWER(filter)", persisted=True))
 
 
 @register_lookup_model
@@ -54,6 +87,58 @@ class CodeLogger(LookupModelBase):
     error_code_level: Final[Column] = CharField(200)
 
 
+class VisitLookup(LookupModelBase):
+    """The visit_occurrence_id of every visit of a patient
+
+    Derived from visit_occurrence by the visit_lookup step, not loaded from
+    a lookup file, so the transforms resolve the visit of a source row with
+    a join on the primary key. It is staged with the source tables, every
+    shard of a sharded run keeps its own.
+    """
+
+    __tablename__: Final = "visit_lookup"
+    __table_args__ = {"schema": SOURCE_SCHEMA}
+
+    person_id: Final[Column] = IntField(primary_key=True, autoincrement=False)
+    visit_date: Final[Column] = DateField(primary_key=True)
+    visit_occurrence_id: Final[Column] = IntField(nullable=False)
+
+
+class DrugIngredientMap(LookupModelBase):
+    """The RxNorm ingredients of every drug concept
+
+    Derived from concept_ancestor by the reload_vocab step and kept between
+    runs, as it only changes with the vocabulary. vocabulary_version is the
+    version of the vocabulary it was built from. The primary key leads with
+    the drug concept, the column the drug eras join on.
+    """
+
+    __tablename__: Final = "drug_ingredient_map"
+    __table_args__ = {"schema": TARGET_SCHEMA}
+
+    drug_concept_id: Final[Column] = IntField(primary_key=True, autoincrement=False)
+    ingredient_concept_id: Final[Column] = IntField(
+        primary_key=True, autoincrement=False
+    )
+    vocabulary_version: Final[Column] = CharField(255)
+
+
+class PatientDelta(LookupModelBase):
+    """The patients an incremental run rebuilds
+
+    Derived from the source tables by the patient_delta step: the patients
+    whose source rows differ from the ones of the last incremental run,
+    with the hash of their new rows, missing for the patients no longer in
+    the source data.
+    """
+
+    __tablename__: Final = "patient_delta"
+    __table_args__ = {"schema": TARGET_SCHEMA}
+
+    patient_id: Final[Column] = IntField(primary_key=True, autoincrement=False)
+    row_hash: Final[Column] = CharField(32)
+
+
 # pylint: disable=no-member
 LOOKUP_MODELS: Final[Dict[str, LookupModelBase]] = (  # type: ignore
     LookupModelRegistry().registered
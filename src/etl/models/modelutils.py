@@ -76,6 +76,15 @@ def BoolField(*args, **kwargs) -> Column:
     return Column(Boolean, *args, **kwargs)
 
 
+def columns_of_type(model: Any, column_type: Any) -> List[str]:
+    """Names of the model columns whose type is an instance of column_type"""
+    return [
+        column.name
+        for column in model.__table__.columns
+        if isinstance(column.type, column_type)
+    ]
+
+
 def make_model_base(schema: Optional[str] = None):
     """Dynamically create a new model base"""
     return declarative_base(
@@ -96,27 +105,71 @@ def drop_tables_sql(models: List[Any], cascade=True) -> str:
     return drop_sql
 
 
-def create_tables_sql(models: List[Any], dialect=DIALECT_POSTGRES) -> str:
+def create_tables_sql(
+    models: List[Any], dialect=DIALECT_POSTGRES, unlogged: bool = False
+) -> str:
     sql = []
     for model in models:
-        sql.append(
-            str(
-                CreateTable(
-                    model.__table__,
-                    include_foreign_key_constraints=[],
-                    if_not_exists=True,
-                ).compile(dialect=dialect)
-            )
+        statement = str(
+            CreateTable(
+                model.__table__,
+                include_foreign_key_constraints=[],
+                if_not_exists=True,
+            ).compile(dialect=dialect)
         )
+        if unlogged:
+            statement = statement.replace("CREATE TABLE", "CREATE UNLOGGED TABLE", 1)
+        sql.append(statement)
     return "; ".join(sql) + ";"
 
 
+def analyze_tables_sql(models: List[Any]) -> str:
+    return " ".join(f"ANALYZE {str(m.__table__)};" for m in models)
+
+
+def move_tables_sql(
+    models: List[Any],
+    from_schema: Optional[str] = None,
+    to_schema: Optional[str] = None,
+) -> str:
+    """Replace the tables of models in to_schema by those in from_schema
+
+    Either schema defaults to the schema of the model.
+    """
+    sql = []
+    for model in models:
+        table = model.__table__
+        source = from_schema or table.schema
+        target = to_schema or table.schema
+        sql.append(
+            f"CREATE SCHEMA IF NOT EXISTS {target};"
+            f" DROP TABLE IF EXISTS {target}.{table.name} CASCADE;"
+            f" ALTER TABLE {source}.{table.name} SET SCHEMA {target};"
+        )
+    return " ".join(sql)
+
+
+def schema_copy(model: Any, schema: str) -> Any:
+    """A stand-in for model whose table lives in another schema
+
+    The copy only carries the table, so it can be passed to the *_sql
+    helpers of this module and to df_to_sql.
+    """
+    table = model.__table__.to_metadata(MetaData(), schema=schema)
+    return type(
+        model.__name__,
+        (),
+        {"__tablename__": model.__tablename__, "__table__": table},
+    )
+
+
 def set_indexes_sql(
     models: List[Any], dialect: Optional[Any] = DIALECT_POSTGRES
 ) -> str:
     sql = []
     for model in models:
-        for index in model.__table__.indexes:
+        # a set, sorted so that the SQL is the same from run to run
+        for index in sorted(model.__table__.indexes, key=lambda i: i.name):
             sql.append(
                 str(CreateIndex(index, if_not_exists=True).compile(dialect=dialect))
             )
@@ -8,6 +8,7 @@ from typing import Any, Dict, Final, List
 from sqlalchemy import Column
 
 from ..models.modelutils import (
+    BoolField,
     CharField,
     DateField,
     FloatField,
@@ -16,10 +17,20 @@ from ..models.modelutils import (
     make_model_base,
 )
 
-SOURCE_SCHEMA: Final[str] = os.environ.get("DB_SRC_SCHEMA", "source")
+SOURCE_SCHEMA_ENV: Final[str] = "DB_SRC_SCHEMA"
+SOURCE_SCHEMA: Final[str] = os.environ.get(SOURCE_SCHEMA_ENV, "source")
 SourceModelBase: Final[Any] = make_model_base(schema=SOURCE_SCHEMA)
 
 
+def shard_schema(shard: int) -> str:
+    """The schema the worker process of a shard stages its source tables in
+
+    The worker gets it as its SOURCE_SCHEMA_ENV, the source models of
+    every shard then refer to its own tables.
+    """
+    return f"{SOURCE_SCHEMA}_shard_{shard}"
+
+
 class SourceModelRegistry:
     """A simple global registry for source tables"""
 
@@ -159,6 +170,8 @@ class Dmt(SourceModelBase, PKIdMixin):
     dmt_type: Final[Column] = CharField(21, name="dmt_type")
     dmt_start: Final[Column] = DateField(name="dmt_start")
     dmt_stop: Final[Column] = DateField(name="dmt_stop")
+    # set by the preprocessing, whether the given dmt_stop is a valid date
+    dmt_stop_valid: Final[Column] = BoolField(name="dmt_stop_valid")
     dmt_stop_reas: Final[Column] = CharField(21, name="dmt_stop_reas")
 
 
@@ -1,17 +1,34 @@
 """Run the ETL and supporting classes for transformations"""
 
 # pylint: disable=unused-import
+import hashlib
 import importlib.resources
+import json
 import logging
 import time
-from typing import Callable, Dict, TypeAlias
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    wait,
+)
+from typing import Callable, Dict, Final, List, Optional, Set, TypeAlias
 
+from sqlalchemy import create_engine, text
 from sqlalchemy.engine import Connection
 
+from .checkpoint import (
+    Checkpoints,
+    clear_run_state,
+    reusable_steps,
+    step_fingerprints,
+    steps_to_skip,
+)
 from .config import ETLConf
 from .context import ETLContext
-from .loader import CSVFileLoader
+from .loader import CSVFileLoader, Loader
 from .models.lookupmodels import LOOKUP_MODELS
+from .models.modelutils import move_tables_sql
 from .models.omopcdm54.clinical import (
     ConditionOccurrence,
     DrugExposure,
@@ -28,7 +45,10 @@ from .models.omopcdm54.standardized_derived_elements import (
     ConditionEra,
     DrugEra,
 )
+from .models.omopcdm54.vocabulary import Vocabulary
 from .models.source import SOURCE_MODELS
+from .sql.create_omopcdm_tables import MODELS as OMOP_MODELS
+from .sql.drug_ingredient_map import SQL_VOCABULARY_VERSION
 from .transform import (
     cdm_source,
     condition,
@@ -43,29 +63,468 @@ from .transform import (
     measurement,
     observation,
     observation_period,
+    patient_delta,
     person,
     preprocessing,
     procedure,
     reload_vocab,
+    shards,
+    visit_lookup,
     visit_occurrence,
 )
 from .transform.etl_summary import ModelSummary, print_models_summary
+from .transform.transformutils import CTXT_LOOKUPS, CTXT_SOURCES
+from .util.exceptions import ETLFatalErrorException
+from .util.shards import run_shards
+from .util.staging import drop_staging_schemas
 
 logger = logging.getLogger(__name__)
 CSV_DIR = importlib.resources.files("etl.csv")
 
 StepsDict: TypeAlias = Dict[str, Callable[[ETLContext], None]]
 
+# the options that change the results of the steps, part of their fingerprint
+FINGERPRINT_OPTIONS: Final[List[str]] = [
+    "input_delimiter",
+    "lookup_delimiter",
+    "lookup_standard_concept_col",
+    "date_format",
+    "cdm_source_name",
+    "cdm_source_abbreviation",
+    "cdm_holder",
+    "source_release_date",
+    "cdm_etl_ref",
+    "source_description",
+    "source_doc_reference",
+    "incremental",
+]
+
+# the steps of a sharded run: the run creates the shared tables, then every
+# shard stages and transforms its patients into them, and the run merges
+SETUP_STEPS: Final[List[str]] = [
+    "reload_vocab",
+    "preprocess_data",
+    "create_lookup",
+    "create_logger",
+    "create_omop",
+    "patient_delta",
+]
+SHARD_STEPS: Final[List[str]] = [
+    "preprocess_data",
+    "create_source",
+    "location",
+    "person",
+    "visit_occurrence",
+    "visit_lookup",
+    "drug_exposure",
+    "condition",
+    "procedure",
+    "measurement",
+    "observation",
+    "observation_period",
+    "condition_era",
+    "drug_era",
+]
+MERGE_STEPS: Final[List[str]] = ["cdm_source"]
+
+
+def step_dependencies(steps: StepsDict) -> Dict[str, List[str]]:
+    """The earlier steps each step has to wait for
 
-def run_transformations(steps: StepsDict, ctxt: ETLContext):
-    """Run the transformations"""
+    Steps declare their tables with step_tables. A step depends on every
+    earlier step it conflicts with, so running the steps in any order that
+    respects the dependencies gives the result of running them in order.
+    Steps without declarations conflict with all others.
+    """
+    dependencies: Dict[str, List[str]] = {}
     for i, (stepname, func) in enumerate(steps.items()):
-        logged_name = f"{stepname} ({func.__module__!r})"
-        ctxt.log_big("step %s: %s start", i, logged_name)
-        dur = time.time()
+        dependencies[stepname] = [
+            other
+            for other, other_func in list(steps.items())[:i]
+            if _conflicts(other_func, func)
+        ]
+    return dependencies
+
+
+def _conflicts(first: Callable, second: Callable) -> bool:
+    if not all(hasattr(f, "writes") for f in (first, second)):
+        return True
+    # appending to the same table is the only access that commutes
+    first_all = first.reads | first.writes | first.appends  # type: ignore
+    second_all = second.reads | second.writes | second.appends  # type: ignore
+    return bool(
+        first.writes & second_all  # type: ignore
+        or second.writes & first_all  # type: ignore
+        or first.appends & (second.reads | second.writes)  # type: ignore
+        or second.appends & (first.reads | first.writes)  # type: ignore
+    )
+
+
+def critical_path(
+    dependencies: Dict[str, List[str]], durations: Dict[str, float]
+) -> List[str]:
+    """The chain of dependent steps with the longest total duration"""
+    finish: Dict[str, float] = {}
+    previous: Dict[str, Optional[str]] = {}
+    for stepname, deps in dependencies.items():
+        slowest = max(deps, key=lambda dep: finish[dep], default=None)
+        previous[stepname] = slowest
+        finish[stepname] = durations[stepname] + (
+            finish[slowest] if slowest is not None else 0.0
+        )
+    if not finish:
+        return []
+    path: List[str] = []
+    last: Optional[str] = max(finish, key=lambda name: finish[name])
+    while last is not None:
+        path.append(last)
+        last = previous[last]
+    return path[::-1]
+
+
+def commits_per_step(config: ETLConf) -> bool:
+    """Whether every step commits by itself instead of the run as a whole"""
+    return (
+        config.step_workers > 1
+        or config.checkpoint
+        or config.resume
+        or config.shards > 1
+        or config.insert_partitions > 1
+    )
+
+
+def _run_step(
+    i: int,
+    stepname: str,
+    func: Callable,
+    ctxt: ETLContext,
+    checkpoints: Optional[Checkpoints] = None,
+) -> float:
+    logged_name = f"{stepname} ({func.__module__!r})"
+    ctxt.log_big("step %s: %s start", i, logged_name)
+    dur = time.time()
+    if checkpoints:
+        checkpoints.run_step(stepname, func, ctxt)
+    else:
         func(ctxt)
-        dur = time.time() - dur
-        logger.info("step %s: %s done in %ss", i, logged_name, dur)
+    dur = time.time() - dur
+    logger.info("step %s: %s done in %ss", i, logged_name, dur)
+    return dur
+
+
+def _run_step_on_connection(
+    i: int,
+    stepname: str,
+    func: Callable,
+    ctxt: ETLContext,
+    checkpoints: Optional[Checkpoints] = None,
+) -> float:
+    """Run a step in its own transaction on its own connection"""
+    with ctxt.cnxn.engine.connect() as cnxn:
+        with cnxn.begin():
+            step_ctxt = ETLContext(
+                ctxt.config,
+                cnxn=cnxn,
+                lookups=ctxt.lookups,
+                sources=ctxt.sources,
+                logger=ctxt.logger,
+                source_loader=ctxt.source_loader,
+                inputs_digest=ctxt.inputs_digest,
+                shard=ctxt.shard,
+            )
+            return _run_step(i, stepname, func, step_ctxt, checkpoints)
+
+
+def _run_parallel(
+    steps: StepsDict,
+    ctxt: ETLContext,
+    dependencies: Dict[str, List[str]],
+    durations: Dict[str, float],
+    checkpoints: Optional[Checkpoints] = None,
+) -> Dict[str, float]:
+    """Run every step as soon as the steps it depends on are done
+
+    Durations holds the steps left out, which count as done.
+    """
+    index = {stepname: i for i, stepname in enumerate(steps)}
+    pending = {
+        stepname: deps
+        for stepname, deps in dependencies.items()
+        if stepname not in durations
+    }
+    running: Dict[Future, str] = {}
+    with ThreadPoolExecutor(max_workers=ctxt.config.step_workers) as executor:
+        while pending or running:
+            ready = [
+                stepname
+                for stepname, deps in pending.items()
+                if all(dep in durations for dep in deps)
+            ]
+            for stepname in ready:
+                del pending[stepname]
+                future = executor.submit(
+                    _run_step_on_connection,
+                    index[stepname],
+                    stepname,
+                    steps[stepname],
+                    ctxt,
+                    checkpoints,
+                )
+                running[future] = stepname
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                # a failure leaves the remaining steps unscheduled
+                durations[running.pop(future)] = future.result()
+    return durations
+
+
+def _volatile_steps(steps: StepsDict, config: ETLConf) -> Set[str]:
+    """The steps with results a failed run may have lost, or that do not
+    declare them: the in-memory data, and the unlogged tables of bulk_load,
+    which a database crash empties"""
+    volatile_tables = {CTXT_SOURCES, CTXT_LOOKUPS}
+    if config.bulk_load:
+        volatile_tables |= {str(m.__table__) for m in SOURCE_MODELS.values()}
+    return {
+        stepname
+        for stepname, func in steps.items()
+        if not hasattr(func, "writes") or func.writes & volatile_tables  # type: ignore
+    }
+
+
+def _start_checkpoints(
+    steps: StepsDict,
+    ctxt: ETLContext,
+    dependencies: Dict[str, List[str]],
+    checkpoints: Checkpoints,
+) -> Set[str]:
+    """Record the new run and return the steps it leaves out"""
+    with ctxt.transaction() as cnxn:
+        skipped: Set[str] = set()
+        if ctxt.config.resume:
+            skipped = steps_to_skip(
+                reusable_steps(
+                    steps,
+                    dependencies,
+                    checkpoints.fingerprints,
+                    checkpoints.last_run(cnxn),
+                ),
+                _volatile_steps(steps, ctxt.config),
+                dependencies,
+            )
+        checkpoints.begin(cnxn, skipped)
+    return skipped
+
+
+def _vocabulary_version(ctxt: ETLContext) -> str:
+    with ctxt.transaction() as cnxn:
+        exists = cnxn.execute(
+            text(f"SELECT to_regclass('{str(Vocabulary.__table__)}')")
+        ).scalar()
+        if exists is None:
+            return ""
+        return str(cnxn.execute(text(SQL_VOCABULARY_VERSION)).scalar())
+
+
+def _options(config: ETLConf) -> str:
+    return json.dumps(
+        {name: str(getattr(config, name)) for name in FINGERPRINT_OPTIONS},
+        sort_keys=True,
+    )
+
+
+def _lookup_inputs(ctxt: ETLContext, lookup_loader: Loader) -> Dict[str, str]:
+    """The inputs of the run but the source files: the lookup files and the
+    version of the vocabulary
+
+    The database server reads the vocabulary files reload_vocab loads, a
+    reload is taken to bring a new vocabulary.
+    """
+    vocabulary = (
+        f"reloaded at {time.time()}"
+        if ctxt.config.reload_vocab
+        else _vocabulary_version(ctxt)
+    )
+    return {
+        CTXT_LOOKUPS: lookup_loader.digest(),
+        str(Vocabulary.__table__): vocabulary,
+    }
+
+
+def make_checkpoints(
+    steps: StepsDict,
+    ctxt: ETLContext,
+    source_loader: Loader,
+    lookup_loader: Loader,
+) -> Checkpoints:
+    """The checkpoints of a run, with the fingerprints of its steps
+
+    The inputs of the run are the source and lookup files and the version
+    of the vocabulary.
+    """
+    inputs = {
+        CTXT_SOURCES: source_loader.digest(),
+        **_lookup_inputs(ctxt, lookup_loader),
+    }
+    return Checkpoints(
+        step_fingerprints(
+            steps, step_dependencies(steps), inputs, _options(ctxt.config)
+        )
+    )
+
+
+def inputs_digest(steps: StepsDict, ctxt: ETLContext, lookup_loader: Loader) -> str:
+    """The digest of what the results of a run depend on besides the source
+    data: the fingerprints of its steps without the source files
+
+    An incremental run salts the hashes of the patients with it, so that
+    any other change rebuilds every patient.
+    """
+    fingerprints = step_fingerprints(
+        steps,
+        step_dependencies(steps),
+        _lookup_inputs(ctxt, lookup_loader),
+        _options(ctxt.config),
+    )
+    return hashlib.sha256("".join(fingerprints.values()).encode()).hexdigest()
+
+
+def run_transformations(
+    steps: StepsDict,
+    ctxt: ETLContext,
+    checkpoints: Optional[Checkpoints] = None,
+):
+    """Run the transformations
+
+    With step_workers above one, independent steps run concurrently, each
+    in its own transaction on its own connection. With checkpoints every
+    step commits on its own and is recorded in the run state, with resume
+    the steps whose results the last run left in place for the same inputs
+    are left out.
+    """
+    dependencies = step_dependencies(steps)
+    wall = time.time()
+    durations: Dict[str, float] = {}
+    if checkpoints:
+        skipped = _start_checkpoints(steps, ctxt, dependencies, checkpoints)
+        for stepname in steps:
+            if stepname in skipped:
+                logger.info("step %s: served from the cache", stepname)
+                durations[stepname] = 0.0
+        logger.info("%s of %s steps served from the cache", len(skipped), len(steps))
+    if ctxt.config.step_workers > 1:
+        _run_parallel(steps, ctxt, dependencies, durations, checkpoints)
+    else:
+        for i, (stepname, func) in enumerate(steps.items()):
+            if stepname not in durations:
+                durations[stepname] = _run_step(i, stepname, func, ctxt, checkpoints)
+    wall = time.time() - wall
+    path = critical_path(dependencies, durations)
+    logger.info(
+        "critical path: %s (%.1fs of %.1fs wall clock)",
+        " -> ".join(f"{name} {durations[name]:.1f}s" for name in path),
+        sum(durations[name] for name in path),
+        wall,
+    )
+
+
+def publish(
+    ctxt: ETLContext,
+    steps: Optional[StepsDict] = None,
+    checkpoints: Optional[Checkpoints] = None,
+) -> None:
+    """Move the OMOP CDM tables to the publish schema in one transaction
+
+    With checkpoints, the steps writing the OMOP CDM tables are recorded
+    as published, their results are no longer in place for later runs, nor
+    for an incremental run.
+    """
+    schema = ctxt.config.publish_schema
+    logger.info("Publishing the OMOP CDM tables to %s", schema)
+    with ctxt.transaction() as cnxn:
+        cnxn.execute(text(move_tables_sql(OMOP_MODELS, to_schema=schema)))
+        patient_delta.clear_patient_state(cnxn)
+        if checkpoints and steps:
+            omop_tables = {str(model.__table__) for model in OMOP_MODELS}
+            checkpoints.published(
+                cnxn,
+                {
+                    stepname
+                    for stepname, func in steps.items()
+                    if not hasattr(func, "writes") or func.writes & omop_tables  # type: ignore
+                },
+            )
+
+
+def _run_shard(
+    shard: int,
+    config: ETLConf,
+    url: str,
+    search_path: str,
+    steps: StepsDict,
+) -> None:
+    """Load and transform the patients of a shard, in its worker process"""
+    source_loader = CSVFileLoader(
+        config.datadir,
+        SOURCE_MODELS,
+        delimiter=config.input_delimiter,
+        workers=config.loader_workers,
+        shard=shard,
+        shards=config.shards,
+    )
+    if config.chunksize:
+        source_loader.check()
+    else:
+        source_loader.load()
+    # the connections of the shard share the search path of the run
+    engine = create_engine(
+        url,
+        connect_args={"options": "-csearch_path=" + search_path.replace(" ", "\\ ")},
+    )
+    try:
+        with engine.connect() as cnxn:
+            ctxt = ETLContext(
+                config,
+                cnxn=cnxn,
+                sources=source_loader.data,
+                logger=logger,
+                source_loader=source_loader,
+                shard=shard,
+            )
+            run_transformations(steps, ctxt)
+    finally:
+        engine.dispose()
+
+
+def run_sharded(steps: StepsDict, ctxt: ETLContext) -> None:
+    """Run the steps with the patients split over config.shards processes
+
+    The run creates the shared tables, the shards then load and transform
+    their patients into them at the same time, each on its own connection,
+    and the run merges what they added. The surrogate keys come from the
+    sequences of the tables, the era ids from an interleaved range per
+    shard, so the shards never collide.
+    """
+    config = ctxt.config
+    run_transformations({name: steps[name] for name in SETUP_STEPS}, ctxt)
+    with ctxt.transaction() as cnxn:
+        search_path = cnxn.execute(text("SHOW search_path")).scalar()
+    logger.info("Transforming the patients in %s shards", config.shards)
+    run_shards(
+        _run_shard,
+        config.shards,
+        config,
+        ctxt.cnxn.engine.url.render_as_string(hide_password=False),
+        search_path,
+        {name: steps[name] for name in SHARD_STEPS},
+    )
+    run_transformations(
+        {
+            **{name: steps[name] for name in MERGE_STEPS},
+            "merge_shards": shards.merge,
+        },
+        ctxt,
+    )
 
 
 def run_etl(
@@ -74,25 +533,42 @@ def run_etl(
 ) -> None:
     """Run the full ETL and all transformations"""
 
+    if config.shards > 1 and (config.incremental or config.checkpoint or config.resume):
+        raise ETLFatalErrorException(
+            "A sharded run cannot be incremental nor checkpointed"
+        )
+    if config.insert_partitions > 1 and (config.checkpoint or config.resume):
+        # the ranges commit apart from the run state of their step
+        raise ETLFatalErrorException(
+            "A run with partitioned inserts cannot be checkpointed"
+        )
     source_loader = CSVFileLoader(
         config.datadir,
         SOURCE_MODELS,
         delimiter=config.input_delimiter,
+        workers=config.loader_workers,
     )
     lookup_loader = CSVFileLoader(
         CSV_DIR,
         LOOKUP_MODELS,
         delimiter=config.lookup_delimiter,
+        workers=config.loader_workers,
     )
 
     lookup_loader.load()
-    source_loader.load()
+    if config.chunksize or config.shards > 1:
+        # the source files are streamed by create_source, or loaded by the
+        # shards
+        source_loader.check()
+    else:
+        source_loader.load()
     ctxt = ETLContext(
         config,
         cnxn=cnxn,
         lookups=lookup_loader.data,
         sources=source_loader.data,
         logger=logger,
+        source_loader=source_loader,
     )
 
     steps: StepsDict = {
@@ -102,10 +578,12 @@ def run_etl(
         "create_logger": create_logger_tables.transform,
         "create_source": create_source_tables.transform,
         "create_omop": create_omopcdm_tables.transform,
+        "patient_delta": patient_delta.transform,
         "cdm_source": cdm_source.transform,
         "location": location.transform,
         "person": person.transform,
         "visit_occurrence": visit_occurrence.transform,
+        "visit_lookup": visit_lookup.transform,
         "drug_exposure": drug_exposure.transform,
         "condition": condition.transform,
         "procedure": procedure.transform,
@@ -114,10 +592,30 @@ def run_etl(
         "observation_period": observation_period.transform,
         "condition_era": condition_era.transform,
         "drug_era": drug_era.transform,
+        "patient_state": patient_delta.store_state,
     }
 
+    if commits_per_step(config) and not config.publish_schema:
+        logger.warning(
+            "steps commit one by one, the OMOP CDM tables are visible while"
+            " the run is in progress; set publish_schema to publish atomically"
+        )
+    if config.incremental:
+        ctxt.inputs_digest = inputs_digest(steps, ctxt, lookup_loader)
+    checkpoints = None
+    if config.checkpoint or config.resume:
+        checkpoints = make_checkpoints(steps, ctxt, source_loader, lookup_loader)
+    else:
+        # the results of this run replace those of the checkpointed runs
+        with ctxt.transaction() as cnxn:
+            clear_run_state(cnxn)
+    with ctxt.transaction() as cnxn:
+        drop_staging_schemas(cnxn)
     etl_dur = time.time()
-    run_transformations(steps, ctxt)
+    if config.shards > 1:
+        run_sharded(steps, ctxt)
+    else:
+        run_transformations(steps, ctxt, checkpoints)
 
     summary = print_models_summary(
         ctxt,
@@ -139,5 +637,7 @@ def run_etl(
     )
 
     logger.info(summary)
+    if config.publish_schema:
+        publish(ctxt, steps, checkpoints)
     etl_dur = time.time() - etl_dur
     logger.info("ETL completed in %ss", etl_dur)
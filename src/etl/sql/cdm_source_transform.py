@@ -13,6 +13,8 @@ def get_transform_sql(config: ETLConf) -> str:
     source_release_date_formatted = try_parsing_date(config.source_release_date)
     etl_reference = get_cdm_etl_reference(config.cdm_etl_ref)
     return f"""
+DELETE FROM {str(CDMSource.__table__)};
+
 INSERT INTO {str(CDMSource.__table__)}
 (
     {CDMSource.cdm_source_name.key},
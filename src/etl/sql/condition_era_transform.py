@@ -90,114 +90,75 @@
 # CONDITION ERA
 # Note: Eras derived from CONDITION_OCCURRENCE table, using 30d gap
 from typing import Final
+
 from ..models.omopcdm54.registry import TARGET_SCHEMA
+from .era import era_intervals_sql, era_sql
+
+# the persons in the :person_ids array parameter
+PERSONS_FILTER: Final[str] = "\nWHERE co.PERSON_ID = ANY(:person_ids)"
+
 
-SQL: Final = f"""
-/****
-CONDITION ERA
-Note: Eras derived from CONDITION_OCCURRENCE table, using 30d gap
- ****/
-DROP TABLE IF EXISTS condition_era_phase_1;
-/* / */
-DROP TABLE IF EXISTS cteConditionTarget;
-/* / */
--- create base eras from the concepts found in condition_occurrence
-CREATE TEMP TABLE cteConditionTarget
-AS
+# create base eras from the concepts found in condition_occurrence
+def _condition_target(persons: bool = False) -> str:
+    return f"""(
 SELECT
 co.PERSON_ID
     ,co.condition_concept_id
     ,co.CONDITION_START_DATE
     ,COALESCE(co.CONDITION_END_DATE, (CONDITION_START_DATE + 1*INTERVAL'1 day')) AS CONDITION_END_DATE
 FROM
-{TARGET_SCHEMA}.CONDITION_OCCURRENCE co;
-/* / */
-DROP TABLE IF EXISTS cteCondEndDates;
-/* / */
-CREATE TEMP TABLE cteCondEndDates
-AS
-SELECT
-PERSON_ID
-    ,CONDITION_CONCEPT_ID
-    ,(EVENT_DATE + - 30*INTERVAL'1 day') AS END_DATE -- unpad the end date
-FROM
-(
-    SELECT E1.PERSON_ID
-        ,E1.CONDITION_CONCEPT_ID
-        ,E1.EVENT_DATE
-        ,COALESCE(E1.START_ORDINAL, MAX(E2.START_ORDINAL)) START_ORDINAL
-        ,E1.OVERALL_ORD
-    FROM (
-        SELECT PERSON_ID
-            ,CONDITION_CONCEPT_ID
-            ,EVENT_DATE
-            ,EVENT_TYPE
-            ,START_ORDINAL
-            ,ROW_NUMBER() OVER (
-                PARTITION BY PERSON_ID
-                ,CONDITION_CONCEPT_ID ORDER BY EVENT_DATE
-                    ,EVENT_TYPE
-                ) AS OVERALL_ORD -- this re-numbers the inner UNION so all rows are numbered ordered by the event date
-        FROM (
-            -- select the start dates, assigning a row number to each
-            SELECT PERSON_ID
-                ,CONDITION_CONCEPT_ID
-                ,CONDITION_START_DATE AS EVENT_DATE
-                ,- 1 AS EVENT_TYPE
-                ,ROW_NUMBER() OVER (
-                    PARTITION BY PERSON_ID
-                    ,CONDITION_CONCEPT_ID ORDER BY CONDITION_START_DATE
-                    ) AS START_ORDINAL
-            FROM cteConditionTarget
-            UNION ALL
-            -- pad the end dates by 30 to allow a grace period for overlapping ranges.
-            SELECT PERSON_ID
-                ,CONDITION_CONCEPT_ID
-                ,(CONDITION_END_DATE + 30*INTERVAL'1 day')
-                ,1 AS EVENT_TYPE
-                ,NULL
-            FROM cteConditionTarget
-            ) RAWDATA
-        ) E1
-    INNER JOIN (
-        SELECT PERSON_ID
-            ,CONDITION_CONCEPT_ID
-            ,CONDITION_START_DATE AS EVENT_DATE
-            ,ROW_NUMBER() OVER (
-                PARTITION BY PERSON_ID
-                ,CONDITION_CONCEPT_ID ORDER BY CONDITION_START_DATE
-                ) AS START_ORDINAL
-        FROM cteConditionTarget
-        ) E2 ON E1.PERSON_ID = E2.PERSON_ID
-        AND E1.CONDITION_CONCEPT_ID = E2.CONDITION_CONCEPT_ID
-        AND E2.EVENT_DATE <= E1.EVENT_DATE
-    GROUP BY E1.PERSON_ID
-        ,E1.CONDITION_CONCEPT_ID
-        ,E1.EVENT_DATE
-        ,E1.START_ORDINAL
-        ,E1.OVERALL_ORD
-    ) E
-WHERE (2 * E.START_ORDINAL) - E.OVERALL_ORD = 0;
-/* / */
-DROP TABLE IF EXISTS cteConditionEnds;
-/* / */
-CREATE TEMP TABLE cteConditionEnds
-AS
-SELECT
-c.PERSON_ID
-    ,c.CONDITION_CONCEPT_ID
-    ,c.CONDITION_START_DATE
-    ,MIN(e.END_DATE) AS ERA_END_DATE
-FROM
-cteConditionTarget c
-INNER JOIN cteCondEndDates e ON c.PERSON_ID = e.PERSON_ID
-    AND c.CONDITION_CONCEPT_ID = e.CONDITION_CONCEPT_ID
-    AND e.END_DATE >= c.CONDITION_START_DATE
-GROUP BY c.PERSON_ID
-    ,c.CONDITION_CONCEPT_ID
-    ,c.CONDITION_START_DATE;
-/* / */
-DELETE from {TARGET_SCHEMA}.condition_era;
+{TARGET_SCHEMA}.CONDITION_OCCURRENCE co{PERSONS_FILTER if persons else ""}
+) co"""
+
+
+CONDITION_TARGET: Final[str] = _condition_target()
+
+CONDITION_ERAS: Final[str] = era_sql(
+    CONDITION_TARGET,
+    keys=["PERSON_ID", "CONDITION_CONCEPT_ID"],
+    start="CONDITION_START_DATE",
+    end="CONDITION_END_DATE",
+)
+
+# the intervals read by the numpy era engine
+CONDITION_INTERVALS: Final[str] = era_intervals_sql(
+    CONDITION_TARGET,
+    keys=["PERSON_ID", "CONDITION_CONCEPT_ID"],
+    start="CONDITION_START_DATE",
+    end="CONDITION_END_DATE",
+)
+CONDITION_INTERVALS_PERSONS: Final[str] = era_intervals_sql(
+    _condition_target(persons=True),
+    keys=["PERSON_ID", "CONDITION_CONCEPT_ID"],
+    start="CONDITION_START_DATE",
+    end="CONDITION_END_DATE",
+)
+
+
+def _condition_era_sql(persons: bool = False) -> str:
+    """Replace the condition eras
+
+    With persons only the eras of the persons in the :person_ids array
+    parameter are replaced, numbered from :first_id in steps of :id_stride.
+    """
+    if persons:
+        delete = f"""DELETE from {TARGET_SCHEMA}.condition_era
+WHERE person_id = ANY(:person_ids);"""
+        first_id = ":first_id - :id_stride + :id_stride * "
+        count = f"""SELECT COUNT (*) FROM {TARGET_SCHEMA}.condition_era
+WHERE person_id = ANY(:person_ids);"""
+    else:
+        delete = f"DELETE from {TARGET_SCHEMA}.condition_era;"
+        first_id = ""
+        count = f"SELECT COUNT (*) FROM {TARGET_SCHEMA}.condition_era;"
+    eras = era_sql(
+        _condition_target(persons),
+        keys=["PERSON_ID", "CONDITION_CONCEPT_ID"],
+        start="CONDITION_START_DATE",
+        end="CONDITION_END_DATE",
+    )
+    return f"""
+{delete}
 INSERT INTO {TARGET_SCHEMA}.condition_era (
     condition_era_id
     ,person_id
@@ -206,17 +167,21 @@ INSERT INTO {TARGET_SCHEMA}.condition_era (
     ,condition_era_end_date
     ,condition_occurrence_count
     )
-SELECT row_number() OVER (
+SELECT {first_id}row_number() OVER (
         ORDER BY person_id
         ) AS condition_era_id
     ,person_id
     ,CONDITION_CONCEPT_ID
-    ,min(CONDITION_START_DATE) AS CONDITION_ERA_START_DATE
-    ,ERA_END_DATE AS CONDITION_ERA_END_DATE
-    ,COUNT(*) AS CONDITION_OCCURRENCE_COUNT
-FROM cteConditionEnds
+    ,min(era_start) AS CONDITION_ERA_START_DATE
+    ,era_end_date AS CONDITION_ERA_END_DATE
+    ,COUNT(DISTINCT era_start) AS CONDITION_OCCURRENCE_COUNT
+FROM ({eras}) e
 GROUP BY person_id
     ,CONDITION_CONCEPT_ID
-    ,ERA_END_DATE;
-SELECT COUNT (*) FROM {TARGET_SCHEMA}.condition_era;
+    ,era_end_date;
+{count}
 """
+
+
+SQL: Final[str] = _condition_era_sql()
+SQL_PERSONS: Final[str] = _condition_era_sql(persons=True)
@@ -9,42 +9,54 @@ from ..common import (
     CONCEPT_ID_REGISTRY,
     DEFAULT_DATE,
 )
-from ..models.lookupmodels import ConceptLookup
-from ..models.omopcdm54.clinical import (
-    ConditionOccurrence,
-    Person,
-    VisitOccurrence,
-)
-from ..models.source import DiseaseHistory, Relapses
+from ..models.lookupmodels import ConceptLookup, VisitLookup
+from ..models.omopcdm54.clinical import ConditionOccurrence, Person
+from ..models.source import DiseaseHistory, Patient, Relapses
+from .unpivot import UnpivotRow, unpivot_sql
+from .visit_lookup import visit_join
+
+
+def _staged_person(person_id: str) -> str:
+    """The condition keeping the persons of the staged patients, those of
+    the shard in a sharded run"""
+    return f"""EXISTS (
+    SELECT 1 FROM {str(Patient.__table__)} s
+    WHERE s.{Patient.patient_id.key} = {person_id}
+)"""
 
+
+# the rows are inserted in visit order as the removal of duplicates keeps
+# the first one inserted, only the rows of the staged patients are looked at
 SQL: Final[str] = f"""
 WITH stacked_table AS (
-    SELECT
-        {DiseaseHistory.patient_id.key},
-        {DiseaseHistory.date_diagnosis.key} AS start_date,
-        NULL AS condition,
-        NULL AS stop_reason,
-        {DiseaseHistory.date_visit.key} AS date_visit,
-        'date_diagnosis' AS table
-    FROM {str(DiseaseHistory.__table__)}
-    WHERE {DiseaseHistory.date_diagnosis.key} IS NOT NULL
-    UNION
-    SELECT
-        {DiseaseHistory.patient_id.key},
-        {DiseaseHistory.date_visit.key} AS start_date,
-        {DiseaseHistory.ms_course.key} AS condition,
-        NULL AS stop_reason,
-        {DiseaseHistory.date_visit.key} AS date_visit,
-        'ms_course' AS table
-    FROM {str(DiseaseHistory.__table__)}
-    WHERE {DiseaseHistory.date_diagnosis.key} IS NOT NULL AND {DiseaseHistory.ms_course.key} IS NOT NULL
-    UNION
-    SELECT
+    {unpivot_sql(
+        source=str(DiseaseHistory.__table__),
+        keys=[DiseaseHistory.patient_id.key, DiseaseHistory.date_visit.key],
+        columns=["start_date", "condition", "stop_reason"],
+        rows=[
+            UnpivotRow(
+                "date_diagnosis",
+                (DiseaseHistory.date_diagnosis.key, "NULL", "NULL"),
+            ),
+            UnpivotRow(
+                "ms_course",
+                (
+                    DiseaseHistory.date_visit.key,
+                    DiseaseHistory.ms_course.key,
+                    "NULL",
+                ),
+                f"{DiseaseHistory.date_diagnosis.key} IS NOT NULL"
+                f" AND {DiseaseHistory.ms_course.key} IS NOT NULL",
+            ),
+        ],
+    )}
+    UNION ALL
+    SELECT DISTINCT
         {Relapses.patient_id.key},
+        {Relapses.date_visit.key} AS date_visit,
         {Relapses.date_relapse.key} AS start_date,
         {Relapses.relapse.key} AS condition,
         {Relapses.relapse_recovery.key} AS stop_reason,
-        {Relapses.date_visit.key} AS date_visit,
         'relapses' AS table
     FROM {str(Relapses.__table__)}
     WHERE {Relapses.relapse.key} = 'yes'
@@ -77,7 +89,7 @@ SELECT
         ELSE {CONCEPT_ID_NOT_KNOWN}
     END),
     (CASE
-        WHEN cast_date(s.start_date::VARCHAR) IS NOT NULL THEN s.start_date::DATE
+        WHEN s.start_date IS NOT NULL THEN s.start_date::DATE
         ELSE '{DEFAULT_DATE}'::DATE
     END),
     NULL::DATE,
@@ -89,7 +101,7 @@ SELECT
         WHEN s.stop_reason = 'compl_recovery' THEN s.stop_reason
     END),
     NULL::INTEGER,
-    v.{VisitOccurrence.visit_occurrence_id.key},
+    v.{VisitLookup.visit_occurrence_id.key},
     NULL::INTEGER,
     (CASE
         WHEN s.table = 'relapses' THEN 'relapse_'||s.condition
@@ -101,11 +113,10 @@ SELECT
 FROM stacked_table s
 INNER JOIN {str(Person.__table__)} p
     ON s.patient_id = p.{Person.person_id.key}
-LEFT JOIN {str(VisitOccurrence.__table__)} v
-    ON s.patient_id = v.{VisitOccurrence.person_id.key}
-        AND s.date_visit = v.{VisitOccurrence.visit_start_date.key}
+{visit_join("v", "s.patient_id", "s.date_visit")}
 LEFT JOIN {str(ConceptLookup.__table__)} c
-    ON 'ms_course_'||s.condition = c.{ConceptLookup.concept_string.key}
+    ON 'ms_course_'||s.condition = c.{ConceptLookup.concept_key.key}
+ORDER BY s.patient_id, s.start_date, s.date_visit
 ;
 
 DELETE
@@ -115,7 +126,8 @@ FROM {str(ConditionOccurrence.__table__)} a USING (
         {ConditionOccurrence.person_id.key},
         {ConditionOccurrence.condition_start_date.key},
         {ConditionOccurrence.condition_concept_id.key}
-    FROM {str(ConditionOccurrence.__table__)}
+    FROM {str(ConditionOccurrence.__table__)} o
+    WHERE {_staged_person(f"o.{ConditionOccurrence.person_id.key}")}
     GROUP BY
         {ConditionOccurrence.person_id.key},
         {ConditionOccurrence.condition_start_date.key},
@@ -124,7 +136,8 @@ FROM {str(ConditionOccurrence.__table__)} a USING (
 ) b
 WHERE a.{ConditionOccurrence.person_id.key} = b.{ConditionOccurrence.person_id.key}
     AND a.{ConditionOccurrence.condition_concept_id.key} = b.{ConditionOccurrence.condition_concept_id.key}
-    AND a.ctid <> b.ctid;
+    AND a.ctid <> b.ctid
+    AND {_staged_person(f"a.{ConditionOccurrence.person_id.key}")};
 
 SELECT COUNT(*)
 FROM {str(ConditionOccurrence.__table__)};
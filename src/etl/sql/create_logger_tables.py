@@ -12,12 +12,14 @@ from ..models.modelutils import (
 MODELS: Final[List] = [ETLLogger]
 
 
-def _ddl_sql() -> str:
+def _ddl_sql(drop: bool = True) -> str:
     statements = [
-        drop_tables_sql(MODELS, cascade=True),
+        drop_tables_sql(MODELS, cascade=True) if drop else "",
         create_tables_sql(MODELS, dialect=DIALECT_POSTGRES),
     ]
     return " ".join(statements)
 
 
 SQL: Final[str] = _ddl_sql()
+# the tables updated by an incremental run, created when missing
+SQL_CREATE: Final[str] = _ddl_sql(drop=False)
@@ -5,6 +5,7 @@ from typing import Final, List
 from ..models.lookupmodels import CodeLogger, ConceptLookup
 from ..models.modelutils import (
     DIALECT_POSTGRES,
+    analyze_tables_sql,
     create_tables_sql,
     drop_tables_sql,
     set_constraints_sql,
@@ -19,3 +20,5 @@ _SQL_ENTRIES: Final[List[str]] = [
 ]
 
 SQL = " ".join(_SQL_ENTRIES).strip().replace("\n", " ")
+
+SQL_ANALYZE: Final[str] = analyze_tables_sql([CodeLogger, ConceptLookup])
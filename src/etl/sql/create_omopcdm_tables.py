@@ -54,9 +54,9 @@ MODELS: Final[List] = [
 ]
 
 
-def _ddl_sql() -> str:
+def _ddl_sql(drop: bool = True) -> str:
     statements = [
-        drop_tables_sql(MODELS, cascade=True),
+        drop_tables_sql(MODELS, cascade=True) if drop else "",
         create_tables_sql(MODELS, dialect=DIALECT_POSTGRES),
         set_indexes_sql(MODELS, dialect=DIALECT_POSTGRES),
         set_constraints_sql(MODELS, dialect=DIALECT_POSTGRES),
@@ -65,3 +65,5 @@ def _ddl_sql() -> str:
 
 
 SQL: Final[str] = _ddl_sql()
+# the tables updated by an incremental run, created when missing
+SQL_CREATE: Final[str] = _ddl_sql(drop=False)
@@ -4,6 +4,7 @@ from typing import Final, List
 
 from ..models.modelutils import (
     DIALECT_POSTGRES,
+    analyze_tables_sql,
     create_tables_sql,
     drop_tables_sql,
 )
@@ -41,3 +42,14 @@ _SQL_ENTRIES: Final[List[str]] = [
 ]
 
 SQL = " ".join(_SQL_ENTRIES).strip().replace("\n", " ")
+
+# bulk load mode: the staging tables are rebuilt every run, skip their WAL
+_SQL_BULK_ENTRIES: Final[List[str]] = [
+    SQL_CREATE_SCHEMA,
+    drop_tables_sql(MODELS),
+    create_tables_sql(MODELS, dialect=DIALECT_POSTGRES, unlogged=True),
+]
+
+SQL_BULK = " ".join(_SQL_BULK_ENTRIES).strip().replace("\n", " ")
+
+SQL_ANALYZE: Final[str] = analyze_tables_sql(MODELS)
@@ -48,133 +48,107 @@ Note: Eras derived from DRUG_EXPOSURE table, using 30d gap
 """
 
 from typing import Final
+
+from ..common import ERA_GAP_DAYS
+from ..models.lookupmodels import DrugIngredientMap
 from ..models.omopcdm54.registry import TARGET_SCHEMA
+from .era import era_intervals_sql, era_sql
+
+# the persons in the :person_ids array parameter
+PERSONS_FILTER: Final[str] = "\nWHERE d.PERSON_ID = ANY(:person_ids)"
+
 
-SQL: Final[str] = f"""DROP TABLE IF EXISTS cteDrugTarget;
--- Normalize DRUG_EXPOSURE_END_DATE to either the existing drug exposure end date,
--- or add days supply, or add 1 day to the start date
-CREATE TEMP TABLE cteDrugTarget
-AS
+# Normalize DRUG_EXPOSURE_END_DATE to either the existing drug exposure end
+# date, or add days supply, or add 1 day to the start date
+def _drug_target(persons: bool = False) -> str:
+    return f"""(
 SELECT
-d.DRUG_EXPOSURE_ID
-    ,d.PERSON_ID
-    ,c.CONCEPT_ID
+d.PERSON_ID
     ,d.DRUG_TYPE_CONCEPT_ID
     ,DRUG_EXPOSURE_START_DATE
     ,COALESCE(DRUG_EXPOSURE_END_DATE, (DRUG_EXPOSURE_START_DATE + DAYS_SUPPLY*INTERVAL'1 day')
     ,(DRUG_EXPOSURE_START_DATE + 1*INTERVAL'1 day')) AS DRUG_EXPOSURE_END_DATE
-    ,c.CONCEPT_ID AS INGREDIENT_CONCEPT_ID
+    ,m.{DrugIngredientMap.ingredient_concept_id.key} AS INGREDIENT_CONCEPT_ID
 FROM
 {TARGET_SCHEMA}.DRUG_EXPOSURE d
-INNER JOIN {TARGET_SCHEMA}.CONCEPT_ANCESTOR ca ON ca.DESCENDANT_CONCEPT_ID = d.DRUG_CONCEPT_ID
-INNER JOIN {TARGET_SCHEMA}.CONCEPT c ON ca.ANCESTOR_CONCEPT_ID = c.CONCEPT_ID
-WHERE c.VOCABULARY_ID = 'RxNorm'
-    AND c.CONCEPT_CLASS_ID = 'Ingredient';
-/* / */
-DROP TABLE IF EXISTS cteEndDates;
-/* / */
-CREATE TEMP TABLE cteEndDates
-AS
-SELECT
-PERSON_ID
-    ,INGREDIENT_CONCEPT_ID
-    ,(EVENT_DATE + - 30*INTERVAL'1 day') AS END_DATE -- unpad the end date
-FROM
-(
-    SELECT E1.PERSON_ID
-        ,E1.INGREDIENT_CONCEPT_ID
-        ,E1.EVENT_DATE
-        ,COALESCE(E1.START_ORDINAL, MAX(E2.START_ORDINAL)) START_ORDINAL
-        ,E1.OVERALL_ORD
-    FROM (
-        SELECT PERSON_ID
-            ,INGREDIENT_CONCEPT_ID
-            ,EVENT_DATE
-            ,EVENT_TYPE
-            ,START_ORDINAL
-            ,ROW_NUMBER() OVER (
-                PARTITION BY PERSON_ID
-                ,INGREDIENT_CONCEPT_ID ORDER BY EVENT_DATE
-                    ,EVENT_TYPE
-                ) AS OVERALL_ORD -- this re-numbers the inner UNION so all rows are numbered ordered by the event date
-        FROM (
-            -- select the start dates, assigning a row number to each
-            SELECT PERSON_ID
-                ,INGREDIENT_CONCEPT_ID
-                ,DRUG_EXPOSURE_START_DATE AS EVENT_DATE
-                ,0 AS EVENT_TYPE
-                ,ROW_NUMBER() OVER (
-                    PARTITION BY PERSON_ID
-                    ,INGREDIENT_CONCEPT_ID ORDER BY DRUG_EXPOSURE_START_DATE
-                    ) AS START_ORDINAL
-            FROM cteDrugTarget
-            UNION ALL
-            -- add the end dates with NULL as the row number, padding the end dates by 30
-            -- to allow a grace period for overlapping ranges.
-            SELECT PERSON_ID
-                ,INGREDIENT_CONCEPT_ID
-                ,(DRUG_EXPOSURE_END_DATE + 30*INTERVAL'1 day')
-                ,1 AS EVENT_TYPE
-                ,NULL
-            FROM cteDrugTarget
-            ) RAWDATA
-        ) E1
-    INNER JOIN (
-        SELECT PERSON_ID
-            ,INGREDIENT_CONCEPT_ID
-            ,DRUG_EXPOSURE_START_DATE AS EVENT_DATE
-            ,ROW_NUMBER() OVER (
-                PARTITION BY PERSON_ID
-                ,INGREDIENT_CONCEPT_ID ORDER BY DRUG_EXPOSURE_START_DATE
-                ) AS START_ORDINAL
-        FROM cteDrugTarget
-        ) E2 ON E1.PERSON_ID = E2.PERSON_ID
-        AND E1.INGREDIENT_CONCEPT_ID = E2.INGREDIENT_CONCEPT_ID
-        AND E2.EVENT_DATE <= E1.EVENT_DATE
-    GROUP BY E1.PERSON_ID
-        ,E1.INGREDIENT_CONCEPT_ID
-        ,E1.EVENT_DATE
-        ,E1.START_ORDINAL
-        ,E1.OVERALL_ORD
-    ) E
-WHERE 2 * E.START_ORDINAL - E.OVERALL_ORD = 0;
-/* / */
-DROP TABLE IF EXISTS cteDrugExpEnds;
-/* / */
-CREATE TEMP TABLE cteDrugExpEnds
-AS
-SELECT
-d.PERSON_ID
-    ,d.INGREDIENT_CONCEPT_ID
-    ,d.DRUG_TYPE_CONCEPT_ID
-    ,d.DRUG_EXPOSURE_START_DATE
-    ,MIN(e.END_DATE) AS ERA_END_DATE
-FROM
-cteDrugTarget d
-INNER JOIN cteEndDates e ON d.PERSON_ID = e.PERSON_ID
-    AND d.INGREDIENT_CONCEPT_ID = e.INGREDIENT_CONCEPT_ID
-    AND e.END_DATE >= d.DRUG_EXPOSURE_START_DATE
-GROUP BY d.PERSON_ID
-    ,d.INGREDIENT_CONCEPT_ID
-    ,d.DRUG_TYPE_CONCEPT_ID
-    ,d.DRUG_EXPOSURE_START_DATE;
-/* / */
-DELETE FROM {TARGET_SCHEMA}.drug_era;
+INNER JOIN {str(DrugIngredientMap.__table__)} m
+    ON m.{DrugIngredientMap.drug_concept_id.key} = d.DRUG_CONCEPT_ID{PERSONS_FILTER if persons else ""}
+) d"""
+
+
+DRUG_TARGET: Final[str] = _drug_target()
+
+DRUG_ERAS: Final[str] = era_sql(
+    DRUG_TARGET,
+    keys=["PERSON_ID", "INGREDIENT_CONCEPT_ID"],
+    start="DRUG_EXPOSURE_START_DATE",
+    end="DRUG_EXPOSURE_END_DATE",
+    columns=["DRUG_TYPE_CONCEPT_ID"],
+)
+
+# the intervals read by the numpy era engine
+DRUG_INTERVALS: Final[str] = era_intervals_sql(
+    DRUG_TARGET,
+    keys=["PERSON_ID", "INGREDIENT_CONCEPT_ID"],
+    start="DRUG_EXPOSURE_START_DATE",
+    end="DRUG_EXPOSURE_END_DATE",
+    columns=["DRUG_TYPE_CONCEPT_ID"],
+)
+DRUG_INTERVALS_PERSONS: Final[str] = era_intervals_sql(
+    _drug_target(persons=True),
+    keys=["PERSON_ID", "INGREDIENT_CONCEPT_ID"],
+    start="DRUG_EXPOSURE_START_DATE",
+    end="DRUG_EXPOSURE_END_DATE",
+    columns=["DRUG_TYPE_CONCEPT_ID"],
+)
+
+
+def _drug_era_sql(persons: bool = False) -> str:
+    """Replace the drug eras
+
+    The eras are built over all drug types, only the final rows are split
+    by type, every exposure start counting once. With persons only the eras
+    of the persons in the :person_ids array parameter are replaced,
+    numbered from :first_id in steps of :id_stride.
+    """
+    if persons:
+        delete = f"""DELETE FROM {TARGET_SCHEMA}.drug_era
+WHERE person_id = ANY(:person_ids);"""
+        first_id = ":first_id - :id_stride + :id_stride * "
+        count = f"""SELECT COUNT (*) FROM {TARGET_SCHEMA}.drug_era
+WHERE person_id = ANY(:person_ids);"""
+    else:
+        delete = f"DELETE FROM {TARGET_SCHEMA}.drug_era;"
+        first_id = ""
+        count = f"SELECT COUNT (*) FROM {TARGET_SCHEMA}.drug_era;"
+    eras = era_sql(
+        _drug_target(persons),
+        keys=["PERSON_ID", "INGREDIENT_CONCEPT_ID"],
+        start="DRUG_EXPOSURE_START_DATE",
+        end="DRUG_EXPOSURE_END_DATE",
+        columns=["DRUG_TYPE_CONCEPT_ID"],
+    )
+    return f"""
+{delete}
 INSERT INTO {TARGET_SCHEMA}.drug_era
-SELECT row_number() OVER (
+SELECT {first_id}row_number() OVER (
         ORDER BY person_id
         ) AS drug_era_id
     ,person_id
     ,INGREDIENT_CONCEPT_ID
-    ,min(DRUG_EXPOSURE_START_DATE) AS drug_era_start_date
-    ,ERA_END_DATE
-    ,COUNT(*) AS DRUG_EXPOSURE_COUNT
-    ,30 AS gap_days
-FROM cteDrugExpEnds
+    ,min(era_start) AS drug_era_start_date
+    ,era_end_date
+    ,COUNT(DISTINCT era_start) AS DRUG_EXPOSURE_COUNT
+    ,{ERA_GAP_DAYS} AS gap_days
+FROM ({eras}) e
 GROUP BY person_id
     ,INGREDIENT_CONCEPT_ID
     ,drug_type_concept_id
-    ,ERA_END_DATE
+    ,era_end_date
 ;
-SELECT COUNT (*) FROM {TARGET_SCHEMA}.drug_era;
+{count}
 """
+
+
+SQL: Final[str] = _drug_era_sql()
+SQL_PERSONS: Final[str] = _drug_era_sql(persons=True)
@@ -3,9 +3,10 @@
 from typing import Final
 
 from ..common import CONCEPT_ID_NOT_KNOWN, CONCEPT_ID_REGISTRY, DEFAULT_DATE
-from ..models.lookupmodels import ConceptLookup
-from ..models.omopcdm54.clinical import DrugExposure, Person, VisitOccurrence
+from ..models.lookupmodels import ConceptLookup, LookupFilter, VisitLookup
+from ..models.omopcdm54.clinical import DrugExposure, Person
 from ..models.source import Dmt
+from .visit_lookup import visit_join
 
 SQL: Final[str] = f"""
 INSERT INTO {str(DrugExposure.__table__)}
@@ -41,19 +42,17 @@ SELECT
         ELSE {CONCEPT_ID_NOT_KNOWN}
     END),
     (CASE
-        WHEN cast_date(d.{Dmt.dmt_start.key}::VARCHAR) IS NOT NULL THEN d.{Dmt.dmt_start.key}::DATE
+        WHEN d.{Dmt.dmt_start.key} IS NOT NULL THEN d.{Dmt.dmt_start.key}::DATE
         ELSE '{DEFAULT_DATE}'::DATE
     END),
     NULL::DATE,
     (CASE
-        WHEN d.{Dmt.dmt_stop.key} IS NOT NULL AND cast_date(d.{Dmt.dmt_stop.key}::VARCHAR)
-            IS NOT NULL THEN d.{Dmt.dmt_stop.key}::DATE
-        WHEN d.{Dmt.dmt_stop.key} IS NOT NULL AND cast_date(d.{Dmt.dmt_stop.key}::VARCHAR)
-            IS NULL THEN '{DEFAULT_DATE}'::DATE
+        WHEN d.{Dmt.dmt_stop.key} IS NOT NULL THEN d.{Dmt.dmt_stop.key}::DATE
+        WHEN d.{Dmt.dmt_stop_valid.key} IS FALSE THEN '{DEFAULT_DATE}'::DATE
         WHEN lower(d.{Dmt.dmt_status.key}) = 'yes' AND d.{Dmt.dmt_stop.key} IS NULL
-            AND cast_date(d.{Dmt.date_visit.key}::VARCHAR) IS NOT NULL THEN d.{Dmt.date_visit.key}::DATE
+            AND d.{Dmt.date_visit.key} IS NOT NULL THEN d.{Dmt.date_visit.key}::DATE
         WHEN lower(d.{Dmt.dmt_status.key}) = 'yes' AND d.{Dmt.dmt_stop.key} IS NULL
-            AND cast_date(d.{Dmt.date_visit.key}::VARCHAR) IS NULL THEN '{DEFAULT_DATE}'::DATE
+            AND d.{Dmt.date_visit.key} IS NULL THEN '{DEFAULT_DATE}'::DATE
         WHEN lower(d.{Dmt.dmt_status.key}) = 'no' AND d.{Dmt.dmt_stop.key} IS NULL
             THEN '{DEFAULT_DATE}'::DATE
     END),
@@ -74,7 +73,7 @@ SELECT
     NULL::VARCHAR,
     NULL::INTEGER,
     NULL::INTEGER,
-    v.{VisitOccurrence.visit_occurrence_id.key},
+    v.{VisitLookup.visit_occurrence_id.key},
     NULL::INTEGER,
     NULL::VARCHAR,
     NULL::INTEGER
@@ -82,18 +81,17 @@ FROM {str(Dmt.__table__)} d
 INNER JOIN {str(Person.__table__)} p
     ON p.{Person.person_id.key} = d.{Dmt.patient_id.key}
 LEFT JOIN {str(ConceptLookup.__table__)} c_type
-    ON ('dmt_type_'||d.{Dmt.dmt_type.key}=LOWER(c_type.{ConceptLookup.concept_string.key})
-        AND LOWER(c_type.{ConceptLookup.filter.key})='drug_exposure')
+    ON ('dmt_type_'||d.{Dmt.dmt_type.key} = c_type.{ConceptLookup.concept_key.key}
+        AND c_type.{ConceptLookup.filter_key.key} = '{LookupFilter.DRUG_EXPOSURE.value}')
 LEFT JOIN {str(ConceptLookup.__table__)} c_stop
-    ON ('dmt_stop_reas_'||d.{Dmt.dmt_stop_reas.key}=LOWER(c_stop.{ConceptLookup.concept_string.key})
-        AND LOWER(c_stop.{ConceptLookup.filter.key})='stop_reason')
-INNER JOIN {str(VisitOccurrence.__table__)} v
-    ON d.{Dmt.patient_id.key} = v.{VisitOccurrence.person_id.key}
-        AND d.{Dmt.date_visit.key} = v.{VisitOccurrence.visit_start_date.key}
+    ON ('dmt_stop_reas_'||d.{Dmt.dmt_stop_reas.key} = c_stop.{ConceptLookup.concept_key.key}
+        AND c_stop.{ConceptLookup.filter_key.key} = '{LookupFilter.STOP_REASON.value}')
+{visit_join("v", f"d.{Dmt.patient_id.key}", f"d.{Dmt.date_visit.key}", "INNER")}
 WHERE d.{Dmt.dmt_type.key} IS NOT NULL
     AND d.{Dmt.dmt_type.key} != 'ahsct'
-    AND d.{Dmt.dmt_stop.key} IS NOT NULL
-        OR (d.{Dmt.dmt_stop.key} IS NULL AND d.{Dmt.dmt_status.key} in ('yes', 'no'))
+    AND (d.{Dmt.dmt_stop.key} IS NOT NULL OR d.{Dmt.dmt_stop_valid.key} IS FALSE)
+        OR (d.{Dmt.dmt_stop.key} IS NULL AND d.{Dmt.dmt_stop_valid.key} IS NOT FALSE
+            AND d.{Dmt.dmt_status.key} in ('yes', 'no'))
 ;
 
 SELECT COUNT(*)
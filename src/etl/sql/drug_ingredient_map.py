@@ -0,0 +1,50 @@
+"""SQL query string definition for the drug to ingredient map"""
+
+from typing import Final
+
+from ..models.lookupmodels import DrugIngredientMap
+from ..models.modelutils import (
+    DIALECT_POSTGRES,
+    analyze_tables_sql,
+    create_tables_sql,
+    drop_tables_sql,
+)
+from ..models.omopcdm54.vocabulary import Concept, ConceptAncestor, Vocabulary
+
+SQL_VOCABULARY_VERSION: Final[str] = f"""
+SELECT {Vocabulary.vocabulary_version.key}
+FROM {str(Vocabulary.__table__)}
+WHERE {Vocabulary.vocabulary_id.key} = 'None'
+""".strip().replace("\n", " ")
+
+SQL_MAPPED_VERSION: Final[str] = f"""
+SELECT {DrugIngredientMap.vocabulary_version.key}
+FROM {str(DrugIngredientMap.__table__)}
+LIMIT 1
+""".strip().replace("\n", " ")
+
+SQL: Final[str] = f"""
+{drop_tables_sql([DrugIngredientMap])}
+{create_tables_sql([DrugIngredientMap], dialect=DIALECT_POSTGRES)}
+
+INSERT INTO {str(DrugIngredientMap.__table__)}
+(
+    {DrugIngredientMap.drug_concept_id.key},
+    {DrugIngredientMap.ingredient_concept_id.key},
+    {DrugIngredientMap.vocabulary_version.key}
+)
+SELECT DISTINCT
+    ca.{ConceptAncestor.descendant_concept_id.key},
+    c.{Concept.concept_id.key},
+    ({SQL_VOCABULARY_VERSION})
+FROM {str(ConceptAncestor.__table__)} ca
+INNER JOIN {str(Concept.__table__)} c
+    ON ca.{ConceptAncestor.ancestor_concept_id.key} = c.{Concept.concept_id.key}
+WHERE c.{Concept.vocabulary_id.key} = 'RxNorm'
+    AND c.{Concept.concept_class_id.key} = 'Ingredient'
+;
+
+{analyze_tables_sql([DrugIngredientMap])}
+
+SELECT COUNT(*) FROM {str(DrugIngredientMap.__table__)};
+""".strip().replace("\n", " ")
@@ -0,0 +1,99 @@
+"""SQL builder assigning the intervals of a table to eras"""
+
+from typing import Sequence
+
+from ..common import ERA_GAP_DAYS
+
+
+def era_sql(
+    source: str,
+    keys: Sequence[str],
+    start: str,
+    end: str,
+    columns: Sequence[str] = (),
+    gap_days: int = ERA_GAP_DAYS,
+) -> str:
+    """A SELECT giving every interval of source with the end of its era
+
+    Intervals of the same keys belong to one era while they are less than
+    gap_days apart. The result has the keys and columns of the interval,
+    its start as era_start and the end of its era as era_end_date.
+
+    This gives the eras of the OHDSI era scripts, whose end dates come from
+    joining every event to all earlier starts. Here the start and padded
+    end events are swept once in date order instead: an era ends where the
+    running count of starts equals the number of events seen, half of
+    them. Every interval then takes the first era end on or after its
+    start, a running minimum over the dates in reverse. Intervals without
+    one, which only happens when an interval ends before it starts, are
+    dropped as in the OHDSI scripts. Equal dates are numbered in a single
+    sort, so unlike there the eras never depend on how ties are ordered.
+    """
+    key_list = ", ".join(keys)
+    gap = f"{gap_days}*INTERVAL'1 day'"
+    carried = "".join(f", {column}" for column in columns)
+    no_carried = "".join(f", NULL AS {column}" for column in columns)
+    return f"""
+    WITH era_interval AS (
+        SELECT {key_list}{carried}, {start} AS era_start, {end} AS era_stop
+        FROM {source}
+    ),
+    era_event AS (
+        SELECT {key_list}, era_start AS event_date, 0 AS event_type
+        FROM era_interval
+        UNION ALL
+        SELECT {key_list}, era_stop + {gap}, 1
+        FROM era_interval
+    ),
+    era_sweep AS (
+        SELECT {key_list}, event_date,
+            SUM(1 - event_type) OVER w AS start_count,
+            ROW_NUMBER() OVER w AS event_count
+        FROM era_event
+        WINDOW w AS (
+            PARTITION BY {key_list} ORDER BY event_date, event_type
+            ROWS UNBOUNDED PRECEDING
+        )
+    ),
+    era_assigned AS (
+        SELECT {key_list}{carried}, era_start,
+            MIN(era_end_date) OVER (
+                PARTITION BY {key_list} ORDER BY era_day, is_end
+                ROWS BETWEEN CURRENT ROW AND UNBOUNDED FOLLOWING
+            ) AS era_end_date,
+            is_end
+        FROM (
+            SELECT {key_list}{carried}, era_start, era_start AS era_day,
+                NULL AS era_end_date, 0 AS is_end
+            FROM era_interval
+            UNION ALL
+            SELECT {key_list}{no_carried}, NULL, event_date - {gap},
+                event_date - {gap}, 1
+            FROM era_sweep
+            WHERE 2 * start_count = event_count
+        ) i
+    )
+    SELECT {key_list}{carried}, era_start, era_end_date
+    FROM era_assigned
+    WHERE is_end = 0 AND era_end_date IS NOT NULL
+    """
+
+
+def era_intervals_sql(
+    source: str,
+    keys: Sequence[str],
+    start: str,
+    end: str,
+    columns: Sequence[str] = (),
+) -> str:
+    """A SELECT giving the intervals of source for etl.util.era
+
+    The keys and columns are followed by the start and end of the interval
+    as day numbers, era_start and era_stop.
+    """
+    return f"""
+    SELECT {", ".join([*keys, *columns])},
+        ({start})::DATE - DATE '1970-01-01' AS era_start,
+        ({end})::DATE - DATE '1970-01-01' AS era_stop
+    FROM {source}
+    """
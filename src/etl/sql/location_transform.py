@@ -3,10 +3,12 @@
 from typing import Final
 
 from ..common import CONCEPT_ID_NOT_KNOWN
-from ..models.lookupmodels import ConceptLookup
+from ..models.lookupmodels import ConceptLookup, LookupFilter
 from ..models.omopcdm54.health_systems import Location
 from ..models.source import Patient
 
+# the residences already known keep their location, an incremental run adds
+# the ones of the rebuilt patients only
 SQL: Final[str] = f"""
 INSERT INTO {str(Location.__table__)}
 (
@@ -35,8 +37,13 @@ SELECT DISTINCT
     RIGHT({Patient.residence.key}, 2)
 FROM {str(Patient.__table__)} p
 LEFT JOIN {str(ConceptLookup.__table__)} c
-    ON LOWER(RIGHT(p.{Patient.residence.key}, 2)) = LOWER(c.{ConceptLookup.concept_string.key})
-         AND LOWER(c.{ConceptLookup.filter.key}) = 'location';
+    ON RIGHT(p.{Patient.residence.key}, 2) = c.{ConceptLookup.concept_key.key}
+         AND c.{ConceptLookup.filter_key.key} = '{LookupFilter.LOCATION.value}'
+WHERE NOT EXISTS (
+    SELECT 1 FROM {str(Location.__table__)} l
+    WHERE l.{Location.location_source_value.key}
+        IS NOT DISTINCT FROM p.{Patient.residence.key}
+);
 
 SELECT COUNT(*)
 FROM {str(Location.__table__)};
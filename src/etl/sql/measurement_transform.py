@@ -17,6 +17,8 @@ from ..common import (
 )
 from ..models.omopcdm54.clinical import Measurement, Observation, Person
 from ..models.source import DiseaseHistory, DiseaseStatus
+from .person_range import person_range
+from .unpivot import UnpivotRow, unpivot_sql
 
 
 # pylint: disable=too-many-arguments
@@ -66,7 +68,7 @@ SELECT
     p.{Person.person_id.key},
     {measurement_cid},
     (CASE
-        WHEN cast_date(s.{measurement_date}::VARCHAR) IS NOT NULL THEN s.{measurement_date}::DATE
+        WHEN s.{measurement_date} IS NOT NULL THEN s.{measurement_date}::DATE
         ELSE '{DEFAULT_DATE}'::DATE
     END),
     NULL::DATE,
@@ -91,11 +93,10 @@ SELECT
 FROM {source_table} s
 INNER JOIN {str(Person.__table__)} p
     ON s.patient_id = p.{Person.person_id.key}
+        AND {person_range(f"p.{Person.person_id.key}")}
 {join_clause}
 {where_clause}
 ;
-
-SELECT COUNT(*) FROM {str(Measurement.__table__)};
 """.strip().replace("\n", " ")
 
 
@@ -130,55 +131,27 @@ DISEASE_STATUS_SQL: Final[str] = create_source_sql(
     value_source_value="s.source_value",
     measurement_source_value="s.table||'_'||s.source_value",
     source_table="disease_status_cte",
-    cte=f"""WITH disease_status_cte AS(
-        SELECT
-            {DiseaseHistory.patient_id.key},
-            {DiseaseStatus.edss_score.key}::VARCHAR AS source_value,
-            {DiseaseStatus.date_visit.key} AS date_visit,
-            'edss_score' AS table
-        FROM {str(DiseaseStatus.__table__)}
-        WHERE {DiseaseStatus.edss_score.key} IS NOT NULL
-        UNION
-        SELECT
-            {DiseaseHistory.patient_id.key},
-            {DiseaseStatus.pdds_score.key}::VARCHAR AS source_value,
-            {DiseaseStatus.date_visit.key} AS date_visit,
-            'pdds_score' AS table
-        FROM {str(DiseaseStatus.__table__)}
-        WHERE {DiseaseStatus.pdds_score.key} IS NOT NULL
-        UNION
-        SELECT
-            {DiseaseHistory.patient_id.key},
-            {DiseaseStatus.t25fw.key}::VARCHAR AS source_value,
-            {DiseaseStatus.date_visit.key} AS date_visit,
-            't25fw' AS table
-        FROM {str(DiseaseStatus.__table__)}
-        WHERE {DiseaseStatus.t25fw.key} IS NOT NULL
-        UNION
-        SELECT
-            {DiseaseHistory.patient_id.key},
-            {DiseaseStatus.ninehpt_right.key}::VARCHAR AS source_value,
-            {DiseaseStatus.date_visit.key} AS date_visit,
-            'ninehpt_right' AS table
-        FROM {str(DiseaseStatus.__table__)}
-        WHERE {DiseaseStatus.ninehpt_right.key} IS NOT NULL
-        UNION
-        SELECT
-            {DiseaseHistory.patient_id.key},
-            {DiseaseStatus.ninehpt_left.key}::VARCHAR AS source_value,
-            {DiseaseStatus.date_visit.key} AS date_visit,
-            'ninehpt_left' AS table
-        FROM {str(DiseaseStatus.__table__)}
-        WHERE {DiseaseStatus.ninehpt_left.key} IS NOT NULL
-        UNION
-        SELECT
-            {DiseaseHistory.patient_id.key},
-            {DiseaseStatus.sdmt.key}::VARCHAR AS source_value,
-            {DiseaseStatus.date_visit.key} AS date_visit,
-            'sdmt' AS table
-        FROM {str(DiseaseStatus.__table__)}
-        WHERE {DiseaseStatus.sdmt.key} IS NOT NULL
-    )
+    cte=f"""WITH disease_status_cte AS({unpivot_sql(
+        source=str(DiseaseStatus.__table__),
+        keys=[DiseaseStatus.patient_id.key, DiseaseStatus.date_visit.key],
+        columns=["source_value"],
+        rows=[
+            UnpivotRow(
+                "edss_score", (f"{DiseaseStatus.edss_score.key}::VARCHAR",)
+            ),
+            UnpivotRow(
+                "pdds_score", (f"{DiseaseStatus.pdds_score.key}::VARCHAR",)
+            ),
+            UnpivotRow("t25fw", (f"{DiseaseStatus.t25fw.key}::VARCHAR",)),
+            UnpivotRow(
+                "ninehpt_right", (f"{DiseaseStatus.ninehpt_right.key}::VARCHAR",)
+            ),
+            UnpivotRow(
+                "ninehpt_left", (f"{DiseaseStatus.ninehpt_left.key}::VARCHAR",)
+            ),
+            UnpivotRow("sdmt", (f"{DiseaseStatus.sdmt.key}::VARCHAR",)),
+        ],
+    )})
     """,
     value_as_number="""
     (CASE
@@ -227,5 +200,4 @@ DISEASE_STATUS_SQL: Final[str] = create_source_sql(
 SQL_ENTRIES: Final[Dict[str, str]] = {
     "DISEASE_HISTORY": DISEASE_HISTORY_SQL,
     "DISEASE_STATUS": DISEASE_STATUS_SQL,
-    "MEASUREMENT": SQL_COUNT,
 }
@@ -1,7 +1,7 @@
 """SQL query string definition for observation_period"""
 
 # pylint: disable=no-member
-from typing import Final, List
+from typing import Any, Final, List, Tuple
 
 from ..common import CONCEPT_ID_REGISTRY, DEFAULT_DATE
 from ..models.omopcdm54.clinical import (
@@ -22,8 +22,57 @@ TARGET_COLUMNS: Final[List[str]] = [
 DEFAULT_OBSERVATION_DATE: Final[str] = DEFAULT_DATE.isoformat()
 
 
-def _obs_period_sql() -> str:
-    return f"""
+# the dates of every clinical table giving the observation periods, as
+# (table, date column, whether default dates are skipped); the end of a
+# period is the last visit date
+DATE_SOURCES: Final[List[Tuple[Any, Any, bool]]] = [
+    (Measurement, Measurement.measurement_date, True),
+    (ConditionOccurrence, ConditionOccurrence.condition_start_date, True),
+    (VisitOccurrence, VisitOccurrence.visit_start_date, True),
+    (VisitOccurrence, VisitOccurrence.visit_end_date, True),
+    (ProcedureOccurrence, ProcedureOccurrence.procedure_date, True),
+    (Observation, Observation.observation_date, False),
+    (DrugExposure, DrugExposure.drug_exposure_start_date, True),
+]
+
+
+def _dates_sql(persons: bool) -> str:
+    branches = []
+    for table, date_column, skip_default in DATE_SOURCES:
+        conditions = []
+        if skip_default:
+            conditions.append(f"{date_column.key} <> '{DEFAULT_OBSERVATION_DATE}'")
+        if persons:
+            conditions.append(f"{table.person_id.key} = ANY(:person_ids)")
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        branches.append(
+            f"""
+            SELECT
+                {table.person_id.key},
+                {date_column.key} AS observed_date,
+                {'TRUE' if table is VisitOccurrence else 'FALSE'} AS is_visit
+            FROM
+                {str(table.__table__)}
+            {where}"""
+        )
+    return "\n            UNION ALL".join(branches)
+
+
+def _obs_period_sql(persons: bool = False) -> str:
+    """Insert the observation period of every person in a single aggregation
+
+    The dates of all clinical tables are appended to each other and grouped
+    by person once. With persons only the periods of the persons in the
+    :person_ids array parameter are replaced.
+    """
+    delete = (
+        f"""
+    DELETE FROM {TARGET_TABLENAME}
+    WHERE {ObservationPeriod.person_id.key} = ANY(:person_ids);"""
+        if persons
+        else ""
+    )
+    return f"""{delete}
     INSERT INTO
         {TARGET_TABLENAME} (
             {ObservationPeriod.person_id.key},
@@ -32,131 +81,35 @@ def _obs_period_sql() -> str:
             {ObservationPeriod.period_type_concept_id.key}
         )
     SELECT
-        {ObservationPeriod.person_id.key},
+        p.{Person.person_id.key},
         COALESCE(
-            LEAST(
-                minimum_measurement_date,
-                minimum_condition_date,
-                minimum_procedure_date,
-                minimum_observation_date,
-                minimum_visit_date,
-                minimum_drug_exposure_date
-            ),
+            d.minimum_date,
             '{DEFAULT_OBSERVATION_DATE}'
         ) AS {ObservationPeriod.observation_period_start_date.key},
         COALESCE(
-            GREATEST(
-                maximum_visit_date
-            ),
+            d.maximum_visit_date,
             '{DEFAULT_OBSERVATION_DATE}'
         ) AS {ObservationPeriod.observation_period_end_date.key},
         {CONCEPT_ID_REGISTRY} AS {ObservationPeriod.period_type_concept_id.key}
     FROM
     (
         SELECT
-            *
+            person_id,
+            MIN(observed_date) AS minimum_date,
+            MAX(observed_date) FILTER (WHERE is_visit) AS maximum_visit_date
         FROM
-
-            /* measurement */
-            (
-                SELECT
-                    {Measurement.person_id.key},
-                    MIN({Measurement.measurement_date.key}) AS minimum_measurement_date
-                FROM
-                    {str(Measurement.__table__)}
-                WHERE
-                    {Measurement.measurement_date.key} <> '{DEFAULT_OBSERVATION_DATE}'
-                GROUP BY
-                    1
-            ) measurement_date_range
-
-            /* condition occurrence */
-            FULL OUTER JOIN (
-                SELECT
-                    {ConditionOccurrence.person_id.key},
-                    MIN({ConditionOccurrence.condition_start_date.key}) AS minimum_condition_date
-                FROM
-                    {str(ConditionOccurrence.__table__)}
-                WHERE
-                    {ConditionOccurrence.condition_start_date.key} <> '{DEFAULT_OBSERVATION_DATE}'
-                GROUP BY
-                    1
-            ) condition_date_range USING ({ConditionOccurrence.person_id.key})
-
-            /* visit occurrence */
-            FULL OUTER JOIN (
-                SELECT
-                    {VisitOccurrence.person_id.key},
-                    MIN(visit_date) AS minimum_visit_date,
-                    MAX(visit_date) AS maximum_visit_date
-                FROM
-                    (
-                        SELECT
-                            {VisitOccurrence.person_id.key},
-                            {VisitOccurrence.visit_start_date.key} AS visit_date
-                        FROM
-                            {str(VisitOccurrence.__table__)}
-                        UNION
-                        SELECT
-                            {VisitOccurrence.person_id.key},
-                            {VisitOccurrence.visit_end_date.key} AS visit_date
-                        FROM
-                            {str(VisitOccurrence.__table__)}
-                    ) visit_dates
-                WHERE
-                    visit_date <> '{DEFAULT_OBSERVATION_DATE}'
-                GROUP BY
-                    1
-            ) visit_date_range USING ({VisitOccurrence.person_id.key})
-
-            /* procedure occurrence */
-            FULL OUTER JOIN (
-                SELECT
-                    {ProcedureOccurrence.person_id.key},
-                    MIN({ProcedureOccurrence.procedure_date.key}) AS minimum_procedure_date
-                FROM
-                    {str(ProcedureOccurrence.__table__)}
-                WHERE
-                    {ProcedureOccurrence.procedure_date.key} <> '{DEFAULT_OBSERVATION_DATE}'
-                GROUP BY
-                    1
-            ) procedure_date_range USING ({ProcedureOccurrence.person_id.key})
-
-            /* observation */
-            FULL OUTER JOIN (
-                SELECT
-                    {Observation.person_id.key},
-                    MIN({Observation.observation_date.key}) AS minimum_observation_date
-                FROM
-                    {str(Observation.__table__)}
-                GROUP BY
-                    1
-            ) observation_date_range USING ({Observation.person_id.key})
-
-            /* drug_exposure */
-            FULL OUTER JOIN (
-                SELECT
-                    {DrugExposure.person_id.key},
-                    MIN({DrugExposure.drug_exposure_start_date.key}) AS minimum_drug_exposure_date
-                FROM
-                    {str(DrugExposure.__table__)}
-                WHERE
-                    {DrugExposure.drug_exposure_start_date.key} <> '{DEFAULT_OBSERVATION_DATE}'
-                GROUP BY
-                    1
-            ) drug_exposure_date_range USING ({DrugExposure.person_id.key})
-    ) all_ranges
-    WHERE
-        {Person.person_id.key} in (
-            SELECT
-                {Person.person_id.key}
-            FROM
-                {str(Person.__table__)}
-        )
+        ({_dates_sql(persons)}
+        ) observed_dates
+        GROUP BY
+            person_id
+    ) d
+    INNER JOIN {str(Person.__table__)} p
+        ON p.{Person.person_id.key} = d.person_id
 ;
 SELECT COUNT(*)
 FROM {str(ObservationPeriod.__table__)};
-""".strip().replace("\n", "")
+""".strip().replace("\n", " ")
 
 
 SQL: Final[str] = _obs_period_sql()
+SQL_PERSONS: Final[str] = _obs_period_sql(persons=True)
@@ -32,8 +32,8 @@ from ..common import (
     CONCEPT_ID_YES,
     DEFAULT_DATE,
 )
-from ..models.lookupmodels import ConceptLookup
-from ..models.omopcdm54.clinical import Observation, Person, VisitOccurrence
+from ..models.lookupmodels import ConceptLookup, LookupFilter, VisitLookup
+from ..models.omopcdm54.clinical import Observation, Person
 from ..models.source import (
     Comorbidities,
     DiseaseHistory,
@@ -45,6 +45,9 @@ from ..models.source import (
     Relapses,
     Symptom,
 )
+from .person_range import person_range
+from .unpivot import UnpivotRow, unpivot_sql
+from .visit_lookup import visit_join
 
 
 # pylint: disable=too-many-arguments
@@ -90,7 +93,7 @@ SELECT
    p.{Person.person_id.key},
    {obs_cid},
    (CASE
-        WHEN cast_date(s.{obs_date}::VARCHAR) IS NOT NULL THEN s.{obs_date}::DATE
+        WHEN s.{obs_date} IS NOT NULL THEN s.{obs_date}::DATE
         ELSE '{DEFAULT_DATE}'::DATE
     END),
    NULL::DATE,
@@ -113,11 +116,10 @@ SELECT
 FROM {source_table} s
 INNER JOIN {str(Person.__table__)} p
     ON s.patient_id = p.{Person.person_id.key}
+        AND {person_range(f"p.{Person.person_id.key}")}
 {join_clause}
 {where_clause}
 ;
-
-SELECT COUNT(*) FROM {str(Observation.__table__)};
 """.strip().replace("\n", " ")
 
 
@@ -148,50 +150,27 @@ DISEASE_STATUS_SQL: Final[str] = create_source_sql(
         WHEN s.table in ('ninehpt_right', 'ninehpt_left') THEN NULL::VARCHAR
     END)""",
     source_table="disease_status_cte",
-    cte=f"""WITH disease_status_cte AS(
-        SELECT
-            {DiseaseStatus.patient_id.key},
-            {DiseaseStatus.ms_status_clin.key} AS source_value,
-            {DiseaseStatus.date_visit.key} AS date_visit,
-            'ms_status_clin' AS table
-        FROM {str(DiseaseStatus.__table__)}
-        WHERE {DiseaseStatus.ms_status_clin.key} IS NOT NULL
-        UNION
-        SELECT
-            {DiseaseStatus.patient_id.key},
-            {DiseaseStatus.ms_status_pat.key} AS source_value,
-            {DiseaseStatus.date_visit.key} AS date_visit,
-            'ms_status_pat' AS table
-        FROM {str(DiseaseStatus.__table__)}
-        WHERE {DiseaseStatus.ms_status_pat.key} IS NOT NULL
-        UNION
-        SELECT
-            {DiseaseStatus.patient_id.key},
-            {DiseaseStatus.ninehpt_right.key}::VARCHAR AS source_value,
-            {DiseaseStatus.date_visit.key} AS date_visit,
-            'ninehpt_right' AS table
-        FROM {str(DiseaseStatus.__table__)}
-        WHERE {DiseaseStatus.ninehpt_right.key} IS NOT NULL
-        UNION
-        SELECT
-            {DiseaseStatus.patient_id.key},
-            {DiseaseStatus.ninehpt_left.key}::VARCHAR AS source_value,
-            {DiseaseStatus.date_visit.key} AS date_visit,
-            'ninehpt_left' AS table
-        FROM {str(DiseaseStatus.__table__)}
-        WHERE {DiseaseStatus.ninehpt_left.key} IS NOT NULL
-        UNION
-        SELECT
-            {DiseaseHistory.patient_id.key},
-            {DiseaseStatus.vib_sense.key}::VARCHAR AS source_value,
-            {DiseaseStatus.date_visit.key} AS date_visit,
-            'vib_sense' AS table
-        FROM {str(DiseaseStatus.__table__)}
-        WHERE {DiseaseStatus.vib_sense.key} IS NOT NULL
-    )
+    cte=f"""WITH disease_status_cte AS({unpivot_sql(
+        source=str(DiseaseStatus.__table__),
+        keys=[DiseaseStatus.patient_id.key, DiseaseStatus.date_visit.key],
+        columns=["source_value"],
+        rows=[
+            UnpivotRow("ms_status_clin", (DiseaseStatus.ms_status_clin.key,)),
+            UnpivotRow("ms_status_pat", (DiseaseStatus.ms_status_pat.key,)),
+            UnpivotRow(
+                "ninehpt_right", (f"{DiseaseStatus.ninehpt_right.key}::VARCHAR",)
+            ),
+            UnpivotRow(
+                "ninehpt_left", (f"{DiseaseStatus.ninehpt_left.key}::VARCHAR",)
+            ),
+            UnpivotRow(
+                "vib_sense", (f"{DiseaseStatus.vib_sense.key}::VARCHAR",)
+            ),
+        ],
+    )})
     """,
     join_clause=f"""LEFT JOIN {str(ConceptLookup.__table__)}
-        ON LOWER(s.table||'_'||s.source_value ) = LOWER({ConceptLookup.concept_string.key})
+        ON s.table||'_'||s.source_value = {ConceptLookup.concept_key.key}
     """,
 )
 
@@ -218,31 +197,16 @@ SYMPTOM_SQL: Final[str] = create_source_sql(
     obs_source_value="s.table||'_'||s.source_value",
     value_source_value="s.source_value",
     source_table="symptom_cte",
-    cte=f"""WITH symptom_cte AS(
-        SELECT
-            {Symptom.patient_id.key},
-            {Symptom.current_symptom.key} AS source_value,
-            {Symptom.date_visit.key} AS date_visit,
-            'current_symptom' AS table
-        FROM {str(Symptom.__table__)}
-        WHERE {Symptom.current_symptom.key} IS NOT NULL
-        UNION
-        SELECT
-            {Symptom.patient_id.key},
-            {Symptom.sever_symp.key}::VARCHAR AS source_value,
-            {Symptom.date_visit.key} AS date_visit,
-            'sever_symp' AS table
-        FROM {str(Symptom.__table__)}
-        WHERE {Symptom.sever_symp.key} IS NOT NULL
-        UNION
-        SELECT
-            {Symptom.patient_id.key},
-            {Symptom.treat_symp.key} AS source_value,
-            {Symptom.date_visit.key} AS date_visit,
-            'treat_symp' AS table
-        FROM {str(Symptom.__table__)}
-        WHERE {Symptom.treat_symp.key} IS NOT NULL
-    )
+    cte=f"""WITH symptom_cte AS({unpivot_sql(
+        source=str(Symptom.__table__),
+        keys=[Symptom.patient_id.key, Symptom.date_visit.key],
+        columns=["source_value"],
+        rows=[
+            UnpivotRow("current_symptom", (Symptom.current_symptom.key,)),
+            UnpivotRow("sever_symp", (f"{Symptom.sever_symp.key}::VARCHAR",)),
+            UnpivotRow("treat_symp", (Symptom.treat_symp.key,)),
+        ],
+    )})
     """,
     value_as_number="""
     (CASE
@@ -251,7 +215,7 @@ SYMPTOM_SQL: Final[str] = create_source_sql(
     END)
     """,
     join_clause=f"""LEFT JOIN {str(ConceptLookup.__table__)}
-        ON LOWER(s.table||'_'||s.source_value )= lower({ConceptLookup.concept_string.key})
+        ON s.table||'_'||s.source_value = {ConceptLookup.concept_key.key}
     """,
 )
 
@@ -269,31 +233,24 @@ RELAPSES_SQL: Final[str] = create_source_sql(
     obs_source_value="s.table||'_'||s.source_value",
     value_source_value="s.source_value",
     source_table="relapse_cte",
-    cte=f"""WITH relapse_cte AS(
-        SELECT
-            {Relapses.patient_id.key},
-            {Relapses.relapse_recovery.key} AS source_value,
-            {Relapses.date_visit.key} AS date_visit,
-            'relapse_recovery' AS table
-        FROM {str(Relapses.__table__)}
-        WHERE {Relapses.relapse_recovery.key} IS NOT NULL
-        UNION
-        SELECT
-            {Relapses.patient_id.key},
-            {Relapses.relapse_treat.key} AS source_value,
-            {Relapses.date_visit.key} AS date_visit,
-            'relapse_treat' AS table
-        FROM {str(Relapses.__table__)}
-        WHERE LOWER({Relapses.relapse_treat.key}) IN ('yes', 'no')
-        UNION
-        SELECT
-            {Relapses.patient_id.key},
-            {Relapses.relapse.key} AS source_value,
-            {Relapses.date_visit.key} AS date_visit,
-            'relapse' AS table
-        FROM {str(Relapses.__table__)}
-        WHERE LOWER({Relapses.relapse.key}) = 'no'
-    )
+    cte=f"""WITH relapse_cte AS({unpivot_sql(
+        source=str(Relapses.__table__),
+        keys=[Relapses.patient_id.key, Relapses.date_visit.key],
+        columns=["source_value"],
+        rows=[
+            UnpivotRow("relapse_recovery", (Relapses.relapse_recovery.key,)),
+            UnpivotRow(
+                "relapse_treat",
+                (Relapses.relapse_treat.key,),
+                f"LOWER({Relapses.relapse_treat.key}) IN ('yes', 'no')",
+            ),
+            UnpivotRow(
+                "relapse",
+                (Relapses.relapse.key,),
+                f"LOWER({Relapses.relapse.key}) = 'no'",
+            ),
+        ],
+    )})
     """,
 )
 
@@ -314,31 +271,16 @@ MRI_SQL: Final[str] = create_source_sql(
     obs_source_value="s.table||'_'||s.source_value",
     value_source_value="s.source_value::VARCHAR",
     source_table="mri_cte",
-    cte=f"""WITH mri_cte AS(
-        SELECT
-            {Mri.patient_id.key},
-            {Mri.mri_gd_les.key} AS source_value,
-            {Mri.date_visit.key} AS date_visit,
-            'mri_gd_les' AS table
-        FROM {str(Mri.__table__)}
-        WHERE {Mri.mri_gd_les.key} IS NOT NULL
-        UNION
-        SELECT
-            {Mri.patient_id.key},
-            {Mri.mri_new_les_t1.key} AS source_value,
-            {Mri.date_visit.key} AS date_visit,
-            'mri_new_les_t1' AS table
-        FROM {str(Mri.__table__)}
-        WHERE {Mri.mri_new_les_t1.key} IS NOT NULL
-        UNION
-        SELECT
-            {Mri.patient_id.key},
-            {Mri.mri_new_les_t2.key} AS source_value,
-            {Mri.date_visit.key} AS date_visit,
-            'mri_new_les_t2' AS table
-        FROM {str(Mri.__table__)}
-        WHERE {Mri.mri_new_les_t2.key} IS NOT NULL
-    )
+    cte=f"""WITH mri_cte AS({unpivot_sql(
+        source=str(Mri.__table__),
+        keys=[Mri.patient_id.key, Mri.date_visit.key],
+        columns=["source_value"],
+        rows=[
+            UnpivotRow("mri_gd_les", (Mri.mri_gd_les.key,)),
+            UnpivotRow("mri_new_les_t1", (Mri.mri_new_les_t1.key,)),
+            UnpivotRow("mri_new_les_t2", (Mri.mri_new_les_t2.key,)),
+        ],
+    )})
     """,
     value_as_number="""
     (CASE
@@ -369,51 +311,26 @@ PATIENT_SQL: Final[str] = create_source_sql(
     obs_source_value="s.table||'_'||s.source_value",
     value_source_value="s.source_value",
     source_table="patient_cte",
-    cte=f"""WITH patient_cte AS(
-        SELECT
-            {Patient.patient_id.key},
-            {Patient.education.key} AS source_value,
-            {Patient.date_visit.key} AS date_visit,
-            'education' AS table
-        FROM {str(Patient.__table__)}
-        WHERE {Patient.education.key} IS NOT NULL
-        UNION
-        SELECT
-            {Patient.patient_id.key},
-            {Patient.employment.key} AS source_value,
-            {Patient.date_visit.key} AS date_visit,
-            'employment' AS table
-        FROM {str(Patient.__table__)}
-        WHERE {Patient.employment.key} IS NOT NULL
-        UNION
-        SELECT
-            {Patient.patient_id.key},
-            {Patient.smoking.key} AS source_value,
-            {Patient.date_visit.key} AS date_visit,
-            'smoking' AS table
-        FROM {str(Patient.__table__)}
-        WHERE {Patient.smoking.key} IS NOT NULL
-        UNION
-        SELECT
-            {Patient.patient_id.key},
-            {Patient.ms_family.key} AS source_value,
-            {Patient.date_visit.key} AS date_visit,
-            'ms_family' AS table
-        FROM {str(Patient.__table__)}
-        WHERE {Patient.ms_family.key} IS NOT NULL
-        UNION
-        SELECT
-            {Patient.patient_id.key},
-            {Patient.smoking_count.key}::VARCHAR AS source_value,
-            {Patient.date_visit.key} AS date_visit,
-            'smoking_count' AS table
-        FROM {str(Patient.__table__)}
-        WHERE {Patient.smoking.key} = 'current_smoker'
-    )
+    cte=f"""WITH patient_cte AS({unpivot_sql(
+        source=str(Patient.__table__),
+        keys=[Patient.patient_id.key, Patient.date_visit.key],
+        columns=["source_value"],
+        rows=[
+            UnpivotRow("education", (Patient.education.key,)),
+            UnpivotRow("employment", (Patient.employment.key,)),
+            UnpivotRow("smoking", (Patient.smoking.key,)),
+            UnpivotRow("ms_family", (Patient.ms_family.key,)),
+            UnpivotRow(
+                "smoking_count",
+                (f"{Patient.smoking_count.key}::VARCHAR",),
+                f"{Patient.smoking.key} = 'current_smoker'",
+            ),
+        ],
+    )})
     """,
     join_clause=f"""LEFT JOIN {str(ConceptLookup.__table__)}
-        ON LOWER(s.table||'_'||s.source_value ) = LOWER({ConceptLookup.concept_string.key})
-        AND LOWER({ConceptLookup.filter.key}) = 'vac'
+        ON s.table||'_'||s.source_value = {ConceptLookup.concept_key.key}
+        AND {ConceptLookup.filter_key.key} = '{LookupFilter.VAC.value}'
     """,
     value_as_number="""
         (CASE
@@ -437,14 +354,23 @@ DMT_SQL: Final[str] = create_source_sql(
     obs_source_value=f"'dmt_status_'||s.{Dmt.dmt_status.key}",
     value_source_value=f"s.{Dmt.dmt_status.key}",
     source_table=str(Dmt.__table__),
-    visit_occ_id=f"v.{VisitOccurrence.visit_occurrence_id.key}",
-    join_clause=f"""LEFT JOIN {str(VisitOccurrence.__table__)} v
-        ON s.{Dmt.patient_id.key} = v.{VisitOccurrence.person_id.key}
-        AND s.{Dmt.date_visit.key} = v.{VisitOccurrence.visit_start_date.key}
-    """,
+    visit_occ_id=f"v.{VisitLookup.visit_occurrence_id.key}",
+    join_clause=visit_join("v", f"s.{Dmt.patient_id.key}", f"s.{Dmt.date_visit.key}"),
     where_clause=f"WHERE s.{Dmt.dmt_status.key} IS NOT NULL",
 )
 
+# the disease history rows of the first visit of every patient
+FIRST_DISEASE_HISTORY: Final[str] = f"""{str(DiseaseHistory.__table__)} a
+INNER JOIN (
+    SELECT
+        MIN({DiseaseHistory.date_visit.key}) as date_visit,
+        {DiseaseHistory.patient_id.key}
+        FROM {str(DiseaseHistory.__table__)}
+        GROUP BY {DiseaseHistory.patient_id.key}
+) b
+    ON a.{DiseaseHistory.patient_id.key} = b.{DiseaseHistory.patient_id.key}
+        AND a.{DiseaseHistory.date_visit.key} = b.{DiseaseHistory.date_visit.key}"""
+
 DISEASE_HISTORY_SQL: Final[str] = create_source_sql(
     obs_cid=f"""
     (CASE
@@ -457,41 +383,21 @@ DISEASE_HISTORY_SQL: Final[str] = create_source_sql(
     obs_source_value="s.table||'_'||s.source_value",
     value_source_value="s.source_value",
     source_table="disease_history_cte",
-    cte=f"""WITH disease_history_cte AS(
-        SELECT
-            a.{DiseaseHistory.patient_id.key},
-            a.{DiseaseHistory.date_onset.key} AS source_value,
-            a.{DiseaseHistory.date_onset.key} AS date_clinical_event,
-            'date_onset' AS table
-        FROM {str(DiseaseHistory.__table__)} a
-        INNER JOIN (
-            SELECT
-                MIN({DiseaseHistory.date_visit.key}) as date_visit,
-                {DiseaseHistory.patient_id.key}
-                FROM {str(DiseaseHistory.__table__)}
-                GROUP BY {DiseaseHistory.patient_id.key}
-        ) b
-            ON a.{DiseaseHistory.patient_id.key} = b.{DiseaseHistory.patient_id.key}
-                AND a.{DiseaseHistory.date_visit.key} = b.{DiseaseHistory.date_visit.key}
-        WHERE {DiseaseHistory.date_onset.key} IS NOT NULL
-        UNION
-        SELECT
-            a.{DiseaseHistory.patient_id.key},
-            a.{DiseaseHistory.date_diagnosis.key} AS source_value,
-            a.{DiseaseHistory.date_diagnosis.key} AS date_clinical_event,
-            'date_diagnosis' AS table
-        FROM {str(DiseaseHistory.__table__)} a
-        INNER JOIN (
-            SELECT
-                MIN({DiseaseHistory.date_visit.key}) as date_visit,
-                {DiseaseHistory.patient_id.key}
-                FROM {str(DiseaseHistory.__table__)}
-                GROUP BY {DiseaseHistory.patient_id.key}
-        ) b
-            ON a.{DiseaseHistory.patient_id.key} = b.{DiseaseHistory.patient_id.key}
-                AND a.{DiseaseHistory.date_visit.key} = b.{DiseaseHistory.date_visit.key}
-        WHERE {DiseaseHistory.date_diagnosis.key} IS NOT NULL
-    )""",
+    cte=f"""WITH disease_history_cte AS({unpivot_sql(
+        source=FIRST_DISEASE_HISTORY,
+        keys=[f"a.{DiseaseHistory.patient_id.key}"],
+        columns=["source_value", "date_clinical_event"],
+        rows=[
+            UnpivotRow(
+                "date_onset",
+                (f"a.{DiseaseHistory.date_onset.key}",) * 2,
+            ),
+            UnpivotRow(
+                "date_diagnosis",
+                (f"a.{DiseaseHistory.date_diagnosis.key}",) * 2,
+            ),
+        ],
+    )})""",
 )
 
 NPT_SQL: Final[str] = create_source_sql(
@@ -508,8 +414,8 @@ NPT_SQL: Final[str] = create_source_sql(
     value_source_value=Npt.np_treat_type.key,
     source_table=str(Npt.__table__),
     join_clause=f"""LEFT JOIN {str(ConceptLookup.__table__)}
-        ON 'np_treat_type_'||{Npt.np_treat_type.key} = LOWER({ConceptLookup.concept_string.key})
-            AND LOWER({ConceptLookup.filter.key}) = 'vac'
+        ON 'np_treat_type_'||{Npt.np_treat_type.key} = {ConceptLookup.concept_key.key}
+            AND {ConceptLookup.filter_key.key} = '{LookupFilter.VAC.value}'
     """,
     where_clause=f"WHERE {Npt.np_treat_type.key} IS NOT NULL",
 )
@@ -527,28 +433,24 @@ COMORBIDITIES_SQL: Final[str] = create_source_sql(
     obs_source_value="s.table||'_'||s.source_value",
     value_source_value="s.source_value",
     source_table="comorbidities_cte",
-    cte=f"""WITH comorbidities_cte AS(
-        SELECT
-            {Comorbidities.patient_id.key},
-            {Comorbidities.com_type.key} AS source_value,
-            {Comorbidities.date_visit.key} AS date_visit,
-            'com_type' AS table
-        FROM {str(Comorbidities.__table__)}
-        WHERE {Comorbidities.com_type.key} IS NOT NULL
-        UNION
-        SELECT
-            {Comorbidities.patient_id.key},
-            {Comorbidities.com_system.key} AS source_value,
-            {Comorbidities.date_visit.key} AS date_visit,
-            'com_system' AS table
-        FROM {str(Comorbidities.__table__)}
-        WHERE {Comorbidities.com_system.key} IS NOT NULL
-            AND {Comorbidities.com_type.key} IS NULL
-    )
+    cte=f"""WITH comorbidities_cte AS({unpivot_sql(
+        source=str(Comorbidities.__table__),
+        keys=[Comorbidities.patient_id.key, Comorbidities.date_visit.key],
+        columns=["source_value"],
+        rows=[
+            UnpivotRow("com_type", (Comorbidities.com_type.key,)),
+            UnpivotRow(
+                "com_system",
+                (Comorbidities.com_system.key,),
+                f"{Comorbidities.com_system.key} IS NOT NULL"
+                f" AND {Comorbidities.com_type.key} IS NULL",
+            ),
+        ],
+    )})
     """,
     join_clause=f"""LEFT JOIN {str(ConceptLookup.__table__)}
-        ON s.table||'_'||s.source_value = LOWER({ConceptLookup.concept_string.key})
-            AND LOWER({ConceptLookup.filter.key}) = 'vac'
+        ON s.table||'_'||s.source_value = {ConceptLookup.concept_key.key}
+            AND {ConceptLookup.filter_key.key} = '{LookupFilter.VAC.value}'
     """,
 )
 
@@ -562,5 +464,4 @@ SQL_ENTRIES: Final[Dict[str, str]] = {
     "DISEASE_HISTORY": DISEASE_HISTORY_SQL,
     "NPT": NPT_SQL,
     "COMORBIDITIES": COMORBIDITIES_SQL,
-    "OBSERVATION": SQL_COUNT,
 }
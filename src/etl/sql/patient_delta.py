@@ -0,0 +1,152 @@
+"""SQL query string definitions for the incremental runs"""
+
+from typing import Any, Final, List
+
+from sqlalchemy.schema import sort_tables
+
+from ..models.etl_logger import ETLLogger, ETLPatientState
+from ..models.lookupmodels import PatientDelta
+from ..models.modelutils import (
+    DIALECT_POSTGRES,
+    analyze_tables_sql,
+    create_tables_sql,
+    drop_tables_sql,
+)
+from ..models.omopcdm54.health_systems import Location
+from ..models.source import Patient
+from .create_omopcdm_tables import MODELS as OMOP_MODELS
+from .create_source_tables import MODELS as SOURCE_MODELS
+
+# the OMOP CDM tables holding rows of a person, the referencing ones first
+PERSON_TABLES: Final[List[Any]] = [
+    table
+    for table in reversed(sort_tables([m.__table__ for m in OMOP_MODELS]))
+    if "person_id" in table.c
+]
+
+
+def _source_rows_sql() -> str:
+    """The patient and hash of every source row, without its generated key"""
+    return "\n    UNION ALL".join(
+        f"""
+    SELECT
+        s.{model.patient_id.key} AS patient_id,
+        '{model.__tablename__}'
+            || md5((to_jsonb(s) - '{model._id.key}')::TEXT) AS row_hash
+    FROM {str(model.__table__)} s
+    WHERE s.{model.patient_id.key} IS NOT NULL"""
+        for model in SOURCE_MODELS
+    )
+
+
+def _delete_persons_sql() -> str:
+    deletes = [
+        f"""
+DELETE FROM {str(table)} t
+USING {str(PatientDelta.__table__)} d
+WHERE t.person_id = d.{PatientDelta.patient_id.key};"""
+        for table in PERSON_TABLES
+    ]
+    return "".join(deletes)
+
+
+def _prune_sources_sql() -> str:
+    deletes = [
+        f"""
+DELETE FROM {str(model.__table__)} s
+WHERE NOT EXISTS (
+    SELECT 1 FROM {str(PatientDelta.__table__)} d
+    WHERE d.{PatientDelta.patient_id.key} = s.{model.patient_id.key}
+);"""
+        for model in SOURCE_MODELS
+    ]
+    return "".join(deletes)
+
+
+# the hash of a patient covers all its source rows in any order, salted
+# with :inputs_digest, the digest of everything else the results depend
+# on; the patients found changed are removed from the state until their
+# new rows are in place, from the OMOP CDM tables and from the source
+# tables, which are left with the rows to transform, after the locations
+# no patient lives at anymore
+SQL: Final[str] = f"""
+{drop_tables_sql([PatientDelta])}
+{create_tables_sql([PatientDelta, ETLPatientState], dialect=DIALECT_POSTGRES)}
+
+INSERT INTO {str(PatientDelta.__table__)}
+(
+    {PatientDelta.patient_id.key},
+    {PatientDelta.row_hash.key}
+)
+SELECT
+    COALESCE(h.patient_id, s.{ETLPatientState.patient_id.key}),
+    h.row_hash
+FROM (
+    SELECT
+        patient_id,
+        md5(:inputs_digest || string_agg(row_hash, ',' ORDER BY row_hash))
+            AS row_hash
+    FROM ({_source_rows_sql()}
+    ) r
+    GROUP BY patient_id
+) h
+FULL JOIN {str(ETLPatientState.__table__)} s
+    ON s.{ETLPatientState.patient_id.key} = h.patient_id
+WHERE h.row_hash IS DISTINCT FROM s.{ETLPatientState.row_hash.key};
+
+{analyze_tables_sql([PatientDelta])}
+
+DELETE FROM {str(ETLPatientState.__table__)} s
+USING {str(PatientDelta.__table__)} d
+WHERE s.{ETLPatientState.patient_id.key} = d.{PatientDelta.patient_id.key};
+{_delete_persons_sql()}
+DELETE FROM {str(ETLLogger.__table__)} l
+USING {str(PatientDelta.__table__)} d
+WHERE l.{ETLLogger.patient_id.key} = d.{PatientDelta.patient_id.key};
+
+DELETE FROM {str(Location.__table__)} l
+WHERE NOT EXISTS (
+    SELECT 1 FROM {str(Patient.__table__)} p
+    WHERE p.{Patient.residence.key}
+        IS NOT DISTINCT FROM l.{Location.location_source_value.key}
+);
+{_prune_sources_sql()}
+
+{analyze_tables_sql(SOURCE_MODELS)}
+
+SELECT COUNT(*), COUNT(*) - COUNT({PatientDelta.row_hash.key})
+FROM {str(PatientDelta.__table__)};
+""".strip().replace("\n", " ")
+
+SQL_STORE: Final[str] = f"""
+DELETE FROM {str(ETLPatientState.__table__)} s
+USING {str(PatientDelta.__table__)} d
+WHERE s.{ETLPatientState.patient_id.key} = d.{PatientDelta.patient_id.key};
+
+INSERT INTO {str(ETLPatientState.__table__)}
+(
+    {ETLPatientState.patient_id.key},
+    {ETLPatientState.row_hash.key}
+)
+SELECT
+    {PatientDelta.patient_id.key},
+    {PatientDelta.row_hash.key}
+FROM {str(PatientDelta.__table__)}
+WHERE {PatientDelta.row_hash.key} IS NOT NULL;
+
+SELECT COUNT(*) FROM {str(ETLPatientState.__table__)};
+""".strip().replace("\n", " ")
+
+SQL_PERSONS: Final[str] = f"""
+SELECT {PatientDelta.patient_id.key}
+FROM {str(PatientDelta.__table__)}
+ORDER BY {PatientDelta.patient_id.key}
+""".strip().replace("\n", " ")
+
+SQL_STATE_EXISTS: Final[str] = f"SELECT to_regclass('{str(ETLPatientState.__table__)}')"
+
+SQL_HAS_STATE: Final[str] = (
+    f"SELECT EXISTS (SELECT 1 FROM {str(ETLPatientState.__table__)})"
+)
+
+SQL_CLEAR: Final[str] = drop_tables_sql([ETLPatientState, PatientDelta])
@@ -0,0 +1,53 @@
+"""SQL builder restricting a statement to a range of persons"""
+
+from typing import Dict, Final, Optional
+
+from ..models.source import Patient
+
+PERSON_RANGE_LOWER: Final[str] = "person_range_lower"
+PERSON_RANGE_UPPER: Final[str] = "person_range_upper"
+
+# the parameters of the range of every person
+ALL_PERSONS: Final[Dict[str, Optional[int]]] = {
+    PERSON_RANGE_LOWER: None,
+    PERSON_RANGE_UPPER: None,
+}
+
+
+def person_range(column: str) -> str:
+    """The condition keeping the person_id column within a range
+
+    The range runs above :person_range_lower up to :person_range_upper,
+    either bound left out when NULL. A statement with this condition
+    declares it can run range by range: the rows it gives a person depend
+    on the rows of that person only.
+    """
+    return (
+        f"(:{PERSON_RANGE_LOWER} IS NULL OR {column} > :{PERSON_RANGE_LOWER})"
+        f" AND (:{PERSON_RANGE_UPPER} IS NULL"
+        f" OR {column} <= :{PERSON_RANGE_UPPER})"
+    )
+
+
+def is_partitioned(sql: str) -> bool:
+    """Whether sql declares it can run range by range of persons"""
+    return f":{PERSON_RANGE_UPPER}" in sql
+
+
+# the last person of every range, as the staged patients split in :ranges
+# ranges of about the same size
+SQL_RANGE_UPPERS: Final[str] = f"""
+SELECT MAX(r.{Patient.patient_id.key})
+FROM (
+    SELECT
+        p.{Patient.patient_id.key},
+        NTILE(:ranges) OVER (ORDER BY p.{Patient.patient_id.key}) AS part
+    FROM (
+        SELECT DISTINCT {Patient.patient_id.key}
+        FROM {str(Patient.__table__)}
+        WHERE {Patient.patient_id.key} IS NOT NULL
+    ) p
+) r
+GROUP BY r.part
+ORDER BY 1
+""".strip().replace("\n", " ")
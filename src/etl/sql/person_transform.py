@@ -7,13 +7,15 @@ from ..models.omopcdm54.clinical import Person
 from ..models.omopcdm54.health_systems import Location
 from ..models.source import DiseaseHistory, Patient
 
+# the shards of a sharded run may add the same residence concurrently, each
+# person takes the first location of its residence until they are merged
 SQL: Final[str] = f"""
 WITH valid_disease_history AS (
     SELECT
         DISTINCT d.{DiseaseHistory.patient_id.key}
     FROM {str(DiseaseHistory.__table__)} d
-    WHERE cast_date(d.{DiseaseHistory.date_diagnosis.key}::VARCHAR) IS NOT NULL
-        OR cast_date(d.{DiseaseHistory.date_onset.key}::VARCHAR) IS NOT NULL
+    WHERE d.{DiseaseHistory.date_diagnosis.key} IS NOT NULL
+        OR d.{DiseaseHistory.date_onset.key} IS NOT NULL
 )
 INSERT INTO {str(Person.__table__)}
 (
@@ -77,9 +79,15 @@ INNER JOIN (
         AND p.{Patient.date_visit.key} = b.{Patient.date_visit.key}
 INNER JOIN valid_disease_history vdh
     ON p.{Patient.patient_id.key} = vdh.{DiseaseHistory.patient_id.key}
-LEFT JOIN {str(Location.__table__)} l
+LEFT JOIN (
+    SELECT
+        {Location.location_source_value.key},
+        MIN({Location.location_id.key}) AS {Location.location_id.key}
+    FROM {str(Location.__table__)}
+    GROUP BY {Location.location_source_value.key}
+) l
     ON p.{Patient.residence.key} = l.{Location.location_source_value.key}
-WHERE cast_date(p.{Patient.date_birth.key}::VARCHAR) IS NOT NULL
+WHERE p.{Patient.date_birth.key} IS NOT NULL
     AND p.{Patient.sex.key} in ('female', 'male')
 ;
 
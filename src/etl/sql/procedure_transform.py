@@ -9,13 +9,10 @@ from ..common import (
     CONCEPT_ID_TRANSPLANTATION,
     DEFAULT_DATE,
 )
-from ..models.lookupmodels import ConceptLookup
-from ..models.omopcdm54.clinical import (
-    Person,
-    ProcedureOccurrence,
-    VisitOccurrence,
-)
+from ..models.lookupmodels import ConceptLookup, LookupFilter, VisitLookup
+from ..models.omopcdm54.clinical import Person, ProcedureOccurrence
 from ..models.source import Dmt, Mri
+from .visit_lookup import visit_join
 
 
 # pylint: disable=too-many-arguments
@@ -59,7 +56,7 @@ SELECT
     NULL::INTEGER,
     NULL::INTEGER,
     NULL::INTEGER,
-    v.{VisitOccurrence.visit_occurrence_id.key},
+    v.{VisitLookup.visit_occurrence_id.key},
     NULL::INTEGER,
     {proc_source_value},
     NULL::INTEGER,
@@ -67,9 +64,7 @@ SELECT
 FROM {str(source_table.__table__)} s
 INNER JOIN {str(Person.__table__)} p
     ON s.patient_id = p.{Person.person_id.key}
-LEFT JOIN {str(VisitOccurrence.__table__)} v
-    ON s.patient_id = v.{VisitOccurrence.person_id.key}
-        AND s.date_visit::DATE = v.{VisitOccurrence.visit_start_date.key}::DATE
+{visit_join("v", "s.patient_id", "s.date_visit")}
 {join}
 {where}
 ;
@@ -88,7 +83,7 @@ MRI_SQL: Final[str] = create_source_sql(
     """,
     proc_date=f"""
     (CASE
-        WHEN cast_date(s.{Mri.mri_date.key}::VARCHAR) IS NOT NULL THEN s.{Mri.mri_date.key}::DATE
+        WHEN s.{Mri.mri_date.key} IS NOT NULL THEN s.{Mri.mri_date.key}::DATE
         ELSE '{DEFAULT_DATE}'::DATE
     END)
     """,
@@ -107,8 +102,8 @@ MRI_SQL: Final[str] = create_source_sql(
     """,
     join=f"""
     LEFT JOIN {str(ConceptLookup.__table__)} c
-    ON 'mri_region_'||s.{Mri.mri_region.key} = c.{ConceptLookup.concept_string.key}
-        AND LOWER(c.{ConceptLookup.filter.key}) = 'procedure'
+    ON 'mri_region_'||s.{Mri.mri_region.key} = c.{ConceptLookup.concept_key.key}
+        AND c.{ConceptLookup.filter_key.key} = '{LookupFilter.PROCEDURE.value}'
     """,
 )
 
@@ -117,9 +112,10 @@ DMT_SQL: Final[str] = create_source_sql(
     proc_date=f"""s.{Dmt.dmt_start.key}::DATE""",
     proc_end_date=f"""
     (CASE
-        WHEN cast_date(s.{Dmt.dmt_stop.key}::VARCHAR) IS NOT NULL THEN s.{Dmt.dmt_stop.key}::DATE
+        WHEN s.{Dmt.dmt_stop.key} IS NOT NULL THEN s.{Dmt.dmt_stop.key}::DATE
+        WHEN s.{Dmt.dmt_stop_valid.key} IS FALSE THEN '{DEFAULT_DATE}'::DATE
         WHEN s.{Dmt.dmt_status.key} = 'yes' AND s.{Dmt.dmt_stop.key} IS NULL
-            AND cast_date(s.{Dmt.date_visit.key}::VARCHAR) IS NOT NULL
+            AND s.{Dmt.date_visit.key} IS NOT NULL
             THEN s.{Dmt.date_visit.key}::DATE
         ELSE '{DEFAULT_DATE}'::DATE
     END)
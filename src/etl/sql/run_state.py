@@ -0,0 +1,55 @@
+"""SQL query string definitions for the run state of checkpointed runs"""
+
+from typing import Final
+
+from ..models.etl_logger import ETLRunState
+from ..models.modelutils import DIALECT_POSTGRES, create_tables_sql
+from ..models.omopcdm54.registry import TARGET_SCHEMA
+
+SQL_CREATE: Final[str] = (
+    f"CREATE SCHEMA IF NOT EXISTS {TARGET_SCHEMA}; "
+    + create_tables_sql([ETLRunState], dialect=DIALECT_POSTGRES)
+)
+
+SQL_LAST_RUN: Final[str] = f"""
+SELECT
+    {ETLRunState.run_id.key},
+    {ETLRunState.step_name.key},
+    {ETLRunState.status.key},
+    {ETLRunState.fingerprint.key}
+FROM {str(ETLRunState.__table__)}
+WHERE {ETLRunState.run_id.key} = (
+    SELECT MAX({ETLRunState.run_id.key}) FROM {str(ETLRunState.__table__)}
+)
+""".strip().replace("\n", " ")
+
+SQL_INSERT: Final[str] = f"""
+INSERT INTO {str(ETLRunState.__table__)}
+(
+    {ETLRunState.run_id.key},
+    {ETLRunState.step_name.key},
+    {ETLRunState.status.key},
+    {ETLRunState.fingerprint.key}
+)
+VALUES (:run_id, :step_name, :status, :fingerprint)
+""".strip().replace("\n", " ")
+
+SQL_UPDATE: Final[str] = f"""
+UPDATE {str(ETLRunState.__table__)}
+SET
+    {ETLRunState.status.key} = :status,
+    {ETLRunState.duration.key} = :duration
+WHERE {ETLRunState.run_id.key} = :run_id
+    AND {ETLRunState.step_name.key} = :step_name
+""".strip().replace("\n", " ")
+
+SQL_PUBLISHED: Final[str] = f"""
+UPDATE {str(ETLRunState.__table__)}
+SET {ETLRunState.status.key} = :status
+WHERE {ETLRunState.run_id.key} = :run_id
+    AND {ETLRunState.step_name.key} = ANY(:step_names)
+""".strip().replace("\n", " ")
+
+SQL_EXISTS: Final[str] = f"SELECT to_regclass('{str(ETLRunState.__table__)}')"
+
+SQL_CLEAR: Final[str] = f"DELETE FROM {str(ETLRunState.__table__)}"
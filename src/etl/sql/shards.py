@@ -0,0 +1,52 @@
+"""SQL query string definitions for the sharded runs"""
+
+from typing import Final
+
+from ..models.omopcdm54.clinical import Person
+from ..models.omopcdm54.health_systems import Location
+from ..models.source import Patient, shard_schema
+
+SQL_STAGED_PERSONS: Final[str] = f"""
+SELECT DISTINCT {Patient.patient_id.key}
+FROM {str(Patient.__table__)}
+WHERE {Patient.patient_id.key} IS NOT NULL
+ORDER BY {Patient.patient_id.key}
+""".strip().replace("\n", " ")
+
+_FIRST_LOCATIONS: Final[str] = f"""(
+    SELECT
+        {Location.location_source_value.key},
+        MIN({Location.location_id.key}) AS {Location.location_id.key}
+    FROM {str(Location.__table__)}
+    GROUP BY {Location.location_source_value.key}
+) f"""
+
+# the shards add the residences they do not find, concurrently they may add
+# the same one more than once: the persons are moved to the first location
+# of their residence and the others are deleted
+SQL_MERGE_LOCATIONS: Final[str] = f"""
+UPDATE {str(Person.__table__)} p
+SET {Person.location_id.key} = f.{Location.location_id.key}
+FROM {str(Location.__table__)} l
+INNER JOIN {_FIRST_LOCATIONS}
+    ON f.{Location.location_source_value.key}
+        IS NOT DISTINCT FROM l.{Location.location_source_value.key}
+WHERE p.{Person.location_id.key} = l.{Location.location_id.key}
+    AND l.{Location.location_id.key} <> f.{Location.location_id.key};
+
+DELETE FROM {str(Location.__table__)} l
+USING {_FIRST_LOCATIONS}
+WHERE f.{Location.location_source_value.key}
+        IS NOT DISTINCT FROM l.{Location.location_source_value.key}
+    AND l.{Location.location_id.key} <> f.{Location.location_id.key};
+
+SELECT COUNT(*) FROM {str(Location.__table__)};
+""".strip().replace("\n", " ")
+
+
+def drop_shard_schemas_sql(shards: int) -> str:
+    """Drop the schemas the shards staged their source tables in"""
+    return " ".join(
+        f"DROP SCHEMA IF EXISTS {shard_schema(shard)} CASCADE;"
+        for shard in range(shards)
+    )
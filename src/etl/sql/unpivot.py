@@ -0,0 +1,50 @@
+"""SQL builder turning the attribute columns of a source table into rows"""
+
+from typing import NamedTuple, Optional, Sequence, Tuple
+
+
+class UnpivotRow(NamedTuple):
+    """One attribute of an unpivot
+
+    label names the attribute in the label column, values are the
+    expressions of the value columns and where is the condition for a
+    source row to produce the attribute, by default the first value being
+    not NULL.
+    """
+
+    label: str
+    values: Tuple[str, ...]
+    where: Optional[str] = None
+
+
+def unpivot_sql(
+    source: str,
+    keys: Sequence[str],
+    columns: Sequence[str],
+    rows: Sequence[UnpivotRow],
+    label: str = "table",
+    distinct: bool = True,
+) -> str:
+    """A SELECT giving one row per source row and attribute
+
+    The source is scanned once, every source row is joined to the VALUES
+    list of its attributes. This replaces a UNION of one SELECT per
+    attribute, which scans the source for every branch. The attributes
+    never produce equal rows as their labels differ, so with distinct only
+    repeated source rows are removed, in a single pass over the result.
+    """
+    values = ",\n        ".join(
+        f"('{row.label}', {', '.join(row.values)},"
+        f" {row.where or f'{row.values[0]} IS NOT NULL'})"
+        for row in rows
+    )
+    return f"""
+    SELECT {'DISTINCT ' if distinct else ''}{', '.join(keys)},
+        {', '.join(f'u.{column}' for column in columns)},
+        u."{label}"
+    FROM {source}
+    CROSS JOIN LATERAL (VALUES
+        {values}
+    ) AS u("{label}", {', '.join(columns)}, keep)
+    WHERE u.keep
+    """
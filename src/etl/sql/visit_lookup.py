@@ -0,0 +1,67 @@
+"""SQL query string definition for the visit lookup"""
+
+from typing import Final
+
+from ..models.lookupmodels import VisitLookup
+from ..models.modelutils import (
+    DIALECT_POSTGRES,
+    analyze_tables_sql,
+    create_tables_sql,
+    drop_tables_sql,
+)
+from ..models.omopcdm54.clinical import VisitOccurrence
+from ..models.source import Patient
+
+
+def _visit_lookup_sql(staged: bool = False) -> str:
+    """Rebuild the visit lookup
+
+    With staged only the visits of the patients in the source tables are
+    included, the visit_occurrence table of a sharded run holding the ones
+    of every shard.
+    """
+    where = (
+        f"""
+WHERE EXISTS (
+    SELECT 1 FROM {str(Patient.__table__)} s
+    WHERE s.{Patient.patient_id.key} = v.{VisitOccurrence.person_id.key}
+)"""
+        if staged
+        else ""
+    )
+    return f"""
+{drop_tables_sql([VisitLookup])}
+{create_tables_sql([VisitLookup], dialect=DIALECT_POSTGRES)}
+
+INSERT INTO {str(VisitLookup.__table__)}
+(
+    {VisitLookup.person_id.key},
+    {VisitLookup.visit_date.key},
+    {VisitLookup.visit_occurrence_id.key}
+)
+SELECT
+    {VisitOccurrence.person_id.key},
+    {VisitOccurrence.visit_start_date.key}::DATE,
+    {VisitOccurrence.visit_occurrence_id.key}
+FROM {str(VisitOccurrence.__table__)} v{where}
+;
+
+{analyze_tables_sql([VisitLookup])}
+
+SELECT COUNT(*) FROM {str(VisitLookup.__table__)};
+""".strip().replace("\n", " ")
+
+
+SQL: Final[str] = _visit_lookup_sql()
+SQL_STAGED: Final[str] = _visit_lookup_sql(staged=True)
+
+
+def visit_join(alias: str, patient_id: str, date_visit: str, join: str = "LEFT") -> str:
+    """Join the visit lookup of a source row as alias
+
+    The cast leaves the lookup side untouched, so the join can use its
+    primary key. It is a no-op for the DATE typed source columns.
+    """
+    return f"""{join} JOIN {str(VisitLookup.__table__)} {alias}
+    ON {alias}.{VisitLookup.person_id.key} = {patient_id}
+        AND {alias}.{VisitLookup.visit_date.key} = {date_visit}::DATE"""
@@ -17,6 +17,7 @@ from ..models.source import (
     Npt,
     Relapses,
 )
+from .person_range import person_range
 
 MODELS: Final[List] = [
     Comorbidities,
@@ -39,7 +40,7 @@ def create_cte():
                     SELECT
                         {m.patient_id.key},
                         (CASE
-                            WHEN cast_date({m.date_visit.key}::VARCHAR) IS NOT NULL THEN {m.date_visit.key}::DATE
+                            WHEN {m.date_visit.key} IS NOT NULL THEN {m.date_visit.key}::DATE
                             ELSE '{DEFAULT_DATE}'::DATE
                         END) AS date_visit
                     FROM {str(m.__table__)}
@@ -94,6 +95,7 @@ SELECT DISTINCT ON (u.patient_id, u.date_visit)
 FROM union_visits u
 INNER JOIN {str(Person.__table__)} p
     ON u.patient_id = p.{Person.person_id.key}
+        AND {person_range(f"p.{Person.person_id.key}")}
 ;
 """
 
@@ -102,7 +104,6 @@ SQL_COUNT: Final[str] = f"""SELECT COUNT(*) FROM {str(VisitOccurrence.__table__)
 _SQL_ENTRIES: Final[List[str]] = [
     SQL_CTE,
     SQL_INSERT,
-    SQL_COUNT,
 ]
 
 
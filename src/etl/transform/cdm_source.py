@@ -5,11 +5,15 @@ import logging
 from sqlalchemy import text
 
 from ..context import ETLContext
+from ..models.omopcdm54.metadata import CDMSource
+from ..models.omopcdm54.vocabulary import Vocabulary
 from ..sql.cdm_source_transform import get_transform_sql
+from ..transform.transformutils import step_tables
 
 logger = logging.getLogger(__name__)
 
 
+@step_tables(reads=[Vocabulary], writes=[CDMSource])
 def transform(ctxt: ETLContext) -> None:
     """CDM Source transform"""
     logger.info("Performing CDM SOURCE transformation...")
@@ -5,20 +5,36 @@ import logging
 from sqlalchemy import text
 
 from ..context import ETLContext
+from ..models.etl_logger import ETLLogger
+from ..models.lookupmodels import CodeLogger, ConceptLookup, VisitLookup
+from ..models.omopcdm54.clinical import ConditionOccurrence, Person
+from ..models.source import DiseaseHistory, Patient, Relapses
 from ..sql.condition_transform import SQL as condition_transform
 from ..transform.etl_logging import (
     CONDITION_OCCURRENCE_LOGGER_DICT,
     log_default_date,
 )
-from ..util.sql import cast_date_format
+from ..transform.transformutils import step_tables
 
 logger = logging.getLogger(__name__)
 
 
+@step_tables(
+    reads=[
+        DiseaseHistory,
+        Relapses,
+        Person,
+        VisitLookup,
+        ConceptLookup,
+        CodeLogger,
+        Patient,
+    ],
+    writes=[ConditionOccurrence],
+    appends=[ETLLogger],
+)
 def transform(ctxt: ETLContext) -> None:
     """Condition Occurrence transformation"""
     with ctxt.transaction() as cnxn:
-        result = cnxn.execute(text(cast_date_format()))
         logger.info("Performing CONDITION OCCURRENCE transformation...")
         result = cnxn.execute(text(condition_transform))
         overview = result.fetchall()
@@ -1,22 +1,120 @@
 """Condition Era transform"""
 
 import logging
+from typing import List, Optional, Sequence
 
+import numpy as np
+import pandas as pd
 from sqlalchemy import text
+from sqlalchemy.engine import Connection
 
 from ..context import ETLContext
+from ..models.lookupmodels import PatientDelta
+from ..models.omopcdm54.clinical import ConditionOccurrence
+from ..models.omopcdm54.standardized_derived_elements import ConditionEra
+from ..models.source import Patient
+from ..sql.condition_era_transform import (
+    CONDITION_INTERVALS,
+    CONDITION_INTERVALS_PERSONS,
+)
 from ..sql.condition_era_transform import SQL as condition_era_transform
+from ..sql.condition_era_transform import SQL_PERSONS
+from ..transform.shards import rebuilt_persons
+from ..transform.transformutils import step_tables
+from ..util.db import WriteMode, df_to_sql
+from ..util.era import era_ids, numpy_eras, read_intervals
 
 logger = logging.getLogger(__name__)
 
 
+def _numpy_transform(
+    cnxn: Connection,
+    person_ids: Optional[List[int]] = None,
+    first_id: int = 1,
+    id_stride: int = 1,
+) -> int:
+    """Build the condition eras with the numpy era engine, giving their count
+
+    With person_ids only the eras of these persons are replaced. The eras
+    are numbered from first_id in steps of id_stride.
+    """
+    params = None if person_ids is None else {"person_ids": person_ids}
+    intervals = read_intervals(
+        cnxn,
+        CONDITION_INTERVALS if params is None else CONDITION_INTERVALS_PERSONS,
+        ["person_id", "condition_concept_id", "era_start", "era_stop"],
+        params=params,
+    )
+    eras = numpy_eras(intervals, keys=["person_id", "condition_concept_id"])
+    if person_ids is None:
+        cnxn.execute(text(f"DELETE FROM {ConditionEra.__table__};"))
+    else:
+        cnxn.execute(
+            text(
+                f"DELETE FROM {ConditionEra.__table__}"
+                f" WHERE {ConditionEra.person_id.key} = ANY(:person_ids);"
+            ),
+            params,
+        )
+    condition_era = pd.DataFrame(
+        {
+            ConditionEra.condition_era_id.key: np.arange(
+                first_id, first_id + id_stride * len(eras), id_stride
+            ),
+            ConditionEra.person_id.key: eras["person_id"],
+            ConditionEra.condition_concept_id.key: eras["condition_concept_id"],
+            ConditionEra.condition_era_start_date.key: eras["era_start"],
+            ConditionEra.condition_era_end_date.key: eras["era_end_date"],
+            ConditionEra.condition_occurrence_count.key: eras["interval_count"],
+        }
+    )
+    df_to_sql(
+        cnxn,
+        condition_era,
+        table=str(ConditionEra.__table__),
+        write_mode=WriteMode.APPEND,
+    )
+    return len(condition_era)
+
+
+@step_tables(reads=[ConditionOccurrence, PatientDelta, Patient], writes=[ConditionEra])
 def transform(ctxt: ETLContext) -> None:
     """Condition Era transforms. It includes Condition Era"""
     with ctxt.transaction() as cnxn:
+        person_ids = rebuilt_persons(ctxt, cnxn)
+        if person_ids is not None:
+            update_persons(ctxt, person_ids)
+            return
         logger.info("Performing CONDITION ERA transformation...")
-        result = cnxn.execute(text(condition_era_transform))
-        overview = result.fetchall()
+        if ctxt.config.era_engine == "numpy":
+            count = _numpy_transform(cnxn)
+        else:
+            result = cnxn.execute(text(condition_era_transform))
+            count = result.fetchall()[0][0]
         logger.info(
             "CONDITION ERA Transformation Complete! %s Condition Era(s) included",
-            overview[0][0],
+            count,
+        )
+
+
+def update_persons(ctxt: ETLContext, person_ids: Sequence[int]) -> None:
+    """Recompute the condition eras of the given persons only"""
+    with ctxt.transaction() as cnxn:
+        ids = era_ids(
+            cnxn,
+            ConditionEra.condition_era_id,
+            shard=ctxt.shard,
+            shards=ctxt.config.shards,
+        )
+        if ctxt.config.era_engine == "numpy":
+            count = _numpy_transform(cnxn, list(person_ids), **ids)
+        else:
+            result = cnxn.execute(
+                text(SQL_PERSONS), {"person_ids": list(person_ids), **ids}
+            )
+            count = result.fetchall()[0][0]
+        logger.info(
+            "%s condition era(s) of %s person(s) rebuilt",
+            count,
+            len(person_ids),
         )
@@ -1,34 +1,85 @@
 """Create the tables needed for the ETL"""
 
 import logging
+from functools import partial
+from typing import Any, Dict
 
 from sqlalchemy import text
+from sqlalchemy.engine import Connection
 
 from ..context import ETLContext
 from ..models.lookupmodels import CodeLogger, ConceptLookup
-from ..sql.create_lookup_tables import SQL
-from ..util.db import df_to_sql
+from ..sql.create_lookup_tables import SQL, SQL_ANALYZE
+from ..transform.transformutils import CTXT_LOOKUPS, step_tables
+from ..util.db import CopyFormat, WriteMode, df_to_sql
+from ..util.staging import parallel_load
 
 logger = logging.getLogger(__name__)
 
 
+def _load_lookup_table(
+    *,
+    ctxt: ETLContext,
+    cnxn: Connection,
+    model: Any,
+    target: Any,
+    copy_options: Dict[str, Any],
+) -> None:
+    """Copy the data of a lookup model into the table of target"""
+    lookup_table = ctxt.lookups[model.__tablename__]
+    df_to_sql(
+        cnxn=cnxn,
+        dataframe=lookup_table,
+        table=str(target.__table__),
+        columns=lookup_table.columns,
+        table_def=target.__table__,
+        **copy_options,
+    )
+
+
+@step_tables(reads=[CTXT_LOOKUPS], writes=[ConceptLookup, CodeLogger])
 def transform(ctxt: ETLContext) -> None:
     """Create lookup tables"""
     logger.info("Creating LOOK UP tables in DB... ")
+    bulk_load = ctxt.config.bulk_load
+    copy_options: Dict[str, Any] = {
+        "copy_format": (
+            CopyFormat.BINARY if ctxt.config.copy_format == "binary" else CopyFormat.CSV
+        ),
+        # the tables are recreated in the same transaction as the copy
+        "write_mode": WriteMode.TRUNCATE if bulk_load else WriteMode.OVERWRITE,
+        "freeze": bulk_load,
+    }
     with ctxt.transaction() as cnxn:
-        cnxn.execute(text(SQL))
-        concept_lookup = ctxt.lookups[ConceptLookup.__tablename__]
-        df_to_sql(
-            cnxn=cnxn,
-            dataframe=concept_lookup,
-            table=str(ConceptLookup.__table__),
-            columns=concept_lookup.columns,
-        )
-        code_logger = ctxt.lookups[CodeLogger.__tablename__]
-        df_to_sql(
-            cnxn=cnxn,
-            dataframe=code_logger,
-            table=str(CodeLogger.__table__),
-            columns=code_logger.columns,
-        )
+        if ctxt.config.copy_workers > 1:
+            jobs = [
+                (
+                    model,
+                    partial(
+                        _load_lookup_table,
+                        ctxt=ctxt,
+                        model=model,
+                        copy_options=dict(copy_options, write_mode=WriteMode.APPEND),
+                    ),
+                )
+                for model in (ConceptLookup, CodeLogger)
+            ]
+            parallel_load(
+                cnxn,
+                "lookup",
+                jobs,
+                workers=ctxt.config.copy_workers,
+            )
+        else:
+            cnxn.execute(text(SQL))
+            for model in (ConceptLookup, CodeLogger):
+                _load_lookup_table(
+                    ctxt=ctxt,
+                    cnxn=cnxn,
+                    model=model,
+                    target=model,
+                    copy_options=copy_options,
+                )
+        if bulk_load:
+            cnxn.execute(text(SQL_ANALYZE))
         logger.info("LOOK UP tables created successfully!")
@@ -3,14 +3,22 @@
 import logging
 
 from ..context import ETLContext
-from ..sql.create_omopcdm_tables import SQL
-from ..transform.transformutils import execute_sql_transform
+from ..models.etl_logger import ETLPatientState
+from ..sql.create_omopcdm_tables import MODELS, SQL, SQL_CREATE
+from ..transform.patient_delta import has_patient_state
+from ..transform.transformutils import execute_sql_transform, step_tables
 
 logger = logging.getLogger(__name__)
 
 
+@step_tables(reads=[ETLPatientState], writes=MODELS)
 def transform(ctxt: ETLContext) -> None:
     """Create the OMOP CDM tables"""
+    with ctxt.transaction() as cnxn:
+        if ctxt.config.incremental and has_patient_state(cnxn):
+            logger.info("Keeping the OMOP CDM tables of the last run")
+            execute_sql_transform(ctxt, SQL_CREATE)
+            return
     logger.info("Creating OMOP CDM tables in DB... ")
     execute_sql_transform(ctxt, SQL)
     logger.info("OMOP CDM tables created successfully!")
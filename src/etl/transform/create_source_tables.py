@@ -1,10 +1,14 @@
 """Create the tables with source data"""
 
 import logging
-from typing import Final, List
+from functools import partial
+from typing import Any, Dict, Final, List
+
+from sqlalchemy.engine import Connection
 
 from ..context import ETLContext
 from ..models.source import (
+    SOURCE_SCHEMA,
     Comorbidities,
     DiseaseHistory,
     DiseaseStatus,
@@ -15,9 +19,21 @@ from ..models.source import (
     Relapses,
     Symptom,
 )
-from ..sql.create_source_tables import SQL
-from ..transform.transformutils import execute_sql_transform
-from ..util.db import df_to_sql
+from ..sql.create_source_tables import (
+    SQL,
+    SQL_ANALYZE,
+    SQL_BULK,
+    SQL_CREATE_SCHEMA,
+)
+from ..transform.preprocessing import log_missing_columns, preprocess_source
+from ..transform.transformutils import (
+    CTXT_SOURCES,
+    execute_sql_transform,
+    step_tables,
+)
+from ..util.db import CopyFormat, WriteMode, df_to_sql
+from ..util.exceptions import TransformationErrorException
+from ..util.staging import parallel_load
 
 logger = logging.getLogger(__name__)
 
@@ -34,18 +50,114 @@ MODELS: Final[List] = [
 ]
 
 
+def _stream_source_table(
+    ctxt: ETLContext,
+    cnxn: Connection,
+    model: Any,
+    target: Any,
+    copy_options: Dict[str, Any],
+) -> None:
+    """Copy a source file chunk by chunk, preprocessing each chunk on the way"""
+    tablename = model.__tablename__
+    if ctxt.source_loader is None:
+        raise TransformationErrorException(
+            f"{tablename}: streaming the source files needs a source loader"
+        )
+    chunks = ctxt.source_loader.iter_chunks(model, ctxt.config.chunksize)
+    rows = 0
+    for i, chunk in enumerate(chunks):
+        chunk = preprocess_source(tablename, chunk)
+        if i == 0:
+            log_missing_columns(tablename, chunk)
+        df_to_sql(
+            cnxn=cnxn,
+            dataframe=chunk,
+            table=str(target.__table__),
+            columns=chunk.columns,
+            write_mode=WriteMode.APPEND,
+            table_def=target.__table__,
+            **copy_options,
+        )
+        rows += len(chunk)
+        logger.debug("%s: %s rows copied", tablename, rows)
+
+
+def _load_source_table(
+    *,
+    ctxt: ETLContext,
+    cnxn: Connection,
+    model: Any,
+    target: Any,
+    write_mode: WriteMode,
+    copy_options: Dict[str, Any],
+) -> None:
+    """Copy the data of a source model into the table of target"""
+    logger.info("Creating %s table in DB... ", model.__tablename__)
+    if ctxt.config.chunksize:
+        _stream_source_table(ctxt, cnxn, model, target, copy_options)
+    else:
+        source_table = ctxt.sources[model.__tablename__]
+        df_to_sql(
+            cnxn=cnxn,
+            dataframe=source_table,
+            table=str(target.__table__),
+            columns=source_table.columns,
+            write_mode=write_mode,
+            table_def=target.__table__,
+            **copy_options,
+        )
+    logger.info("%s table created successfully ", model.__tablename__)
+
+
+@step_tables(reads=[CTXT_SOURCES], writes=MODELS)
 def transform(ctxt: ETLContext) -> None:
     """Create source tables"""
-    execute_sql_transform(ctxt, SQL)
+    bulk_load = ctxt.config.bulk_load
+    copy_options: Dict[str, Any] = {
+        "copy_format": (
+            CopyFormat.BINARY if ctxt.config.copy_format == "binary" else CopyFormat.CSV
+        ),
+        # the tables are (re)created in the same transaction as the copy
+        "freeze": bulk_load,
+    }
     with ctxt.transaction() as cnxn:
-        for model in MODELS:
-            logger.info("Creating %s table in DB... ", model.__tablename__)
-            source_table = ctxt.sources[model.__tablename__]
-            df_to_sql(
-                cnxn=cnxn,
-                dataframe=source_table,
-                table=str(model.__table__),
-                columns=source_table.columns,
+        if ctxt.config.copy_workers > 1:
+            # staged tables are created empty by the worker that fills them
+            jobs = [
+                (
+                    model,
+                    partial(
+                        _load_source_table,
+                        ctxt=ctxt,
+                        model=model,
+                        write_mode=WriteMode.APPEND,
+                        copy_options=copy_options,
+                    ),
+                )
+                for model in MODELS
+            ]
+            execute_sql_transform(ctxt, SQL_CREATE_SCHEMA)
+            # named after the source schema, every shard stages its own
+            parallel_load(
+                cnxn,
+                SOURCE_SCHEMA,
+                jobs,
+                workers=ctxt.config.copy_workers,
+                unlogged=bulk_load,
             )
-            logger.info("%s table created successfully ", model.__tablename__)
+        else:
+            execute_sql_transform(ctxt, SQL_BULK if bulk_load else SQL)
+            for model in MODELS:
+                _load_source_table(
+                    ctxt=ctxt,
+                    cnxn=cnxn,
+                    model=model,
+                    target=model,
+                    write_mode=(
+                        WriteMode.TRUNCATE if bulk_load else WriteMode.OVERWRITE
+                    ),
+                    copy_options=copy_options,
+                )
+        if bulk_load:
+            execute_sql_transform(ctxt, SQL_ANALYZE)
     logger.info("All SOURCE tables created successfully!")
@@ -1,22 +1,123 @@
 """Drug Era transform"""
 
 import logging
+from typing import List, Optional, Sequence
 
+import numpy as np
+import pandas as pd
 from sqlalchemy import text
+from sqlalchemy.engine import Connection
 
+from ..common import ERA_GAP_DAYS
 from ..context import ETLContext
+from ..models.lookupmodels import DrugIngredientMap, PatientDelta
+from ..models.omopcdm54.clinical import DrugExposure
+from ..models.omopcdm54.standardized_derived_elements import DrugEra
+from ..models.source import Patient
+from ..sql.drug_era_transform import DRUG_INTERVALS, DRUG_INTERVALS_PERSONS
 from ..sql.drug_era_transform import SQL as drug_era_transform
+from ..sql.drug_era_transform import SQL_PERSONS
+from ..transform.shards import rebuilt_persons
+from ..transform.transformutils import step_tables
+from ..util.db import WriteMode, df_to_sql
+from ..util.era import era_ids, numpy_eras, read_intervals
 
 logger = logging.getLogger(__name__)
 
 
+def _numpy_transform(
+    cnxn: Connection,
+    person_ids: Optional[List[int]] = None,
+    first_id: int = 1,
+    id_stride: int = 1,
+) -> int:
+    """Build the drug eras with the numpy era engine, giving their count
+
+    With person_ids only the eras of these persons are replaced. The eras
+    are numbered from first_id in steps of id_stride.
+    """
+    params = None if person_ids is None else {"person_ids": person_ids}
+    intervals = read_intervals(
+        cnxn,
+        DRUG_INTERVALS if params is None else DRUG_INTERVALS_PERSONS,
+        [
+            "person_id",
+            "ingredient_concept_id",
+            "drug_type_concept_id",
+            "era_start",
+            "era_stop",
+        ],
+        params=params,
+    )
+    eras = numpy_eras(
+        intervals,
+        keys=["person_id", "ingredient_concept_id"],
+        columns=["drug_type_concept_id"],
+    )
+    if person_ids is None:
+        cnxn.execute(text(f"DELETE FROM {DrugEra.__table__};"))
+    else:
+        cnxn.execute(
+            text(
+                f"DELETE FROM {DrugEra.__table__}"
+                f" WHERE {DrugEra.person_id.key} = ANY(:person_ids);"
+            ),
+            params,
+        )
+    drug_era = pd.DataFrame(
+        {
+            DrugEra.drug_era_id.key: np.arange(
+                first_id, first_id + id_stride * len(eras), id_stride
+            ),
+            DrugEra.person_id.key: eras["person_id"],
+            DrugEra.drug_concept_id.key: eras["ingredient_concept_id"],
+            DrugEra.drug_era_start_date.key: eras["era_start"],
+            DrugEra.drug_era_end_date.key: eras["era_end_date"],
+            DrugEra.drug_exposure_count.key: eras["interval_count"],
+            DrugEra.gap_days.key: ERA_GAP_DAYS,
+        }
+    )
+    df_to_sql(cnxn, drug_era, table=str(DrugEra.__table__), write_mode=WriteMode.APPEND)
+    return len(drug_era)
+
+
+@step_tables(
+    reads=[DrugExposure, DrugIngredientMap, PatientDelta, Patient],
+    writes=[DrugEra],
+)
 def transform(ctxt: ETLContext) -> None:
     """Drug Era transforms. It includes Drug Era"""
     with ctxt.transaction() as cnxn:
+        person_ids = rebuilt_persons(ctxt, cnxn)
+        if person_ids is not None:
+            update_persons(ctxt, person_ids)
+            return
         logger.info("Performing DRUG ERA transformation...")
-        result = cnxn.execute(text(drug_era_transform))
-        overview = result.fetchall()
+        if ctxt.config.era_engine == "numpy":
+            count = _numpy_transform(cnxn)
+        else:
+            result = cnxn.execute(text(drug_era_transform))
+            count = result.fetchall()[0][0]
         logger.info(
             "DRUG ERA Transformation Complete! %s Drug Era(s) included",
-            overview[0][0],
+            count,
+        )
+
+
+def update_persons(ctxt: ETLContext, person_ids: Sequence[int]) -> None:
+    """Recompute the drug eras of the given persons only"""
+    with ctxt.transaction() as cnxn:
+        ids = era_ids(
+            cnxn,
+            DrugEra.drug_era_id,
+            shard=ctxt.shard,
+            shards=ctxt.config.shards,
         )
+        if ctxt.config.era_engine == "numpy":
+            count = _numpy_transform(cnxn, list(person_ids), **ids)
+        else:
+            result = cnxn.execute(
+                text(SQL_PERSONS), {"person_ids": list(person_ids), **ids}
+            )
+            count = result.fetchall()[0][0]
+        logger.info("%s drug era(s) of %s person(s) rebuilt", count, len(person_ids))
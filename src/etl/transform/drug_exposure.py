@@ -5,17 +5,25 @@ import logging
 from sqlalchemy import text
 
 from ..context import ETLContext
+from ..models.etl_logger import ETLLogger
+from ..models.lookupmodels import CodeLogger, ConceptLookup, VisitLookup
+from ..models.omopcdm54.clinical import DrugExposure, Person
+from ..models.source import Dmt
 from ..sql.drug_exposure_transform import SQL as drug_exposure_transform
 from ..transform.etl_logging import DRUG_EXPOSURE_LOGGER_DICT, log_default_date
-from ..util.sql import cast_date_format
+from ..transform.transformutils import step_tables
 
 logger = logging.getLogger(__name__)
 
 
+@step_tables(
+    reads=[Dmt, Person, VisitLookup, ConceptLookup, CodeLogger],
+    writes=[DrugExposure],
+    appends=[ETLLogger],
+)
 def transform(ctxt: ETLContext) -> None:
     """Drug Exposure transforms"""
     with ctxt.transaction() as cnxn:
-        result = cnxn.execute(text(cast_date_format()))
         logger.info("Performing DRUG EXPOSURE transformation...")
         result = cnxn.execute(text(drug_exposure_transform))
         overview = result.fetchall()
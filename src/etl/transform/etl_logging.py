@@ -1,7 +1,7 @@
 """Log dropped patients to ETL Logger"""
 
 import logging
-from typing import Dict, Final
+from typing import Any, Dict, Final, Iterable, List, NamedTuple, Optional, Tuple
 
 from ..context import ETLContext
 from ..models.etl_logger import ETLLogger
@@ -27,14 +27,65 @@ from ..models.source import (
     Symptom,
 )
 from ..transform.transformutils import execute_sql_transform
-from ..util.sql import cast_date_format
 
 logger = logging.getLogger(__name__)
 
 
-def _log_errors_sql(
-    patient_id_col, omop_table, source_table, error_code, join="", where=""
-) -> str:
+class LogRule(NamedTuple):
+    """One error logged into the ETL Logger
+
+    The rows of source_table, joined with join, for which condition holds
+    are logged with error_code against omop_table. patient_id is the
+    patient column, by default the one of source_table.
+    """
+
+    omop_table: Any
+    source_table: Any
+    error_code: int
+    condition: str
+    join: str = ""
+    patient_id: Optional[str] = None
+
+
+def _log_rules_sql(rules: Iterable[LogRule]) -> str:
+    """A single insert logging the rows matching any of the rules
+
+    Rules on the same source table share one scan of it: every source row
+    is joined to the VALUES list of the rules, each with its condition, and
+    only the matching ones are kept. The rows are inserted rule by rule,
+    each in the order of its source table, so they get the ids one insert
+    per rule gave them.
+    """
+    scans: Dict[Tuple[Any, str, str], List[Tuple[int, LogRule]]] = {}
+    for index, rule in enumerate(rules):
+        patient_id = rule.patient_id or rule.source_table.patient_id.key
+        scans.setdefault((rule.source_table, rule.join, patient_id), []).append(
+            (index, rule)
+        )
+    selects = []
+    for (source_table, join, patient_id), scan_rules in scans.items():
+        values = ",\n                ".join(
+            f"({index}, '{rule.omop_table.__tablename__}', {rule.error_code},"
+            f" {rule.condition})"
+            for index, rule in scan_rules
+        )
+        selects.append(
+            f"""
+            SELECT
+                {patient_id} AS patient_id,
+                r.omop_table_name,
+                '{source_table.__tablename__}' AS source_table_name,
+                r.error_code_id,
+                r.rule_index,
+                {str(source_table.__table__)}.ctid AS source_row
+            FROM {str(source_table.__table__)}
+            {join}
+            CROSS JOIN LATERAL (VALUES
+                {values}
+            ) AS r(rule_index, omop_table_name, error_code_id, hit)
+            WHERE r.hit"""
+        )
+    union = "\n            UNION ALL".join(selects)
     return f"""
             INSERT INTO {str(ETLLogger.__table__)}
             (
@@ -46,105 +97,100 @@ def _log_errors_sql(
                 {ETLLogger.error_code_level.key}
             )
             SELECT
-                {patient_id_col},
-                '{omop_table.__tablename__}',
-                '{source_table.__tablename__}',
-                {error_code},
-                {CodeLogger.error_code_description.key},
-                {CodeLogger.error_code_level.key}
-            FROM {str(source_table.__table__)}
-            {join}
-            LEFT JOIN {str(CodeLogger.__table__)}
-                ON {CodeLogger.error_code_id.key} = {error_code}
-            {where}
+                e.patient_id,
+                e.omop_table_name,
+                e.source_table_name,
+                e.error_code_id,
+                c.{CodeLogger.error_code_description.key},
+                c.{CodeLogger.error_code_level.key}
+            FROM ({union}
+            ) e
+            LEFT JOIN {str(CodeLogger.__table__)} c
+                ON c.{CodeLogger.error_code_id.key} = e.error_code_id
+            ORDER BY e.rule_index, e.source_row
         """
 
 
-def _log_default_date(model, omop_table, where) -> str:
-    return _log_errors_sql(model.patient_id.key, omop_table, model, 4, "", where)
+def _default_date_rule(model, omop_table, condition: str) -> LogRule:
+    return LogRule(omop_table, model, 4, condition)
 
 
-PATIENT_LOGGER_DICT = {
-    "Logging patients with missing or incorrectly formatted DOB": [
-        Patient.patient_id.key,
+PATIENT_LOGGER_DICT: Final[Dict[str, LogRule]] = {
+    "Logging patients with missing or incorrectly formatted DOB": LogRule(
         Person,
         Patient,
         1,
-        "",
-        f"WHERE cast_date({Patient.date_birth.key}::VARCHAR) IS NULL",
-    ],
-    "Logging patients without a (correctly formatted) gender variable": [
-        DiseaseHistory.patient_id.key,
+        f"{Patient.date_birth.key} IS NULL",
+    ),
+    "Logging patients without a (correctly formatted) gender variable": LogRule(
         Person,
         Patient,
         2,
-        "",
-        f"WHERE {Patient.sex.key} NOT IN ('female', 'male');",
-    ],
-    "Logging patients without a (correctly formatted) date of diagnosis or date of onset": [
-        DiseaseHistory.patient_id.key,
+        f"{Patient.sex.key} NOT IN ('female', 'male')",
+    ),
+    "Logging patients without a (correctly formatted) date of diagnosis or date of onset": LogRule(
         Person,
         DiseaseHistory,
         3,
-        f"""LEFT JOIN {str(Person.__table__)} ON {DiseaseHistory.patient_id.key} = {Person.person_id.key}""",
-        f"""WHERE {Person.person_id.key} IS NULL
-            AND cast_date({DiseaseHistory.date_diagnosis.key}::VARCHAR) IS NULL
-            AND cast_date({DiseaseHistory.date_onset.key}::VARCHAR) IS NULL""",
-    ],
-    "Logging patients without an entry in the Disease History table": [
-        f"patient.{Patient.patient_id.key}",
+        f"""{Person.person_id.key} IS NULL
+            AND {DiseaseHistory.date_diagnosis.key} IS NULL
+            AND {DiseaseHistory.date_onset.key} IS NULL""",
+        join=f"""LEFT JOIN {str(Person.__table__)} ON {DiseaseHistory.patient_id.key} = {Person.person_id.key}""",
+    ),
+    "Logging patients without an entry in the Disease History table": LogRule(
         Person,
         Patient,
         6,
-        f"""LEFT JOIN {str(DiseaseHistory.__table__)} d
+        f"""d.{DiseaseHistory.patient_id.key} IS NULL""",
+        join=f"""LEFT JOIN {str(DiseaseHistory.__table__)} d
             ON patient.{Patient.patient_id.key} = d.{DiseaseHistory.patient_id.key}""",
-        f"""WHERE d.{DiseaseHistory.patient_id.key} IS NULL""",
-    ],
+        patient_id=f"patient.{Patient.patient_id.key}",
+    ),
 }
 
-DRUG_EXPOSURE_LOGGER_DICT: Final[Dict] = {
-    "drug_exposure_start_date": [
+DRUG_EXPOSURE_LOGGER_DICT: Final[Dict[str, LogRule]] = {
+    "drug_exposure_start_date": _default_date_rule(
         Dmt,
         DrugExposure,
-        f"WHERE cast_date({Dmt.dmt_start.key}::VARCHAR) IS NULL",
-    ],
-    "drug_exposure_end_date|stop_key": [
+        f"{Dmt.dmt_start.key} IS NULL",
+    ),
+    "drug_exposure_end_date|stop_key": _default_date_rule(
         Dmt,
         DrugExposure,
-        f"WHERE {Dmt.dmt_stop.key} IS NOT NULL AND cast_date({Dmt.dmt_stop.key}::VARCHAR) IS NULL",
-    ],
-    "drug_exposure_end_date|dmt_status=yes": [
+        f"{Dmt.dmt_stop_valid.key} IS FALSE",
+    ),
+    "drug_exposure_end_date|dmt_status=yes": _default_date_rule(
         Dmt,
         DrugExposure,
-        f"WHERE {Dmt.dmt_status.key} = 'yes' AND cast_date({Dmt.date_visit.key}::VARCHAR) IS NULL",
-    ],
-    "drug_exposure_end_date|dmt_status=no": [
+        f"{Dmt.dmt_status.key} = 'yes' AND {Dmt.date_visit.key} IS NULL",
+    ),
+    "drug_exposure_end_date|dmt_status=no": _default_date_rule(
         Dmt,
         DrugExposure,
-        f"WHERE {Dmt.dmt_status.key} = 'no' AND cast_date({Dmt.dmt_stop.key}::VARCHAR) IS NULL",
-    ],
+        f"{Dmt.dmt_status.key} = 'no' AND {Dmt.dmt_stop.key} IS NULL",
+    ),
 }
 
 
-CONDITION_OCCURRENCE_LOGGER_DICT: Final[Dict] = {
-    "condition_occurrence_start_date|relapses": [
+CONDITION_OCCURRENCE_LOGGER_DICT: Final[Dict[str, LogRule]] = {
+    "condition_occurrence_start_date|relapses": _default_date_rule(
         Relapses,
         ConditionOccurrence,
-        f"WHERE cast_date({Relapses.date_relapse.key}::VARCHAR) IS NULL",
-    ],
-    "condition_occurrence_start_date|disease_history": [
+        f"{Relapses.date_relapse.key} IS NULL",
+    ),
+    "condition_occurrence_start_date|disease_history": _default_date_rule(
         DiseaseHistory,
         ConditionOccurrence,
-        f"WHERE cast_date({DiseaseHistory.date_visit.key}::VARCHAR) IS NULL",
-    ],
+        f"{DiseaseHistory.date_visit.key} IS NULL",
+    ),
 }
 
-OBSERVATION_LOGGER_DICT: Final[Dict] = {
-    f"observation_date|{model.__tablename__}": [
+OBSERVATION_LOGGER_DICT: Final[Dict[str, LogRule]] = {
+    f"observation_date|{model.__tablename__}": _default_date_rule(
         model,
         Observation,
-        f"WHERE cast_date({model.date_visit.key}::VARCHAR) IS NULL",
-    ]
+        f"{model.date_visit.key} IS NULL",
+    )
     for model in [
         Comorbidities,
         DiseaseHistory,
@@ -158,17 +204,17 @@ OBSERVATION_LOGGER_DICT: Final[Dict] = {
     ]
 }
 
-MEASUREMENT_LOGGER_DICT: Final[Dict] = {
-    f"date_diagnosis|{DiseaseHistory.__tablename__}": [
+MEASUREMENT_LOGGER_DICT: Final[Dict[str, LogRule]] = {
+    f"date_diagnosis|{DiseaseHistory.__tablename__}": _default_date_rule(
         DiseaseHistory,
         Measurement,
-        f"""WHERE cast_date({DiseaseHistory.date_diagnosis.key}::VARCHAR) IS NULL
+        f"""{DiseaseHistory.date_diagnosis.key} IS NULL
             AND {DiseaseHistory.csf_olib.key} IS NOT NULL""",
-    ],
-    f"date_visit|{DiseaseStatus.__tablename__}": [
+    ),
+    f"date_visit|{DiseaseStatus.__tablename__}": _default_date_rule(
         DiseaseStatus,
         Measurement,
-        f"""WHERE cast_date({DiseaseStatus.date_visit.key}::VARCHAR) IS NULL
+        f"""{DiseaseStatus.date_visit.key} IS NULL
             AND (
                 {DiseaseStatus.edss_score.key} IS NOT NULL
                 OR {DiseaseStatus.pdds_score.key} IS NOT NULL
@@ -178,84 +224,86 @@ MEASUREMENT_LOGGER_DICT: Final[Dict] = {
                 OR {DiseaseStatus.vib_sense.key} IS NOT NULL
                 OR {DiseaseStatus.sdmt.key} IS NOT NULL
             )""",
-    ],
+    ),
 }
 
 
-PROCEDURE_LOGGER_DICT: Final[Dict] = {
-    f"mri_date|{Mri.__tablename__}": [
+PROCEDURE_LOGGER_DICT: Final[Dict[str, LogRule]] = {
+    f"mri_date|{Mri.__tablename__}": _default_date_rule(
         Mri,
         ProcedureOccurrence,
-        f"""WHERE cast_date({Mri.mri_date.key}::VARCHAR) IS NULL
+        f"""{Mri.mri_date.key} IS NULL
                 AND ({Mri.mri.key} = 'yes'
                 OR ({Mri.mri.key} = 'no' AND {Mri.mri_region.key} IS NOT NULL)
                 OR ({Mri.mri.key} IS NULL AND {Mri.mri_region.key} IS NOT NULL))""",
-    ],
-    f"date_visit, dmt_stop|{Dmt.__tablename__}": [
+    ),
+    f"date_visit, dmt_stop|{Dmt.__tablename__}": _default_date_rule(
         Dmt,
         ProcedureOccurrence,
-        f"""WHERE ({Dmt.dmt_status.key} ='yes' AND {Dmt.dmt_stop.key} IS NULL
-                AND cast_date({Dmt.date_visit.key}::VARCHAR) IS NULL)
-                OR ({Dmt.dmt_stop.key} IS NOT NULL
-                    AND cast_date({Dmt.dmt_stop.key}::VARCHAR) IS NULL)
+        f"""({Dmt.dmt_status.key} ='yes' AND {Dmt.dmt_stop.key} IS NULL
+                AND {Dmt.date_visit.key} IS NULL)
+                OR {Dmt.dmt_stop_valid.key} IS FALSE
                 OR ({Dmt.dmt_status.key} !='yes' AND {Dmt.dmt_stop.key} IS NULL)
         """,
-    ],
+    ),
 }
 
 
-def log_errors(ctxt: ETLContext, logger_dict: dict) -> None:
-    """Log all dropped rows into the ETL Logger"""
-    execute_sql_transform(ctxt, cast_date_format())
-    for log_message, args in logger_dict.items():
+def invalid_mri_records_rule(table) -> LogRule:
+    """The rule logging the mri records without an mri against table"""
+    return LogRule(
+        table,
+        Mri,
+        5,
+        f"""({Mri.mri.key} IS NULL OR {Mri.mri.key} = 'no')
+            AND (
+                {Mri.mri_new_les_t1.key} IS NOT NULL
+                OR
+                {Mri.mri_new_les_t2.key} IS NOT NULL
+                OR
+                {Mri.mri_gd_les.key} IS NOT NULL
+            )
+        """,
+    )
+
+
+def log_errors(ctxt: ETLContext, logger_dict: Dict[str, LogRule]) -> None:
+    """Log all dropped rows into the ETL Logger, in a single insert"""
+    for log_message in logger_dict:
         logger.info(log_message)
-        execute_sql_transform(ctxt, _log_errors_sql(*args))
+    execute_sql_transform(ctxt, _log_rules_sql(logger_dict.values()))
 
 
-def log_default_date(ctxt: ETLContext, logger_dict: dict) -> None:
-    """Log all rows with default dates into the ETL Logger"""
-    execute_sql_transform(ctxt, cast_date_format())
-    for log_message, args in logger_dict.items():
+def log_default_date(
+    ctxt: ETLContext,
+    logger_dict: Dict[str, LogRule],
+    invalid_mri_table: Optional[Any] = None,
+) -> None:
+    """Log all rows with default dates into the ETL Logger
+
+    With invalid_mri_table the invalid mri records are logged against it in
+    the same insert.
+    """
+    rules = list(logger_dict.values())
+    for log_message in logger_dict:
         logger.info("Logging rows with default date: %s", log_message)
-        execute_sql_transform(ctxt, _log_default_date(*args))
+    if invalid_mri_table is not None:
+        logger.info("Logging rows with invalid mri records")
+        rules.append(invalid_mri_records_rule(invalid_mri_table))
+    execute_sql_transform(ctxt, _log_rules_sql(rules))
 
 
 def log_default_visit_date(ctxt: ETLContext, models: list) -> None:
     """Log all rows with default date_visit into the ETL Logger"""
-    execute_sql_transform(ctxt, cast_date_format())
     logger.info(
         "Logging patients with missing or incorrectly formatted date: visit_start_date"
     )
-    for model in models:
-        execute_sql_transform(
-            ctxt,
-            _log_default_date(
-                model=model,
-                omop_table=VisitOccurrence,
-                where=f"WHERE cast_date({model.date_visit.key}::VARCHAR) IS NULL",
-            ),
-        )
-
-
-def log_invalid_mri_records(ctxt: ETLContext, table) -> None:
-    """Log all rows with invalid mri records into the ETL Logger"""
-    logger.info("Logging rows with invalid mri records")
     execute_sql_transform(
         ctxt,
-        _log_errors_sql(
-            Mri.patient_id.key,
-            table,
-            Mri,
-            5,
-            where=f"""
-        WHERE ({Mri.mri.key} IS NULL OR {Mri.mri.key} = 'no')
-            AND (
-                {Mri.mri_new_les_t1.key} IS NOT NULL
-                OR
-                {Mri.mri_new_les_t2.key} IS NOT NULL
-                OR
-                {Mri.mri_gd_les.key} IS NOT NULL
+        _log_rules_sql(
+            _default_date_rule(
+                model, VisitOccurrence, f"{model.date_visit.key} IS NULL"
             )
-        """,
+            for model in models
         ),
     )
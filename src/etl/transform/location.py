@@ -5,11 +5,16 @@ import logging
 from sqlalchemy import text
 
 from ..context import ETLContext
+from ..models.lookupmodels import ConceptLookup
+from ..models.omopcdm54.health_systems import Location
+from ..models.source import Patient
 from ..sql.location_transform import SQL as location_transform
+from ..transform.transformutils import step_tables
 
 logger = logging.getLogger(__name__)
 
 
+@step_tables(reads=[Patient, ConceptLookup], writes=[Location])
 def transform(ctxt: ETLContext) -> None:
     """Location transform"""
     logger.info("Performing LOCATION transformation...")
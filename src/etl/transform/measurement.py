@@ -5,30 +5,36 @@ import logging
 from sqlalchemy import text
 
 from ..context import ETLContext
-from ..sql.measurement_transform import SQL_ENTRIES
+from ..models.etl_logger import ETLLogger
+from ..models.lookupmodels import CodeLogger
+from ..models.omopcdm54.clinical import Measurement, Observation, Person
+from ..models.source import DiseaseHistory, DiseaseStatus
+from ..sql.measurement_transform import SQL_COUNT, SQL_ENTRIES
 from ..transform.etl_logging import MEASUREMENT_LOGGER_DICT, log_default_date
-from ..util.sql import cast_date_format
+from ..transform.transformutils import execute_sql_partitioned, step_tables
 
 logger = logging.getLogger(__name__)
 
 
+@step_tables(
+    reads=[DiseaseHistory, DiseaseStatus, Person, Observation, CodeLogger],
+    writes=[Measurement],
+    appends=[ETLLogger],
+)
 def transform(ctxt: ETLContext) -> None:
     """Measurement transform"""
     with ctxt.transaction() as cnxn:
-        result = cnxn.execute(text(cast_date_format()))
         logger.info("Performing MEASUREMENT transformation...")
-        current_total = 0
         for source, query in SQL_ENTRIES.items():
-            result = cnxn.execute(text(query))
-            overview = result.fetchall()
             logger.info(
                 "%s Transformation Complete! %s Measurement(s) included",
                 source,
-                (
-                    overview[0][0]
-                    if source == "MEASUREMENT"
-                    else overview[0][0] - current_total
-                ),
+                execute_sql_partitioned(ctxt, query),
             )
-            current_total = overview[0][0]
+        result = cnxn.execute(text(SQL_COUNT))
+        overview = result.fetchall()
+        logger.info(
+            "MEASUREMENT Transformation Complete! %s Measurement(s) included",
+            overview[0][0],
+        )
         log_default_date(ctxt, MEASUREMENT_LOGGER_DICT)
@@ -5,36 +5,37 @@ import logging
 from sqlalchemy import text
 
 from ..context import ETLContext
-from ..models.omopcdm54.clinical import Observation
-from ..sql.observation_transform import SQL_ENTRIES
-from ..transform.etl_logging import (
-    OBSERVATION_LOGGER_DICT,
-    log_default_date,
-    log_invalid_mri_records,
-)
-from ..util.sql import cast_date_format
+from ..models.etl_logger import ETLLogger
+from ..models.lookupmodels import CodeLogger, ConceptLookup, VisitLookup
+from ..models.omopcdm54.clinical import Observation, Person
+from ..models.source import SOURCE_MODELS
+from ..sql.observation_transform import SQL_COUNT, SQL_ENTRIES
+from ..transform.etl_logging import OBSERVATION_LOGGER_DICT, log_default_date
+from ..transform.transformutils import execute_sql_partitioned, step_tables
 
 logger = logging.getLogger(__name__)
 
 
+@step_tables(
+    reads=list(SOURCE_MODELS.values())
+    + [Person, VisitLookup, ConceptLookup, CodeLogger],
+    writes=[Observation],
+    appends=[ETLLogger],
+)
 def transform(ctxt: ETLContext) -> None:
     """Observation transformation"""
     with ctxt.transaction() as cnxn:
-        result = cnxn.execute(text(cast_date_format()))
         logger.info("Performing OBSERVATION transformation...")
-        current_total = 0
         for source, query in SQL_ENTRIES.items():
-            result = cnxn.execute(text(query))
-            overview = result.fetchall()
             logger.info(
                 "%s Transformation Complete! %s Observation(s) included",
                 source,
-                (
-                    overview[0][0]
-                    if source == "OBSERVATION"
-                    else overview[0][0] - current_total
-                ),
+                execute_sql_partitioned(ctxt, query),
             )
-            current_total = overview[0][0]
-        log_default_date(ctxt, OBSERVATION_LOGGER_DICT)
-        log_invalid_mri_records(ctxt, Observation)
+        result = cnxn.execute(text(SQL_COUNT))
+        overview = result.fetchall()
+        logger.info(
+            "OBSERVATION Transformation Complete! %s Observation(s) included",
+            overview[0][0],
+        )
+        log_default_date(ctxt, OBSERVATION_LOGGER_DICT, invalid_mri_table=Observation)
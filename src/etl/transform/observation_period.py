@@ -1,18 +1,52 @@
 """Observation Period transformations"""
 
 import logging
+from typing import Sequence
 
 from sqlalchemy import text
 
 from ..context import ETLContext
+from ..models.lookupmodels import PatientDelta
+from ..models.omopcdm54.clinical import (
+    ConditionOccurrence,
+    DrugExposure,
+    Measurement,
+    Observation,
+    ObservationPeriod,
+    Person,
+    ProcedureOccurrence,
+    VisitOccurrence,
+)
+from ..models.source import Patient
 from ..sql.observation_period import SQL as observation_period_transform
+from ..sql.observation_period import SQL_PERSONS
+from ..transform.shards import rebuilt_persons
+from ..transform.transformutils import step_tables
 
 logger = logging.getLogger(__name__)
 
 
+@step_tables(
+    reads=[
+        Person,
+        VisitOccurrence,
+        ConditionOccurrence,
+        DrugExposure,
+        Measurement,
+        Observation,
+        ProcedureOccurrence,
+        PatientDelta,
+        Patient,
+    ],
+    writes=[ObservationPeriod],
+)
 def transform(ctxt: ETLContext) -> None:
     """Create the ObservationPeriod tables"""
     with ctxt.transaction() as cnxn:
+        person_ids = rebuilt_persons(ctxt, cnxn)
+        if person_ids is not None:
+            update_persons(ctxt, person_ids)
+            return
         logger.info("Performing OBSERVATION PERIOD transformation... ")
         result = cnxn.execute(text(observation_period_transform))
         overview = result.fetchall()
@@ -21,3 +55,14 @@ def transform(ctxt: ETLContext) -> None:
             "included",
             overview[0][0],
         )
+
+
+def update_persons(ctxt: ETLContext, person_ids: Sequence[int]) -> None:
+    """Recompute the observation periods of the given persons only"""
+    with ctxt.transaction() as cnxn:
+        result = cnxn.execute(text(SQL_PERSONS), {"person_ids": list(person_ids)})
+        logger.info(
+            "Observation period(s) of %s person(s) updated, %s in total",
+            len(person_ids),
+            result.fetchall()[0][0],
+        )
@@ -0,0 +1,90 @@
+"""Incremental runs, rebuilding only the patients whose source rows changed"""
+
+import logging
+from typing import List
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from ..context import ETLContext
+from ..models.etl_logger import ETLLogger, ETLPatientState
+from ..models.lookupmodels import PatientDelta
+from ..models.omopcdm54.health_systems import Location
+from ..sql.create_omopcdm_tables import MODELS as OMOP_MODELS
+from ..sql.create_source_tables import MODELS as SOURCE_MODELS
+from ..sql.patient_delta import (
+    PERSON_TABLES,
+    SQL,
+    SQL_CLEAR,
+    SQL_HAS_STATE,
+    SQL_PERSONS,
+    SQL_STATE_EXISTS,
+    SQL_STORE,
+)
+from ..transform.transformutils import step_tables
+
+logger = logging.getLogger(__name__)
+
+
+def has_patient_state(cnxn: Connection) -> bool:
+    """Whether an earlier incremental run left its OMOP CDM tables in place,
+    which the run then updates instead of building them again"""
+    if cnxn.execute(text(SQL_STATE_EXISTS)).scalar() is None:
+        return False
+    return bool(cnxn.execute(text(SQL_HAS_STATE)).scalar())
+
+
+def clear_patient_state(cnxn: Connection) -> None:
+    """Forget the patients of the earlier incremental runs, whose results a
+    full run replaces or that left the target schema"""
+    cnxn.execute(text(SQL_CLEAR))
+
+
+def changed_persons(cnxn: Connection) -> List[int]:
+    """The persons the patient_delta step found changed"""
+    return [row[0] for row in cnxn.execute(text(SQL_PERSONS))]
+
+
+@step_tables(
+    reads=[ETLPatientState],
+    writes=[PatientDelta, ETLPatientState, ETLLogger, Location]
+    + SOURCE_MODELS
+    + [str(table) for table in PERSON_TABLES],
+)
+def transform(ctxt: ETLContext) -> None:
+    """Find the patients whose source rows changed since the last
+    incremental run and remove their rows, leaving only theirs to transform
+
+    Without the incremental option the state is cleared, the next
+    incremental run builds every patient.
+    """
+    with ctxt.transaction() as cnxn:
+        if not ctxt.config.incremental:
+            logger.info("Skipping the patient delta!")
+            clear_patient_state(cnxn)
+            return
+        logger.info("Finding the patients with changed source rows...")
+        result = cnxn.execute(text(SQL), {"inputs_digest": ctxt.inputs_digest})
+        changed, removed = result.fetchall()[0]
+        logger.info(
+            "PATIENT DELTA complete! %s patient(s) to rebuild, %s removed",
+            changed,
+            removed,
+        )
+
+
+@step_tables(
+    reads=[PatientDelta, ETLLogger] + OMOP_MODELS,
+    writes=[ETLPatientState],
+)
+def store_state(ctxt: ETLContext) -> None:
+    """Record the hashes of the rebuilt patients, once their rows are all in
+    place, so that a failed run rebuilds them again"""
+    if not ctxt.config.incremental:
+        return
+    with ctxt.transaction() as cnxn:
+        result = cnxn.execute(text(SQL_STORE))
+        logger.info(
+            "Patient state stored, %s patient(s) in total",
+            result.fetchall()[0][0],
+        )
@@ -5,17 +5,26 @@ import logging
 from sqlalchemy import text
 
 from ..context import ETLContext
+from ..models.etl_logger import ETLLogger
+from ..models.lookupmodels import CodeLogger
+from ..models.omopcdm54.clinical import Person
+from ..models.omopcdm54.health_systems import Location
+from ..models.source import DiseaseHistory, Patient
 from ..sql.person_transform import SQL as person_transform
 from ..transform.etl_logging import PATIENT_LOGGER_DICT, log_errors
-from ..util.sql import cast_date_format
+from ..transform.transformutils import step_tables
 
 logger = logging.getLogger(__name__)
 
 
+@step_tables(
+    reads=[Patient, DiseaseHistory, Location, CodeLogger],
+    writes=[Person],
+    appends=[ETLLogger],
+)
 def transform(ctxt: ETLContext) -> None:
     """Person transform"""
     with ctxt.transaction() as cnxn:
-        result = cnxn.execute(text(cast_date_format()))
         logger.info("Performing PERSON transformation...")
         result = cnxn.execute(text(person_transform))
         overview = result.fetchall()
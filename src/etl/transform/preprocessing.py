@@ -1,32 +1,64 @@
 """Preprocessing the source and lookup data"""
 
+import hashlib
 import logging
-from typing import Final
+from pathlib import Path
+from typing import Final, Optional, Tuple
 
 import numpy as np
 import pandas as pd
-from sqlalchemy import and_, func, select
+from sqlalchemy import Date, select, text
+from sqlalchemy.engine import Connection
 
+from ..common import NULL_STRINGS
 from ..context import ETLContext
-from ..models.omopcdm54.vocabulary import Concept
+from ..models.modelutils import columns_of_type
+from ..models.omopcdm54.vocabulary import Concept, Vocabulary
 from ..models.source import SOURCE_MODELS_FILENAME_KEY
-from ..transform.transformutils import try_parsing_date
-from ..util.random import generate_int_primary_key
+from ..transform.transformutils import (
+    CTXT_LOOKUPS,
+    CTXT_SOURCES,
+    invalid_dates,
+    normalize_dates,
+    step_tables,
+)
+from ..util.random import generate_int_primary_keys
 
 logger = logging.getLogger(__name__)
 
 LOOKUP_DATA: Final[str] = "lookup_data"
 SOURCE_DATA: Final[str] = "source_data"
-
-
-def format_dates(input_df: pd.DataFrame) -> pd.DataFrame:
-    """This function will convert date columns to the desired format
-    Defined in the try_parsing_date function"""
-    for column in input_df.select_dtypes(exclude=["float64", "int64"]):
-        try:
-            input_df[column] = input_df[column].apply(try_parsing_date)
-        except AttributeError:
+# the suffix of the flags telling whether the given dates are valid
+VALID_FLAG_SUFFIX: Final[str] = "_valid"
+
+
+def format_dates(tablename: str, input_df: pd.DataFrame) -> pd.DataFrame:
+    """This function will convert the date columns of the source model to the
+    desired format, see normalize_dates. Values that are not a valid date are
+    set to missing, so the typed date columns can be loaded as is. A date
+    column with a <column>_valid flag in the model gets it set, NULL for
+    missing values, so the rules telling invalid from missing dates can."""
+    model = SOURCE_MODELS_FILENAME_KEY[tablename]
+    date_columns = columns_of_type(model, Date)
+    numeric_columns = input_df.select_dtypes(include=["float64", "int64"])
+    for column in date_columns:
+        if column not in input_df or column in numeric_columns:
             continue
+        input_df[column] = normalize_dates(input_df[column])
+        invalid = invalid_dates(input_df[column])
+        flag = f"{column}{VALID_FLAG_SUFFIX}"
+        if flag in model.__table__.columns:
+            input_df[flag] = (~invalid).astype("boolean").mask(input_df[column].isna())
+        if invalid.any():
+            logger.warning(
+                "Table %s, column %s: %s value(s) are not valid dates and"
+                " were set to missing, e.g. %s",
+                tablename,
+                column,
+                invalid.sum(),
+                input_df.loc[invalid, column].unique()[:3].tolist(),
+            )
+            input_df[column] = input_df[column].mask(invalid)
     return input_df
 
 
@@ -44,9 +76,7 @@ def all_object_columns_lower_case(input_df: pd.DataFrame) -> pd.DataFrame:
 
 def replace_to_nan(input_df: pd.DataFrame) -> pd.DataFrame:
     for column in input_df:
-        input_df[column].replace(
-            ["nan", "none", "<not performed>"], np.nan, inplace=True
-        )
+        input_df[column].replace(NULL_STRINGS, np.nan, inplace=True)
     return input_df
 
 
@@ -82,53 +112,123 @@ def log_missing_columns(tablename: str, input_df: pd.DataFrame) -> None:
         )
 
 
-def _validate_concept_id(concept_id: int, ctxt: ETLContext) -> int:
+SQL_STANDARD_CONCEPT_IDS: Final[str] = f"""
+SELECT {Concept.concept_id.key}
+FROM {str(Concept.__table__)}
+WHERE {Concept.concept_id.key} = ANY(:concept_ids)
+AND {Concept.standard_concept.key} = 'S'
+"""
+
+
+def _vocabulary_version(cnxn: Connection) -> Optional[str]:
+    qry = select(Vocabulary.vocabulary_version).where(
+        Vocabulary.vocabulary_id == "None"
+    )
+    return cnxn.execute(qry).scalar()
+
+
+def _concept_cache_file(cache_dir: Path, vocabulary_version: str) -> Path:
+    digest = hashlib.sha1(vocabulary_version.encode("utf-8")).hexdigest()
+    return cache_dir / f"standard_concepts_{digest[:16]}.npz"
+
+
+def _read_concept_cache(cache_file: Path) -> Tuple[np.ndarray, np.ndarray]:
+    """The concept ids checked so far and those of them that are standard"""
+    empty = np.array([], dtype=np.int64)
+    if not cache_file.is_file():
+        return empty, empty
+    try:
+        with np.load(cache_file) as cached:
+            return cached["checked"], cached["valid"]
+    except (OSError, KeyError, ValueError) as error:
+        logger.warning("Ignoring unreadable concept cache %s: %s", cache_file, error)
+        return empty, empty
+
+
+def _write_concept_cache(
+    cache_file: Path, checked: np.ndarray, valid: np.ndarray
+) -> None:
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = cache_file.with_suffix(".tmp.npz")
+        np.savez_compressed(tmp_file, checked=checked, valid=valid)
+        tmp_file.replace(cache_file)
+    except OSError as error:
+        logger.warning("Could not write concept cache %s: %s", cache_file, error)
+
+
+def standard_concept_ids(concept_ids: np.ndarray, ctxt: ETLContext) -> np.ndarray:
+    """The subset of concept_ids that are standard concepts
+
+    The answers are cached in ctxt.config.cache_dir per vocabulary version,
+    only ids that were never checked against that version are queried.
+    """
+    concept_ids = np.unique(concept_ids.astype(np.int64))
     with ctxt.transaction() as cnxn:
-        qry = (
-            select(func.count())
-            .select_from(Concept)
-            .where(
-                and_(
-                    Concept.concept_id == concept_id,
-                    Concept.standard_concept == "S",
-                )
-            )
+        vocabulary_version = _vocabulary_version(cnxn)
+        cache_file = None
+        checked = valid = np.array([], dtype=np.int64)
+        if vocabulary_version:
+            cache_file = _concept_cache_file(ctxt.config.cache_dir, vocabulary_version)
+            checked, valid = _read_concept_cache(cache_file)
+
+        unchecked = np.setdiff1d(concept_ids, checked)
+        logger.debug(
+            "%s concept ids cached, %s to check", concept_ids.size, unchecked.size
         )
-        result = cnxn.execute(qry)
-        if result.first().count_1 == 0:
-            logger.debug(
-                """Concept id %s is missing in the concept table of OMOP CDM database. It has been set to 0.""",
-                concept_id,
+        if unchecked.size:
+            result = cnxn.execute(
+                text(SQL_STANDARD_CONCEPT_IDS),
+                {"concept_ids": unchecked.tolist()},
             )
-            return 0
-    return concept_id
+            found = np.array([row[0] for row in result], dtype=np.int64)
+            checked = np.union1d(checked, unchecked)
+            valid = np.union1d(valid, found)
+            if cache_file is not None:
+                _write_concept_cache(cache_file, checked, valid)
+
+    return np.intersect1d(concept_ids, valid)
 
 
 def validate_concept_ids(input_df: pd.DataFrame, ctxt: ETLContext) -> pd.DataFrame:
     # Validates concept ids. If they are not present in the existing concept ids, it will log
     # the concept_id and set it to 0.
     concept_column = ctxt.config.lookup_standard_concept_col
-    input_df[concept_column] = input_df.apply(
-        lambda x: _validate_concept_id(x[concept_column], ctxt),
-        axis=1,
-    )
+    concept_ids = input_df[concept_column]
+    valid = standard_concept_ids(concept_ids.dropna().to_numpy(), ctxt)
+    invalid = ~concept_ids.isin(valid)
+    for concept_id in concept_ids[invalid].unique():
+        logger.debug(
+            """Concept id %s is missing in the concept table of OMOP CDM database. It has been set to 0.""",
+            concept_id,
+        )
+    input_df[concept_column] = concept_ids.mask(invalid, 0)
     return input_df
 
 
 def set_pk(source_df: pd.DataFrame) -> pd.DataFrame:
-    source_df["_id"] = source_df.apply(lambda _: generate_int_primary_key(), axis=1)
+    source_df["_id"] = generate_int_primary_keys(len(source_df))
     return source_df
 
 
+def preprocess_source(tablename: str, source_df: pd.DataFrame) -> pd.DataFrame:
+    """Preprocess a source table, or a chunk of it"""
+    source_df = all_object_columns_lower_case(source_df)
+    source_df = replace_to_nan(source_df)
+    source_df = set_columns_to_lowercase(source_df)
+    source_df = set_pk(source_df)
+    return format_dates(tablename, source_df)
+
+
+@step_tables(
+    reads=[Concept, Vocabulary],
+    writes=[CTXT_SOURCES, CTXT_LOOKUPS],
+)
 def transform(ctxt: ETLContext) -> None:
     for key, value in ctxt.sources.items():
         logger.debug("preprocessing %s", key)
-        ctxt.sources[key] = all_object_columns_lower_case(value)
-        ctxt.sources[key] = replace_to_nan(value)
-        ctxt.sources[key] = set_columns_to_lowercase(value)
-        ctxt.sources[key] = set_pk(value)
-        ctxt.sources[key] = format_dates(value)
-        log_missing_columns(key, value)
+        ctxt.sources[key] = preprocess_source(key, value)
+        log_missing_columns(key, ctxt.sources[key])
     for key, value in ctxt.lookups.items():
         logger.debug("preprocessing %s", key)
         if key == "concept_lookup":
@@ -5,22 +5,25 @@ import logging
 from sqlalchemy import text
 
 from ..context import ETLContext
-from ..models.omopcdm54.clinical import ProcedureOccurrence
+from ..models.etl_logger import ETLLogger
+from ..models.lookupmodels import CodeLogger, ConceptLookup, VisitLookup
+from ..models.omopcdm54.clinical import Person, ProcedureOccurrence
+from ..models.source import Dmt, Mri
 from ..sql.procedure_transform import SQL_ENTRIES
-from ..transform.etl_logging import (
-    PROCEDURE_LOGGER_DICT,
-    log_default_date,
-    log_invalid_mri_records,
-)
-from ..util.sql import cast_date_format
+from ..transform.etl_logging import PROCEDURE_LOGGER_DICT, log_default_date
+from ..transform.transformutils import step_tables
 
 logger = logging.getLogger(__name__)
 
 
+@step_tables(
+    reads=[Dmt, Mri, Person, VisitLookup, ConceptLookup, CodeLogger],
+    writes=[ProcedureOccurrence],
+    appends=[ETLLogger],
+)
 def transform(ctxt: ETLContext) -> None:
     """Procedure Occurrence transformation"""
     with ctxt.transaction() as cnxn:
-        result = cnxn.execute(text(cast_date_format()))
         logger.info("Performing PROCEDURE OCCURRENCE transformation...")
         current_total = 0
         for source, query in SQL_ENTRIES.items():
@@ -36,5 +39,6 @@ def transform(ctxt: ETLContext) -> None:
                 ),
             )
             current_total = overview[0][0]
-        log_default_date(ctxt, PROCEDURE_LOGGER_DICT)
-        log_invalid_mri_records(ctxt, ProcedureOccurrence)
+        log_default_date(
+            ctxt, PROCEDURE_LOGGER_DICT, invalid_mri_table=ProcedureOccurrence
+        )
@@ -2,12 +2,70 @@
 
 import logging
 
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
 from ..context import ETLContext
-from ..transform.transformutils import execute_sql_file
+from ..models.lookupmodels import DrugIngredientMap
+from ..models.omopcdm54.vocabulary import (
+    Concept,
+    ConceptAncestor,
+    ConceptClass,
+    ConceptRelationship,
+    ConceptSynonym,
+    Domain,
+    DrugStrength,
+    Relationship,
+    SourceToConceptMap,
+    Vocabulary,
+)
+from ..sql.drug_ingredient_map import SQL as drug_ingredient_map_sql
+from ..sql.drug_ingredient_map import SQL_MAPPED_VERSION, SQL_VOCABULARY_VERSION
+from ..transform.transformutils import execute_sql_file, step_tables
 
 logger = logging.getLogger(__name__)
 
 
+def _drug_ingredient_map_is_current(cnxn: Connection) -> bool:
+    """Whether the drug ingredient map was built from the loaded vocabulary"""
+    exists = cnxn.execute(
+        text(f"SELECT to_regclass('{str(DrugIngredientMap.__table__)}')")
+    ).scalar()
+    if exists is None:
+        return False
+    mapped = cnxn.execute(text(SQL_MAPPED_VERSION)).first()
+    version = cnxn.execute(text(SQL_VOCABULARY_VERSION)).scalar()
+    return mapped is not None and mapped[0] == version
+
+
+def _refresh_drug_ingredient_map(ctxt: ETLContext, force: bool = False) -> None:
+    """Build the drug ingredient map unless it is current already"""
+    with ctxt.transaction() as cnxn:
+        if not force and _drug_ingredient_map_is_current(cnxn):
+            logger.info("Drug ingredient map is up to date")
+            return
+        result = cnxn.execute(text(drug_ingredient_map_sql))
+        logger.info(
+            "Drug ingredient map built! %s drug ingredient(s) included",
+            result.fetchall()[0][0],
+        )
+
+
+@step_tables(
+    writes=[
+        Concept,
+        ConceptAncestor,
+        ConceptClass,
+        ConceptRelationship,
+        ConceptSynonym,
+        Domain,
+        DrugStrength,
+        Relationship,
+        SourceToConceptMap,
+        Vocabulary,
+        DrugIngredientMap,
+    ],
+)
 def transform(ctxt: ETLContext) -> None:
     """The final load (copy from temp tables to production)"""
     logger.info("".join(["-"] * 93))
@@ -21,3 +79,4 @@ def transform(ctxt: ETLContext) -> None:
         logger.info("Vocabulary Reload Step Complete!")
     else:
         logger.info("Skipping vocabulary reload!")
+    _refresh_drug_ingredient_map(ctxt, force=ctxt.config.reload_vocab)
@@ -0,0 +1,51 @@
+"""Sharded runs, transforming the patients over several worker processes"""
+
+import logging
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from ..context import ETLContext
+from ..models.omopcdm54.clinical import Person
+from ..models.omopcdm54.health_systems import Location
+from ..sql.shards import (
+    SQL_MERGE_LOCATIONS,
+    SQL_STAGED_PERSONS,
+    drop_shard_schemas_sql,
+)
+from ..transform.patient_delta import changed_persons
+from ..transform.transformutils import step_tables
+
+logger = logging.getLogger(__name__)
+
+
+def staged_persons(cnxn: Connection) -> List[int]:
+    """The persons of a shard, the patients staged in its source tables"""
+    return [row[0] for row in cnxn.execute(text(SQL_STAGED_PERSONS))]
+
+
+def rebuilt_persons(ctxt: ETLContext, cnxn: Connection) -> Optional[List[int]]:
+    """The persons the steps deriving rows from the OMOP CDM tables rebuild
+    by themselves: the changed ones of an incremental run, the ones of the
+    shard in a sharded run, and None when they build every person"""
+    if ctxt.config.incremental:
+        return changed_persons(cnxn)
+    if ctxt.config.shards > 1:
+        return staged_persons(cnxn)
+    return None
+
+
+@step_tables(reads=[Location], writes=[Location, Person])
+def merge(ctxt: ETLContext) -> None:
+    """Merge what the shards added to the shared tables once they are done
+
+    The locations the shards added for the same residence are merged and
+    the schemas they staged their source tables in are dropped.
+    """
+    with ctxt.transaction() as cnxn:
+        logger.info("Merging the results of %s shards...", ctxt.config.shards)
+        result = cnxn.execute(text(SQL_MERGE_LOCATIONS))
+        locations = result.fetchall()[0][0]
+        cnxn.execute(text(drop_shard_schemas_sql(ctxt.config.shards)))
+        logger.info("SHARDS merged! %s Location(s) included", locations)
@@ -3,12 +3,24 @@
 # pylint: disable=invalid-name
 import logging
 import os
+import re
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Final
+from functools import partial
+from typing import Any, Callable, Dict, Final, Iterable, List, Optional, Tuple
 
+import pandas as pd
 from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
 
 from ..context import ETLContext
+from ..sql.person_range import (
+    ALL_PERSONS,
+    PERSON_RANGE_LOWER,
+    PERSON_RANGE_UPPER,
+    SQL_RANGE_UPPERS,
+    is_partitioned,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -16,12 +28,89 @@ logger = logging.getLogger(__name__)
 DATE_FORMAT: Final[str] = "%Y-%m-%d"
 
 
+# the in-memory data of the context, as tables in the step declarations
+CTXT_SOURCES: Final[str] = "ctxt.sources"
+CTXT_LOOKUPS: Final[str] = "ctxt.lookups"
+
+
+def _table_name(table: Any) -> str:
+    return table if isinstance(table, str) else str(table.__table__)
+
+
+def step_tables(
+    reads: Iterable[Any] = (),
+    writes: Iterable[Any] = (),
+    appends: Iterable[Any] = (),
+) -> Callable:
+    """Transform decorator declaring the tables a step reads and writes
+
+    Tables are given as models or names. Appending steps only insert into
+    a table, so they may run alongside each other but not alongside steps
+    that read or write it.
+    """
+
+    def decorate(func):
+        func.reads = frozenset(_table_name(t) for t in reads)
+        func.writes = frozenset(_table_name(t) for t in writes)
+        func.appends = frozenset(_table_name(t) for t in appends)
+        return func
+
+    return decorate
+
+
 def execute_sql_transform(ctxt: ETLContext, sql: str) -> None:
     """Execute sql for a given session"""
     with ctxt.transaction() as cnxn:
         cnxn.execute(text(sql))
 
 
+def person_ranges(
+    cnxn: Connection, ranges: int
+) -> List[Tuple[Optional[int], Optional[int]]]:
+    """The lower and upper bounds of ranges splitting the staged patients
+
+    The ranges are contiguous and cover every person, the first one has no
+    lower bound and the last one no upper bound.
+    """
+    uppers = [
+        row[0] for row in cnxn.execute(text(SQL_RANGE_UPPERS), dict(ranges=ranges))
+    ][:-1]
+    return list(zip([None] + uppers, uppers + [None]))
+
+
+def _execute_range(
+    engine: Engine, sql: str, bounds: Tuple[Optional[int], Optional[int]]
+) -> int:
+    """Execute sql for a range of persons, in one worker transaction"""
+    lower, upper = bounds
+    with engine.begin() as cnxn:
+        return cnxn.execute(
+            text(sql), {PERSON_RANGE_LOWER: lower, PERSON_RANGE_UPPER: upper}
+        ).rowcount
+
+
+def execute_sql_partitioned(ctxt: ETLContext, sql: str) -> int:
+    """Execute an INSERT ... SELECT and return the count of rows inserted
+
+    A statement declaring a person range (etl.sql.person_range) is split,
+    with insert_partitions above one, into that many ranges of the staged
+    patients, executed at the same time each in its own transaction on its
+    own connection. The ranges only see the committed tables, with
+    insert_partitions the steps commit one by one.
+    """
+    partitions = ctxt.config.insert_partitions
+    with ctxt.transaction() as cnxn:
+        if not is_partitioned(sql):
+            return cnxn.execute(text(sql)).rowcount
+        if partitions < 2:
+            return cnxn.execute(text(sql), ALL_PERSONS).rowcount
+        ranges = person_ranges(cnxn, partitions)
+    logger.debug("executing over %s ranges of persons", len(ranges))
+    with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+        counts = executor.map(partial(_execute_range, ctxt.cnxn.engine, sql), ranges)
+        return sum(counts)
+
+
 def execute_sql_file(ctxt: ETLContext, filename: str, encoding="utf-8") -> None:
     """Execute SQL given a filename containing the SQL statements"""
     parent_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
@@ -30,25 +119,58 @@ def execute_sql_file(ctxt: ETLContext, filename: str, encoding="utf-8") -> None:
         execute_sql_transform(ctxt, sql_statement)
 
 
+# Accepted source date formats, in order of precedence
+DATE_FORMATS: Final[List[str]] = [
+    "%d/%m/%y",
+    "%d/%m/%Y",
+    "%d-%m-%y",
+    "%d-%m-%Y",
+    "%Y-%m-%d",
+    "%y-%m-%d",
+    "%d/%m/%y %H:%M:%S",
+    "%d/%m/%Y %H:%M:%S",
+    "%Y-%m-%d %H:%M:%S",
+    "%y-%m-%d %H:%M:%S",
+    "%d/%m/%y %H:%M",
+    "%d/%m/%Y %H:%M",
+    "%Y-%m-%d %H:%M",
+    "%y-%m-%d %H:%M",
+]
+
+# The patterns strptime itself uses for the directives in DATE_FORMATS, so
+# that a regex match is exactly the set of strings strptime can tokenize
+_STRPTIME_PATTERNS: Final[Dict[str, str]] = {
+    "d": r"(?:3[01]|[12]\d|0[1-9]|[1-9]| [1-9])",
+    "m": r"(?:1[0-2]|0[1-9]|[1-9])",
+    "y": r"(?:\d\d)",
+    "Y": r"(?:\d\d\d\d)",
+    "H": r"(?:2[0-3]|[0-1]\d|\d)",
+    "M": r"(?:[0-5]\d|\d)",
+    "S": r"(?:6[0-1]|[0-5]\d|\d)",
+}
+
+
+def _format_to_regex(date_format: str) -> str:
+    """Translate a strptime format into an equivalent full-match regex"""
+    pattern = ""
+    for token in re.split(r"(%[a-zA-Z]|\s+)", date_format):
+        if token.startswith("%"):
+            pattern += _STRPTIME_PATTERNS[token[1:]]
+        elif token.isspace():
+            pattern += r"\s+"
+        else:
+            pattern += re.escape(token)
+    return pattern
+
+
+# Full-match regex per format, in the same order as DATE_FORMATS
+DATE_FORMAT_REGEXES: Final[Dict[str, str]] = {
+    _format_to_regex(fmt): fmt for fmt in DATE_FORMATS
+}
+
+
 def try_parsing_date(input_date: str) -> str:
-    date_formats = [
-        "%d/%m/%y",
-        "%d/%m/%Y",
-        "%d-%m-%y",
-        "%d-%m-%Y",
-        "%Y-%m-%d",
-        "%y-%m-%d",
-        "%d/%m/%y %H:%M:%S",
-        "%d/%m/%Y %H:%M:%S",
-        "%Y-%m-%d %H:%M:%S",
-        "%y-%m-%d %H:%M:%S",
-        "%d/%m/%y %H:%M",
-        "%d/%m/%Y %H:%M",
-        "%Y-%m-%d %H:%M",
-        "%y-%m-%d %H:%M",
-    ]
-
-    for _format in date_formats:
+    for _format in DATE_FORMATS:
         try:
             parsed_date = datetime.strptime(str(input_date), _format)
             return parsed_date.strftime(DATE_FORMAT)
@@ -56,3 +178,68 @@ def try_parsing_date(input_date: str) -> str:
             continue
 
     return input_date
+
+
+def normalize_dates(column: pd.Series) -> pd.Series:
+    """Vectorized equivalent of applying try_parsing_date to a column
+
+    Every distinct value is resolved against DATE_FORMATS in order of
+    precedence: the values a format can tokenize are found with a regex and
+    parsed in one pd.to_datetime call. Values pandas cannot represent
+    (e.g. years outside the nanosecond range) or that fail calendar
+    validation fall back to try_parsing_date, one value at a time.
+    """
+    uniques = pd.Series(column.dropna().unique(), dtype=object)
+    if uniques.empty:
+        return column
+
+    pending = uniques.astype(str)
+    resolved: Dict[Any, Any] = {}
+    for pattern, date_format in DATE_FORMAT_REGEXES.items():
+        if pending.empty:
+            break
+        candidates = pending[pending.str.fullmatch(pattern)]
+        if candidates.empty:
+            continue
+        parsed = pd.to_datetime(candidates, format=date_format, errors="coerce")
+        valid = parsed.notna()
+        resolved.update(
+            zip(
+                uniques[candidates.index[valid]],
+                parsed[valid].dt.strftime(DATE_FORMAT),
+            )
+        )
+        # strptime accepts these (out of bounds for pandas) or rejects them
+        # for every format (e.g. 31/02), either way decide value by value
+        for idx in candidates.index[~valid]:
+            resolved[uniques[idx]] = try_parsing_date(uniques[idx])
+        pending = pending.drop(candidates.index)
+
+    if not resolved:
+        return column
+    normalized = column.map(resolved)
+    return normalized.where(normalized.notna(), column)
+
+
+# the dates normalize_dates writes, %Y is not zero padded below year 1000
+_NORMALIZED_DATE: Final = re.compile(r"(\d{1,4})-(\d{2})-(\d{2})")
+
+
+def _is_valid_date(value: Any) -> bool:
+    match = _NORMALIZED_DATE.fullmatch(str(value))
+    if not match:
+        return False
+    year, month, day = map(int, match.groups())
+    try:
+        datetime(year, month, day)
+    except ValueError:
+        return False
+    return True
+
+
+def invalid_dates(column: pd.Series) -> pd.Series:
+    """Mask of the non-missing values of a normalized date column that are
+    not a calendar date, i.e. the values normalize_dates could not parse"""
+    uniques = column.dropna().unique()
+    invalid = {value for value in uniques if not _is_valid_date(value)}
+    return column.isin(invalid) if invalid else pd.Series(False, column.index)
@@ -0,0 +1,31 @@
+"""Visit lookup transformation"""
+
+import logging
+
+from sqlalchemy import text
+
+from ..context import ETLContext
+from ..models.lookupmodels import VisitLookup
+from ..models.omopcdm54.clinical import VisitOccurrence
+from ..models.source import Patient
+from ..sql.visit_lookup import SQL as visit_lookup_transform
+from ..sql.visit_lookup import SQL_STAGED
+from ..transform.transformutils import step_tables
+
+logger = logging.getLogger(__name__)
+
+
+@step_tables(reads=[VisitOccurrence, Patient], writes=[VisitLookup])
+def transform(ctxt: ETLContext) -> None:
+    """Resolve the visit_occurrence_id of every patient visit once
+
+    A shard only includes the visits of its own patients.
+    """
+    sql = SQL_STAGED if ctxt.config.shards > 1 else visit_lookup_transform
+    with ctxt.transaction() as cnxn:
+        logger.info("Creating the VISIT LOOKUP table...")
+        result = cnxn.execute(text(sql))
+        logger.info(
+            "VISIT LOOKUP table created! %s visits included",
+            result.fetchall()[0][0],
+        )
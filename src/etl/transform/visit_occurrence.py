@@ -5,22 +5,31 @@ import logging
 from sqlalchemy import text
 
 from ..context import ETLContext
+from ..models.etl_logger import ETLLogger
+from ..models.lookupmodels import CodeLogger
+from ..models.omopcdm54.clinical import Person, VisitOccurrence
 from ..sql.visit_occurrence_transform import (
     MODELS,
     SQL as visit_occurrence_transform,
+    SQL_COUNT,
 )
 from ..transform.etl_logging import log_default_visit_date
-from ..util.sql import cast_date_format
+from ..transform.transformutils import execute_sql_partitioned, step_tables
 
 logger = logging.getLogger(__name__)
 
 
+@step_tables(
+    reads=MODELS + [Person, CodeLogger],
+    writes=[VisitOccurrence],
+    appends=[ETLLogger],
+)
 def transform(ctxt: ETLContext) -> None:
     """Visit_occurrence transformation"""
     with ctxt.transaction() as cnxn:
-        result = cnxn.execute(text(cast_date_format()))
         logger.info("Performing VISIT OCCURRENCE transformation...")
-        result = cnxn.execute(text(visit_occurrence_transform))
+        execute_sql_partitioned(ctxt, visit_occurrence_transform)
+        result = cnxn.execute(text(SQL_COUNT))
         overview = result.fetchall()
         logger.info(
             "VISIT OCCURRENCE Transformation Complete! %s records included",
@@ -1,16 +1,28 @@
 """Module for database utilities and helpers"""
 
 import logging
+import queue
+import threading
+import time
+from abc import ABC, abstractmethod
 from contextlib import contextmanager
 from enum import Enum
-from tempfile import SpooledTemporaryFile
-from typing import Generator, Iterable, Literal, Optional
+from typing import Any, Generator, Iterable, List, Literal, Optional
 
 import pandas as pd
-from sqlalchemy import create_engine
+from sqlalchemy import Table, create_engine
 from sqlalchemy.engine import Connection, Engine
 from sqlalchemy.orm import Session
 
+from .pgcopy import (
+    PGCOPY_HEADER,
+    PGCOPY_TRAILER,
+    BinaryColumn,
+    PGCopyEncodeError,
+    binary_columns,
+    encode_rows,
+)
+
 logger = logging.getLogger(__name__)
 
 
@@ -19,9 +31,163 @@ class WriteMode(Enum):
 
     APPEND = 1
     OVERWRITE = 2
+    TRUNCATE = 3
+
+
+class CopyFormat(Enum):
+    """Enum for COPY data formats"""
+
+    CSV = 1
+    BINARY = 2
+
+
+class CopyStream(ABC):
+    """
+    Read-only file-like object that streams a DataFrame to be used as the
+    input of cursor.copy_expert.
+
+    A producer thread renders the DataFrame in batches of batch_rows rows
+    and hands them over through a bounded queue, so rendering the next batch
+    overlaps with sending the current one and at most max_batches rendered
+    batches are held in memory at any time. Subclasses define how a batch
+    of rows is rendered.
+    """
+
+    prefix: bytes = b""
+    suffix: bytes = b""
+
+    def __init__(
+        self,
+        num_rows: int,
+        batch_rows: int = 50000,
+        max_batches: int = 2,
+    ) -> None:
+        self.rows = 0
+        self.bytes = 0
+        self._buffer = b""
+        self._offset = 0
+        self._done = False
+        self._queue: queue.Queue = queue.Queue(maxsize=max_batches)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._produce,
+            args=(num_rows, max(batch_rows, 1)),
+            daemon=True,
+        )
+        self._thread.start()
+
+    def __enter__(self) -> "CopyStream":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    @abstractmethod
+    def render(self, start: int, stop: int) -> bytes:
+        """Render rows start:stop"""
+
+    def _put(self, item: Any) -> bool:
+        # give up when the reading side went away, e.g. after a failed COPY
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce(self, num_rows: int, batch_rows: int) -> None:
+        try:
+            if self.prefix and not self._put((0, self.prefix)):
+                return
+            for start in range(0, num_rows, batch_rows):
+                stop = min(start + batch_rows, num_rows)
+                if not self._put((stop - start, self.render(start, stop))):
+                    return
+            if self.suffix and not self._put((0, self.suffix)):
+                return
+        # pylint: disable=broad-exception-caught
+        except Exception as error:
+            # re-raised by read, which aborts the COPY
+            self._put(error)
+            return
+        self._put(None)
+
+    def read(self, size: int = -1) -> bytes:
+        """Read up to size bytes, or the rest of the current batch"""
+        while self._offset >= len(self._buffer):
+            if self._done:
+                return b""
+            item = self._queue.get()
+            if item is None or isinstance(item, Exception):
+                self._done = True
+                if item is None:
+                    return b""
+                raise item
+            rows, self._buffer = item
+            self._offset = 0
+            self.rows += rows
+            self.bytes += len(self._buffer)
+
+        if size is None or size < 0:
+            size = len(self._buffer) - self._offset
+        data = self._buffer[self._offset : self._offset + size]
+        self._offset += len(data)
+        return data
 
+    def close(self) -> None:
+        """Stop the producer thread"""
+        self._stop.set()
+        self._thread.join()
 
-# pylint: disable=too-many-arguments
+
+class CSVCopyStream(CopyStream):
+    """Stream the given columns of a DataFrame as CSV"""
+
+    def __init__(
+        self,
+        dataframe: pd.DataFrame,
+        columns: List[str],
+        batch_rows: int = 50000,
+        max_batches: int = 2,
+        encoding: Optional[str] = "utf-8",
+        **csv_kwargs,
+    ) -> None:
+        self.dataframe = dataframe
+        self.columns = columns
+        # None is the default encoding of to_csv, as for df_to_sql
+        self.encoding = encoding or "utf-8"
+        self.csv_kwargs = csv_kwargs
+        super().__init__(len(dataframe), batch_rows, max_batches)
+
+    def render(self, start: int, stop: int) -> bytes:
+        batch = self.dataframe.iloc[start:stop][self.columns]
+        data = batch.to_csv(header=False, index=False, **self.csv_kwargs)
+        return data.encode(self.encoding)
+
+
+class BinaryCopyStream(CopyStream):
+    """Stream columns, prepared with pgcopy.binary_columns, in the binary
+    COPY format"""
+
+    prefix = PGCOPY_HEADER
+    suffix = PGCOPY_TRAILER
+
+    def __init__(
+        self,
+        columns: List[BinaryColumn],
+        num_rows: int,
+        batch_rows: int = 50000,
+        max_batches: int = 2,
+    ) -> None:
+        self.columns = columns
+        super().__init__(num_rows, batch_rows, max_batches)
+
+    def render(self, start: int, stop: int) -> bytes:
+        return encode_rows(self.columns, start, stop)
+
+
+# pylint: disable=too-many-arguments,too-many-locals
 def df_to_sql(
     cnxn: Connection,
     dataframe: pd.DataFrame,
@@ -31,35 +197,52 @@ def df_to_sql(
     delimiter: Optional[str] = ";",
     null_field: Optional[str] = None,
     write_mode: Optional[
-        Literal[WriteMode.APPEND, WriteMode.OVERWRITE]
+        Literal[WriteMode.APPEND, WriteMode.OVERWRITE, WriteMode.TRUNCATE]
     ] = WriteMode.OVERWRITE,
+    batch_rows: int = 50000,
+    copy_format: CopyFormat = CopyFormat.CSV,
+    table_def: Optional[Table] = None,
+    freeze: bool = False,
 ):
     """
     Helper function to quickly copy a Pandas DataFrame to an
     existing table in the database. All rows in the table are
-    deleted before the copy.
+    deleted before the copy, or truncated with WriteMode.TRUNCATE.
+
+    With freeze the rows are copied already frozen (COPY ... FREEZE), which
+    requires the table to be created or truncated in the current
+    transaction.
+
+    The DataFrame is streamed to the COPY in batches of batch_rows rows, see
+    CopyStream. With CopyFormat.BINARY the columns are encoded using the
+    column types of table_def, falling back to CSV when a column cannot be
+    encoded.
     """
-    read_buffer_size: int = 8192
-    write_buffer_size: int = 268435500
+    read_buffer_size: int = 65536
 
     if not dataframe.empty:
-        with SpooledTemporaryFile(
-            max_size=write_buffer_size,
-            mode="w+t",
-            encoding=encoding,
-        ) as csv_buffer:
-            # take all columns by default
-            if columns is None:
-                columns = dataframe.columns
-
-            dataframe[columns].to_csv(
-                csv_buffer,
-                delimiter,
-                header=False,
-                index=False,
-                encoding=encoding,
-            )
+        # take all columns by default
+        if columns is None:
+            columns = dataframe.columns
+        columns = list(columns)
+
+        copy_stream: Optional[CopyStream] = None
+        if copy_format == CopyFormat.BINARY:
+            try:
+                if table_def is None:
+                    raise PGCopyEncodeError("no table definition given")
+                copy_stream = BinaryCopyStream(
+                    binary_columns(dataframe, columns, table_def),
+                    len(dataframe),
+                    batch_rows=batch_rows,
+                )
+                options = ["FORMAT BINARY"]
+            except PGCopyEncodeError as error:
+                logger.warning(
+                    "binary COPY into %s not possible, using CSV: %s", table, error
+                )
 
+        if copy_stream is None:
             quote = '"'
             options = [
                 "FORMAT CSV",
@@ -69,17 +252,36 @@ def df_to_sql(
             ]
             if null_field is not None:
                 options.append(f"NULL '{null_field}'")
-            options_str = ", ".join(options)
+            copy_stream = CSVCopyStream(
+                dataframe,
+                columns,
+                batch_rows=batch_rows,
+                encoding=encoding,
+                sep=delimiter,
+            )
+        if freeze:
+            options.append("FREEZE TRUE")
+        options_str = ", ".join(options)
 
-            cols = ",".join([f'"{c}"' for c in columns])
-            copy_query = (
-                f"COPY {table} ({cols}) FROM STDIN WITH ({options_str})".strip()
+        cols = ",".join([f'"{c}"' for c in columns])
+        copy_query = f"COPY {table} ({cols}) FROM STDIN WITH ({options_str})".strip()
+        with copy_stream, cnxn.connection.cursor() as cursor:
+            if write_mode == WriteMode.OVERWRITE:
+                cursor.execute(f"DELETE FROM {table};")
+            elif write_mode == WriteMode.TRUNCATE:
+                cursor.execute(f"TRUNCATE {table};")
+            dur = time.time()
+            cursor.copy_expert(copy_query, copy_stream, read_buffer_size)
+            dur = max(time.time() - dur, 1e-9)
+            logger.info(
+                "copied %s rows (%s bytes) into %s in %.2fs: %.0f rows/s, %.0f bytes/s",
+                copy_stream.rows,
+                copy_stream.bytes,
+                table,
+                dur,
+                copy_stream.rows / dur,
+                copy_stream.bytes / dur,
             )
-            csv_buffer.seek(0)
-            with cnxn.connection.cursor() as cursor:
-                if write_mode == WriteMode.OVERWRITE:
-                    cursor.execute(f"DELETE FROM {table};")
-                cursor.copy_expert(copy_query, csv_buffer, read_buffer_size)
 
 
 @contextmanager
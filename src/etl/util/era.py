@@ -0,0 +1,137 @@
+"""Build eras in process with NumPy, an alternative to the era SQL"""
+
+import logging
+from typing import Any, Dict, Final, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from ..common import ERA_GAP_DAYS
+
+logger = logging.getLogger(__name__)
+
+EPOCH: Final = np.datetime64("1970-01-01", "D")
+
+
+def era_ends(
+    group: np.ndarray,
+    start: np.ndarray,
+    end: np.ndarray,
+    gap_days: int = ERA_GAP_DAYS,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """The era end of every interval and whether it has one
+
+    Group numbers the keys of the intervals, start and end are day numbers.
+    The eras are the ones of etl.sql.era.era_sql: the start and padded end
+    events are sorted once, an era ends where the running count of starts
+    within the group is half the events seen, and every interval takes the
+    first era end on or after its start.
+    """
+    size = len(start)
+    events_group = np.concatenate([group, group])
+    events_date = np.concatenate([start, end + gap_days])
+    events_type = np.repeat(np.array([0, 1], dtype=np.int64), size)
+    order = np.lexsort((events_type, events_date, events_group))
+    events_group = events_group[order]
+    events_date = events_date[order]
+    is_start = 1 - events_type[order]
+
+    position = np.arange(2 * size)
+    group_first = np.ones(2 * size, dtype=bool)
+    group_first[1:] = events_group[1:] != events_group[:-1]
+    # index of the first event of the group, carried forward
+    first = np.maximum.accumulate(np.where(group_first, position, 0))
+    starts = np.cumsum(is_start)
+    starts_in_group = starts - starts[first] + is_start[first]
+    events_in_group = position - first + 1
+    closing = 2 * starts_in_group == events_in_group
+
+    # the era ends are sorted by group and date, as are the events
+    ends_group = events_group[closing]
+    ends_date = events_date[closing] - gap_days
+    if not len(ends_date):
+        return np.zeros(size, dtype=np.int64), np.zeros(size, dtype=bool)
+    low = min(ends_date.min(), start.min())
+    span = max(ends_date.max(), start.max()) - low + 1
+    found = np.searchsorted(
+        ends_group * span + (ends_date - low), group * span + (start - low)
+    )
+    found_in_range = np.minimum(found, len(ends_date) - 1)
+    has_era = (found < len(ends_date)) & (ends_group[found_in_range] == group)
+    return ends_date[found_in_range], has_era
+
+
+def read_intervals(
+    cnxn: Connection,
+    sql: str,
+    names: List[str],
+    batch_rows: int = 100000,
+    params: Optional[Dict[str, Any]] = None,
+) -> pd.DataFrame:
+    """The integer columns selected by sql with params, fetched in batches"""
+    result = cnxn.execution_options(stream_results=True).execute(
+        text(sql), params or {}
+    )
+    batches = [
+        np.array(rows, dtype=np.int64).reshape(-1, len(names))
+        for rows in result.partitions(batch_rows)
+    ]
+    values = (
+        np.concatenate(batches)
+        if batches
+        else np.empty((0, len(names)), dtype=np.int64)
+    )
+    return pd.DataFrame(values, columns=names)
+
+
+def era_ids(
+    cnxn: Connection, id_column: Any, shard: int = 0, shards: int = 1
+) -> Dict[str, int]:
+    """The first_id and id_stride numbering the eras of some persons
+
+    Shard i of a sharded run takes the ids i + 1, i + 1 + shards, and so on
+    of the era tables the run created empty, which no other shard takes.
+    Otherwise the eras are numbered after the existing ones.
+    """
+    if shards > 1:
+        return {"first_id": shard + 1, "id_stride": shards}
+    last_id = cnxn.execute(
+        text(f"SELECT COALESCE(MAX({id_column.key}), 0) FROM {id_column.table}")
+    ).scalar()
+    return {"first_id": last_id + 1, "id_stride": 1}
+
+
+def numpy_eras(
+    intervals: pd.DataFrame,
+    keys: Sequence[str],
+    columns: Sequence[str] = (),
+    gap_days: int = ERA_GAP_DAYS,
+) -> pd.DataFrame:
+    """The eras of intervals, as the era transforms insert them
+
+    Intervals has the keys and columns and the era_start and era_stop day
+    numbers. One row is given per keys, columns and era, with the first
+    era_start, the era_end_date and the count of distinct starts as
+    interval_count, the dates being datetime64 values.
+    """
+    group = intervals.groupby(list(keys), sort=False).ngroup().to_numpy()
+    ends, has_era = era_ends(
+        group.astype(np.int64),
+        intervals["era_start"].to_numpy(),
+        intervals["era_stop"].to_numpy(),
+        gap_days=gap_days,
+    )
+    eras = (
+        intervals.loc[has_era]
+        .assign(era_end_date=ends[has_era])
+        .groupby([*keys, *columns, "era_end_date"], sort=True)["era_start"]
+        .agg(["min", "nunique"])
+        .reset_index()
+        .rename(columns={"min": "era_start", "nunique": "interval_count"})
+    )
+    logger.debug("%s eras built from %s intervals", len(eras), len(intervals))
+    for column in ("era_start", "era_end_date"):
+        eras[column] = EPOCH + eras[column].to_numpy().astype("timedelta64[D]")
+    return eras
@@ -0,0 +1,166 @@
+"""Encoder for the binary format of the Postgres COPY command
+
+https://www.postgresql.org/docs/current/sql-copy.html#id-1.9.3.55.9.4
+"""
+
+import struct
+from typing import Any, Final, List, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import (
+    BigInteger,
+    Boolean,
+    Date,
+    Float,
+    Integer,
+    SmallInteger,
+    String,
+    Table,
+    Text,
+)
+
+PGCOPY_HEADER: Final[bytes] = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+PGCOPY_TRAILER: Final[bytes] = struct.pack(">h", -1)
+
+# Postgres dates are days since 2000-01-01
+_PG_EPOCH: Final = np.datetime64("2000-01-01", "D")
+
+
+class PGCopyEncodeError(ValueError):
+    """A column that cannot be encoded in the binary COPY format"""
+
+
+class BinaryColumn:
+    """The values of one column, converted for binary encoding
+
+    Fixed-width types are held as big-endian NumPy arrays, text as Python
+    strings which are encoded batch by batch.
+    """
+
+    def __init__(self, name: str, nulls: np.ndarray, values: np.ndarray) -> None:
+        self.name = name
+        self.nulls = nulls
+        self.values = values
+        self.width: Optional[int] = (
+            None if values.dtype == object else values.dtype.itemsize
+        )
+
+
+def _integer_values(column: pd.Series, nulls: np.ndarray, dtype: str) -> np.ndarray:
+    values = pd.to_numeric(column.mask(nulls, 0), errors="raise")
+    if (values % 1 != 0).any():
+        raise PGCopyEncodeError("non-integral values")
+    info = np.iinfo(np.dtype(dtype).newbyteorder("="))
+    if values.min() < info.min or values.max() > info.max:
+        raise PGCopyEncodeError(f"values out of range for {dtype}")
+    return values.to_numpy(dtype="int64").astype(dtype)
+
+
+def _date_values(column: pd.Series, nulls: np.ndarray) -> np.ndarray:
+    values = column[~nulls].astype(str)
+    if not values.str.fullmatch(r"\d{4}-\d{2}-\d{2}").all():
+        raise PGCopyEncodeError("dates not in YYYY-MM-DD format")
+    # numpy parses ISO dates over a far wider range than pandas timestamps
+    dates = np.array(values.tolist(), dtype="datetime64[D]")
+    days = np.zeros(len(column), dtype=">i4")
+    days[~nulls] = (dates - _PG_EPOCH).astype("int64")
+    return days
+
+
+def binary_column(column: pd.Series, column_type: Any) -> BinaryColumn:
+    """Convert a column to the representation of its Postgres type"""
+    nulls = column.isna().to_numpy()
+    try:
+        if isinstance(column_type, Boolean):
+            if not pd.api.types.is_bool_dtype(column.dropna().infer_objects()):
+                raise PGCopyEncodeError("non-boolean values")
+            values = column.mask(nulls, False).to_numpy(dtype="u1")
+        elif isinstance(column_type, SmallInteger):
+            values = _integer_values(column, nulls, ">i2")
+        elif isinstance(column_type, BigInteger):
+            values = _integer_values(column, nulls, ">i8")
+        elif isinstance(column_type, Integer):
+            values = _integer_values(column, nulls, ">i4")
+        elif isinstance(column_type, Float) and not column_type.asdecimal:
+            values = pd.to_numeric(column.mask(nulls, 0)).to_numpy(dtype=">f8")
+        elif isinstance(column_type, Date):
+            values = _date_values(column, nulls)
+        elif isinstance(column_type, (String, Text)):
+            values = column.to_numpy(dtype=object)
+            # an empty string is written as an unquoted empty CSV field,
+            # which COPY reads as NULL
+            nulls = nulls | (values == "")
+        else:
+            raise PGCopyEncodeError(f"unsupported type {column_type!r}")
+    except (TypeError, ValueError, OverflowError) as error:
+        raise PGCopyEncodeError(f"column {column.name}: {error}") from error
+    return BinaryColumn(str(column.name), nulls, values)
+
+
+def binary_columns(
+    dataframe: pd.DataFrame, columns: List[str], table: Table
+) -> List[BinaryColumn]:
+    """Convert the given columns using the column types of table
+
+    Raises PGCopyEncodeError if any column cannot be encoded.
+    """
+    result = []
+    for name in columns:
+        if name not in table.columns:
+            raise PGCopyEncodeError(f"column {name} not in {table}")
+        result.append(binary_column(dataframe[name], table.columns[name].type))
+    return result
+
+
+def _scatter(out: np.ndarray, starts: np.ndarray, data: np.ndarray) -> None:
+    """Write data, rows of equal width, to out at the given start offsets"""
+    out[starts[:, None] + np.arange(data.shape[1])] = data
+
+
+def encode_rows(columns: List[BinaryColumn], start: int, stop: int) -> bytes:
+    """Encode rows start:stop as binary COPY tuples, without header/trailer"""
+    rows = stop - start
+    payloads: List[Any] = []
+    lengths = np.empty((rows, len(columns)), dtype=np.int64)
+    for j, column in enumerate(columns):
+        nulls = column.nulls[start:stop]
+        if column.width is None:
+            encoded = [
+                str(value).encode("utf-8")
+                for value in column.values[start:stop][~nulls]
+            ]
+            sizes = np.zeros(rows, dtype=np.int64)
+            sizes[~nulls] = [len(value) for value in encoded]
+            payloads.append(encoded)
+        else:
+            sizes = np.where(nulls, 0, column.width)
+            payloads.append(None)
+        lengths[:, j] = sizes
+
+    # every field is a 4 byte length followed by the data
+    cell_sizes = lengths + 4
+    row_sizes = 2 + cell_sizes.sum(axis=1)
+    row_starts = np.cumsum(row_sizes) - row_sizes
+    cell_starts = row_starts[:, None] + 2 + np.cumsum(cell_sizes, axis=1) - cell_sizes
+
+    out = np.empty(int(row_sizes.sum()), dtype=np.uint8)
+    field_count = np.frombuffer(struct.pack(">h", len(columns)), dtype=np.uint8)
+    _scatter(out, row_starts, np.broadcast_to(field_count, (rows, 2)))
+
+    for j, column in enumerate(columns):
+        nulls = column.nulls[start:stop]
+        field_lengths = np.where(nulls, -1, lengths[:, j]).astype(">i4")
+        _scatter(out, cell_starts[:, j], field_lengths.view(np.uint8).reshape(-1, 4))
+        data_starts = cell_starts[~nulls, j] + 4
+        if column.width is not None:
+            data = column.values[start:stop][~nulls]
+            _scatter(out, data_starts, data.view(np.uint8).reshape(-1, column.width))
+        elif payloads[j]:
+            sizes = lengths[~nulls, j]
+            blob = np.frombuffer(b"".join(payloads[j]), dtype=np.uint8)
+            # position of every byte: its field start plus its offset within
+            offsets = np.arange(blob.size) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+            out[np.repeat(data_starts, sizes) + offsets] = blob
+
+    return out.tobytes()
@@ -1,6 +1,10 @@
 """A module for generating random values, dates, etc"""
 
 # pylint: disable=invalid-name
+import threading
+
+# the chunked source load may hand out keys from several threads
+_KEY_LOCK = threading.Lock()
 
 
 def static_vars(**kwargs):
@@ -17,7 +21,19 @@ def static_vars(**kwargs):
 @static_vars(count=0)
 def generate_int_primary_key() -> int:
     """Generate a primary key"""
-    # pylint: disable=E1101
-    generate_int_primary_key.count += 1
-    # pylint: disable=E1101
-    return generate_int_primary_key.count
+    with _KEY_LOCK:
+        # pylint: disable=E1101
+        generate_int_primary_key.count += 1
+        # pylint: disable=E1101
+        return generate_int_primary_key.count
+
+
+def generate_int_primary_keys(count: int) -> range:
+    """Generate a block of consecutive primary keys, sharing the counter of
+    generate_int_primary_key"""
+    with _KEY_LOCK:
+        # pylint: disable=E1101
+        first = generate_int_primary_key.count + 1
+        # pylint: disable=E1101
+        generate_int_primary_key.count += count
+    return range(first, first + count)
@@ -0,0 +1,110 @@
+"""Run the shards of a sharded run, each in its own worker process"""
+
+import logging
+import multiprocessing
+import os
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener
+from multiprocessing.connection import wait
+from typing import Any, Callable, Dict, Iterator, List
+
+from ..models.source import SOURCE_SCHEMA_ENV, shard_schema
+from .exceptions import ETLFatalErrorException
+
+logger = logging.getLogger(__name__)
+
+
+class _ShardLogHandler(QueueHandler):
+    """Pass the log records of a shard on to the run, marked with the shard"""
+
+    def __init__(self, queue: Any, shard: int) -> None:
+        super().__init__(queue)
+        self.shard = shard
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = super().prepare(record)
+        record.msg = f"shard {self.shard}: {record.msg}"
+        return record
+
+
+class _RunLogHandler(logging.Handler):
+    """Handle the log records of the shards with the loggers of the run"""
+
+    def emit(self, record: logging.LogRecord) -> None:
+        logging.getLogger(record.name).handle(record)
+
+
+@contextmanager
+def _environ(name: str, value: str) -> Iterator[None]:
+    previous = os.environ.get(name)
+    os.environ[name] = value
+    try:
+        yield
+    finally:
+        if previous is None:
+            del os.environ[name]
+        else:
+            os.environ[name] = previous
+
+
+def _run_shard(func: Callable, shard: int, args: tuple, queue: Any, level: int) -> None:
+    """The main function of the worker process of a shard"""
+    root = logging.getLogger()
+    root.addHandler(_ShardLogHandler(queue, shard))
+    root.setLevel(level)
+    try:
+        func(shard, *args)
+    except Exception:  # pylint: disable=broad-exception-caught
+        logger.exception("shard %s failed", shard)
+        raise SystemExit(1) from None
+
+
+def _wait(processes: List[Any]) -> None:
+    """Wait for the processes, raising at the first one that failed"""
+    pending: Dict[Any, int] = {
+        process.sentinel: shard for shard, process in enumerate(processes)
+    }
+    while pending:
+        for sentinel in wait(list(pending)):
+            shard = pending.pop(sentinel)
+            processes[shard].join()
+            if processes[shard].exitcode != 0:
+                raise ETLFatalErrorException(
+                    f"Shard {shard} failed with exit code"
+                    f" {processes[shard].exitcode}"
+                )
+            logger.info("shard %s done", shard)
+
+
+def run_shards(func: Callable, shards: int, *args: Any) -> None:
+    """Call func(shard, *args) for every shard, each in a worker process
+
+    The processes are started afresh with the arguments pickled, and with
+    the schema of their shard as the source schema, every shard stages its
+    source tables apart. Their log records are handled by the loggers of
+    the run. A failed shard stops the others and raises.
+    """
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    listener = QueueListener(queue, _RunLogHandler())
+    level = logger.getEffectiveLevel()
+    processes: List[Any] = []
+    listener.start()
+    try:
+        for shard in range(shards):
+            process = context.Process(
+                target=_run_shard,
+                args=(func, shard, args, queue, level),
+                name=f"shard-{shard}",
+            )
+            # the source models read the schema when first imported
+            with _environ(SOURCE_SCHEMA_ENV, shard_schema(shard)):
+                process.start()
+            processes.append(process)
+        _wait(processes)
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+        listener.stop()
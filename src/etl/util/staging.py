@@ -0,0 +1,130 @@
+"""Load tables in parallel over extra connections through a staging schema"""
+
+import logging
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from typing import Any, Final, Protocol, Sequence, Tuple, TypeAlias
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+from ..models.modelutils import (
+    DIALECT_POSTGRES,
+    create_tables_sql,
+    move_tables_sql,
+    schema_copy,
+    set_constraints_sql,
+    set_indexes_sql,
+)
+
+logger = logging.getLogger(__name__)
+
+STAGING_SCHEMA_PREFIX: Final[str] = "etl_staging"
+
+
+class LoadFunc(Protocol):
+    """The load of a job, called with keywords only"""
+
+    def __call__(self, *, cnxn: Connection, target: Any) -> None:
+        """Fill target, the staged model, over cnxn, the worker connection"""
+
+
+# a job fills the staged copy of its model
+LoadJob: TypeAlias = Tuple[Any, LoadFunc]
+
+
+def staging_schema(name: str) -> str:
+    """The staging schema used by the parallel load called name"""
+    return f"{STAGING_SCHEMA_PREFIX}_{name}"
+
+
+def drop_staging_schemas(cnxn: Connection) -> None:
+    """Drop the staging schemas left behind by the rolled back runs"""
+    schemas = cnxn.execute(
+        text(
+            "SELECT schema_name FROM information_schema.schemata"
+            f" WHERE schema_name LIKE '{STAGING_SCHEMA_PREFIX}\\_%'"
+        )
+    ).scalars()
+    for schema in schemas.all():
+        logger.debug("dropping the staging schema %s", schema)
+        cnxn.execute(text(f"DROP SCHEMA {schema} CASCADE;"))
+
+
+def _reset_schema(engine: Engine, schema: str) -> None:
+    """Recreate schema empty, committed so every worker sees it"""
+    with engine.connect() as cnxn:
+        with cnxn.begin():
+            cnxn.execute(
+                text(
+                    f"DROP SCHEMA IF EXISTS {schema} CASCADE;"
+                    f" CREATE SCHEMA {schema};"
+                )
+            )
+
+
+def _drop_schema(engine: Engine, schema: str) -> None:
+    with engine.connect() as cnxn:
+        with cnxn.begin():
+            cnxn.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE;"))
+
+
+def _run_job(engine: Engine, schema: str, job: LoadJob, unlogged: bool) -> None:
+    """Create the staged table and fill it, in one worker transaction"""
+    model, load = job
+    staged = schema_copy(model, schema)
+    with engine.connect() as cnxn:
+        with cnxn.begin():
+            cnxn.execute(
+                text(
+                    create_tables_sql(
+                        [staged], dialect=DIALECT_POSTGRES, unlogged=unlogged
+                    )
+                    + " "
+                    + set_indexes_sql([staged], dialect=DIALECT_POSTGRES)
+                    + " "
+                    + set_constraints_sql([staged], dialect=DIALECT_POSTGRES)
+                )
+            )
+            load(cnxn=cnxn, target=staged)
+
+
+def parallel_load(
+    cnxn: Connection,
+    name: str,
+    jobs: Sequence[LoadJob],
+    workers: int,
+    unlogged: bool = False,
+) -> None:
+    """Run the load jobs on a pool of extra connections
+
+    Every job creates and fills its table in a staging schema and commits
+    there. Only once all jobs succeeded are the staged tables moved over
+    the tables of their models, within the transaction of cnxn, so the
+    load stays all-or-nothing. If a job fails the staging schema is
+    dropped and the error is raised again, leaving the tables untouched.
+
+    The staging schema is dropped within the transaction of cnxn as well:
+    if that transaction rolls back, the schema stays behind until the next
+    run drops it with drop_staging_schemas.
+    """
+    engine = cnxn.engine
+    schema = staging_schema(name)
+    _reset_schema(engine, schema)
+    logger.debug("loading %s tables on %s connections", len(jobs), workers)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(_run_job, engine, schema, job, unlogged) for job in jobs
+        ]
+        wait(futures, return_when=FIRST_EXCEPTION)
+        # stop at the first failure, the running jobs are waited for
+        if any(future.done() and future.exception() for future in futures):
+            for future in futures:
+                future.cancel()
+    for future in futures:
+        if not future.cancelled() and (exc := future.exception()) is not None:
+            _drop_schema(engine, schema)
+            raise exc
+    models = [model for model, _ in jobs]
+    cnxn.execute(
+        text(move_tables_sql(models, from_schema=schema) + f" DROP SCHEMA {schema};")
+    )
@@ -9,7 +9,10 @@ from etl.models.source import SOURCE_MODELS
 from etl.sql.create_logger_tables import SQL as logger_sql_stmt
 from etl.sql.create_lookup_tables import SQL as lookup_sql_stmt
 from etl.sql.create_omopcdm_tables import SQL as omopcdm_sql_stmt
+from etl.sql.create_omopcdm_tables import SQL_CREATE as omopcdm_create_sql_stmt
 from etl.sql.create_source_tables import SQL as source_sql_stmt
+from etl.sql.create_source_tables import SQL_ANALYZE as source_analyze_sql_stmt
+from etl.sql.create_source_tables import SQL_BULK as source_bulk_sql_stmt
 from etl.transform.create_logger_tables import transform as create_logger_tables
 from etl.transform.create_lookup_tables import transform as create_lookup_tables
 from etl.transform.create_omopcdm_tables import (
@@ -27,6 +30,7 @@ class TestCreateOmopTables(unittest.TestCase):
     @patch("etl.transform.transformutils.ETLContext")
     def test_create_omop_tables(self, mock_ctxt):
         """Test create omop tables ddl"""
+        mock_ctxt.config.incremental = False
         mock_cnxn = mock_ctxt.transaction.return_value.__enter__.return_value
         create_omopcdm_tables(mock_ctxt)
 
@@ -35,6 +39,20 @@ class TestCreateOmopTables(unittest.TestCase):
             set([omopcdm_sql_stmt]).issubset(set(actual_str_queries)),
         )
 
+    @patch("etl.transform.transformutils.ETLContext")
+    def test_create_omop_tables_incremental(self, mock_ctxt):
+        """Test that an incremental run keeps the tables of the last one"""
+        mock_ctxt.config.incremental = True
+        mock_cnxn = mock_ctxt.transaction.return_value.__enter__.return_value
+        # the patient state exists and has rows
+        mock_cnxn.execute.return_value.scalar.return_value = True
+        create_omopcdm_tables(mock_ctxt)
+
+        actual_str_queries = get_sql_str_list(mock_cnxn.execute.call_args_list)
+        self.assertIn(omopcdm_create_sql_stmt, actual_str_queries)
+        self.assertNotIn(omopcdm_sql_stmt, actual_str_queries)
+        self.assertNotIn("DROP TABLE", omopcdm_create_sql_stmt)
+
 
 class TestCreateLoggerTable(unittest.TestCase):
     """Test class: create logger table"""
@@ -42,6 +60,7 @@ class TestCreateLoggerTable(unittest.TestCase):
     @patch("etl.transform.transformutils.ETLContext")
     def test_create_logger_table(self, mock_ctxt):
         """Test create logger table ddl"""
+        mock_ctxt.config.incremental = False
         mock_cnxn = mock_ctxt.transaction.return_value.__enter__.return_value
         create_logger_tables(mock_ctxt)
 
@@ -60,6 +79,7 @@ class TestCreateLookupTable(unittest.TestCase):
         lookup_loader = EmptyLoader(LOOKUP_MODELS)
         lookup_loader.load()
         mock_ctxt.lookups = lookup_loader.data
+        mock_ctxt.config.copy_workers = 1
         mock_cnxn = mock_ctxt.transaction.return_value.__enter__.return_value
         create_lookup_tables(mock_ctxt)
 
@@ -106,6 +126,8 @@ class TestCreateSourceTables(unittest.TestCase):
         source_loader = EmptyLoader(SOURCE_MODELS)
         source_loader.load()
         mock_ctxt.sources = source_loader.data
+        mock_ctxt.config.bulk_load = False
+        mock_ctxt.config.copy_workers = 1
         mock_cnxn = mock_ctxt.transaction.return_value.__enter__.return_value
         create_source_tables(mock_ctxt)
 
@@ -114,6 +136,25 @@ class TestCreateSourceTables(unittest.TestCase):
             set([source_sql_stmt]).issubset(set(actual_str_queries)),
         )
 
+    @patch("etl.transform.transformutils.ETLContext")
+    def test_create_source_tables_bulk_load(self, mock_ctxt):
+        """Test create source tables ddl in bulk load mode"""
+        source_loader = EmptyLoader(SOURCE_MODELS)
+        source_loader.load()
+        mock_ctxt.sources = source_loader.data
+        mock_ctxt.config.bulk_load = True
+        mock_ctxt.config.copy_workers = 1
+        mock_cnxn = mock_ctxt.transaction.return_value.__enter__.return_value
+        create_source_tables(mock_ctxt)
+
+        actual_str_queries = get_sql_str_list(mock_cnxn.execute.call_args_list)
+        self.assertTrue(
+            set([source_bulk_sql_stmt, source_analyze_sql_stmt]).issubset(
+                set(actual_str_queries)
+            ),
+        )
+        self.assertIn("CREATE UNLOGGED TABLE", source_bulk_sql_stmt)
+
 
 __all__ = [
     "TestCreateOmopTables",
@@ -2,7 +2,19 @@
 
 import unittest
 
-from etl.models.lookupmodels import LOOKUP_MODEL_NAMES, LOOKUP_MODELS
+import pandas as pd
+from sqlalchemy import select
+
+from etl.models.lookupmodels import (
+    LOOKUP_MODEL_NAMES,
+    LOOKUP_MODELS,
+    ConceptLookup,
+    LookupFilter,
+)
+from etl.models.modelutils import create_tables_sql, set_indexes_sql
+from etl.models.omopcdm54.registry import TARGET_SCHEMA
+from etl.util.db import df_to_sql
+from tests.testutils import PostgresBaseTest
 
 
 class LookupModelsUnitTest(unittest.TestCase):
@@ -27,4 +39,52 @@ class LookupModelsUnitTest(unittest.TestCase):
             )
 
 
-__all__ = ["LookupModelsUnitTest"]
+class ConceptLookupPostgresTest(PostgresBaseTest):
+    """Postgres test class for the concept lookup keys"""
+
+    def setUp(self):
+        super().setUp()
+        self._drop_tables_and_schema(models=[ConceptLookup])
+        with self.engine.begin() as cnxn:
+            cnxn.execute(
+                f"CREATE SCHEMA IF NOT EXISTS {TARGET_SCHEMA};"
+                + create_tables_sql([ConceptLookup])
+                + set_indexes_sql([ConceptLookup])
+            )
+
+    def tearDown(self) -> None:
+        self._drop_tables_and_schema(models=[ConceptLookup])
+        super().tearDown()
+
+    def test_keys(self):
+        lookup_df = pd.DataFrame(
+            {
+                "concept_string": ["ms_status_clin_statusC_stable", "NL"],
+                "standard_concept_id": [1, 2],
+                "filter": ["VAC", "location"],
+            }
+        )
+        with self.engine.begin() as cnxn:
+            df_to_sql(
+                cnxn,
+                lookup_df,
+                table=str(ConceptLookup.__table__),
+                columns=lookup_df.columns,
+            )
+        with self.engine.connect() as cnxn:
+            keys_df = pd.read_sql(
+                select(ConceptLookup.concept_key, ConceptLookup.filter_key).order_by(
+                    ConceptLookup.standard_concept_id
+                ),
+                cnxn,
+            )
+        self.assertListEqual(
+            keys_df.values.tolist(),
+            [
+                ["ms_status_clin_statusc_stable", LookupFilter.VAC.value],
+                ["nl", LookupFilter.LOCATION.value],
+            ],
+        )
+
+
+__all__ = ["LookupModelsUnitTest", "ConceptLookupPostgresTest"]
@@ -0,0 +1,94 @@
+"""Person range builder tests"""
+
+from sqlalchemy import insert, text
+
+from etl.models.modelutils import create_tables_sql, drop_tables_sql
+from etl.models.source import SOURCE_SCHEMA, Patient
+from etl.sql.person_range import (
+    ALL_PERSONS,
+    PERSON_RANGE_LOWER,
+    PERSON_RANGE_UPPER,
+    is_partitioned,
+    person_range,
+)
+from etl.transform.transformutils import person_ranges
+from tests.testutils import PostgresBaseTest
+
+
+class PersonRangePostgresTest(PostgresBaseTest):
+    """Postgres test class for person_range"""
+
+    SQL = (
+        "SELECT v.person_id FROM (VALUES (1), (2), (3), (5), (8)) v(person_id)"
+        f" WHERE {person_range('v.person_id')} ORDER BY 1"
+    )
+
+    def _persons(self, params):
+        with self.engine.connect() as cnxn:
+            return [row[0] for row in cnxn.execute(text(self.SQL), params)]
+
+    def test_all_persons(self):
+        self.assertListEqual(self._persons(ALL_PERSONS), [1, 2, 3, 5, 8])
+
+    def test_ranges(self):
+        persons = [
+            self._persons({PERSON_RANGE_LOWER: lower, PERSON_RANGE_UPPER: upper})
+            for lower, upper in [(None, 2), (2, 5), (5, None)]
+        ]
+        self.assertListEqual(persons, [[1, 2], [3, 5], [8]])
+
+    def test_is_partitioned(self):
+        self.assertTrue(is_partitioned(self.SQL))
+        self.assertFalse(is_partitioned("SELECT 1"))
+
+
+class PersonRangesPostgresTest(PostgresBaseTest):
+    """Postgres test class for person_ranges"""
+
+    # patient 8 has two rows, as in the dummy data
+    PATIENTS = [1, 2, 3, 5, 8, 8, 13, 21, 34]
+
+    def setUp(self):
+        super().setUp()
+        with self.engine.begin() as cnxn:
+            cnxn.execute(
+                text(
+                    f"CREATE SCHEMA IF NOT EXISTS {SOURCE_SCHEMA};"
+                    + drop_tables_sql([Patient])
+                    + create_tables_sql([Patient])
+                )
+            )
+            cnxn.execute(
+                insert(Patient),
+                [
+                    {"_id": i, "patient_id": patient_id}
+                    for i, patient_id in enumerate(self.PATIENTS)
+                ],
+            )
+
+    def tearDown(self):
+        with self.engine.begin() as cnxn:
+            cnxn.execute(text(drop_tables_sql([Patient])))
+        super().tearDown()
+
+    def test_every_person_in_one_range(self):
+        persons = sorted(set(self.PATIENTS))
+        sql = (
+            f"SELECT DISTINCT {Patient.patient_id.key} FROM {Patient.__table__}"
+            f" WHERE {person_range(Patient.patient_id.key)}"
+        )
+        for ranges in range(1, len(persons) + 2):
+            with self.subTest(ranges=ranges), self.engine.connect() as cnxn:
+                bounds = person_ranges(cnxn, ranges)
+                self.assertEqual(len(bounds), min(ranges, len(persons)))
+                # the upper bounds are persons, on the boundary of two ranges
+                self.assertTrue(set(upper for _, upper in bounds[:-1]) <= set(persons))
+                in_ranges = [
+                    row[0]
+                    for lower, upper in bounds
+                    for row in cnxn.execute(
+                        text(sql),
+                        {PERSON_RANGE_LOWER: lower, PERSON_RANGE_UPPER: upper},
+                    )
+                ]
+                self.assertListEqual(sorted(in_ranges), persons)
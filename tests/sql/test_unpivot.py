@@ -0,0 +1,69 @@
+"""Unpivot builder tests"""
+
+from typing import Any, Final
+
+from sqlalchemy import text
+
+from etl.models.modelutils import CharField, IntField, make_model_base
+from etl.sql.unpivot import UnpivotRow, unpivot_sql
+from tests.testutils import PostgresBaseTest
+
+TestModelBase: Any = make_model_base()
+
+
+class UnpivotPostgresTest(PostgresBaseTest):
+    """Postgres test class for unpivot_sql"""
+
+    class DummyTable(TestModelBase):
+        __tablename__: Final = "dummy_wide"
+        __table_args__ = {"schema": "dummy"}
+
+        pk: Final = IntField(primary_key=True)
+        patient_id: Final = IntField()
+        a: Final = CharField(10)
+        b: Final = IntField()
+
+    def setUp(self):
+        super().setUp()
+        self._create_tables_and_schema(models=[self.DummyTable], schema="dummy")
+        with self.engine.begin() as cnxn:
+            cnxn.execute(
+                text(
+                    f"INSERT INTO {self.DummyTable.__table__} VALUES"
+                    " (1, 1, 'x', 5), (2, 1, 'x', NULL), (3, 2, NULL, 0)"
+                )
+            )
+
+    def tearDown(self) -> None:
+        self._drop_tables_and_schema(models=[self.DummyTable], schema="dummy")
+        super().tearDown()
+
+    def _unpivot(self, distinct: bool):
+        sql = unpivot_sql(
+            source=str(self.DummyTable.__table__),
+            keys=["patient_id"],
+            columns=["source_value"],
+            rows=[
+                UnpivotRow("a", ("a",)),
+                UnpivotRow("b", ("b::VARCHAR",), "b > 0"),
+            ],
+            distinct=distinct,
+        )
+        with self.engine.connect() as cnxn:
+            return sorted(
+                tuple(row)
+                for row in cnxn.execute(
+                    text(f'SELECT patient_id, source_value, "table" FROM ({sql}) s')
+                )
+            )
+
+    def test_unpivot(self):
+        self.assertListEqual(
+            self._unpivot(distinct=True), [(1, "5", "b"), (1, "x", "a")]
+        )
+
+    def test_unpivot_keeps_repeated_rows(self):
+        self.assertListEqual(
+            self._unpivot(distinct=False),
+            [(1, "5", "b"), (1, "x", "a"), (1, "x", "a")],
+        )
@@ -0,0 +1,81 @@
+"""Loader tests"""
+
+import io
+import unittest
+from pathlib import Path
+
+import pandas as pd
+
+from etl.loader import CSVFileLoader, coerce_types, model_usecols
+from etl.models.source import SOURCE_MODELS, Symptom
+from etl.util.exceptions import ETLFatalErrorException
+
+
+class LoaderUnitTest(unittest.TestCase):
+    """Unit test class for the typed csv read plan"""
+
+    def test_read_plan(self):
+        data = io.StringIO(
+            "PATIENT_ID;date_visit;unused;sever_symp;current_symptom\n"
+            "1;01/01/2001;x;3;symp_pain\n"
+            "2;02/01/2001;y;<not performed>;\n"
+            "3;03/01/2001;z;many;symp_pain\n"
+            "4;04/01/2001;z;2.5;symp_pain\n"
+        )
+        input_df = pd.read_csv(data, sep=";", usecols=model_usecols(Symptom), dtype=str)
+        self.assertListEqual(
+            list(input_df.columns),
+            ["PATIENT_ID", "date_visit", "sever_symp", "current_symptom"],
+        )
+
+        with self.assertLogs("etl.loader", level="WARNING") as logs:
+            output_df = coerce_types("symptom", Symptom, input_df)
+
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn("sever_symp", logs.output[0])
+        self.assertIn("'many', '2.5'", logs.output[0])
+        self.assertEqual(output_df["PATIENT_ID"].dtype, "Int64")
+        pd.testing.assert_series_equal(
+            output_df["sever_symp"],
+            pd.Series([3, None, None, None], dtype="Int64", name="sever_symp"),
+        )
+        self.assertEqual(output_df["date_visit"].dtype, object)
+
+    def test_parallel_load(self):
+        directory = Path("tests/csv/dummy_data")
+        serial = CSVFileLoader(directory, SOURCE_MODELS, delimiter=";").load()
+        parallel = CSVFileLoader(
+            directory, SOURCE_MODELS, delimiter=";", workers=4
+        ).load()
+
+        self.assertListEqual(list(serial.data), list(parallel.data))
+        for tablename, table_df in serial.data.items():
+            pd.testing.assert_frame_equal(table_df, parallel.data[tablename])
+
+    def test_sharded_load(self):
+        directory = Path("tests/csv/dummy_data")
+        full = CSVFileLoader(directory, SOURCE_MODELS, delimiter=";").load()
+        shards = [
+            CSVFileLoader(
+                directory, SOURCE_MODELS, delimiter=";", shard=shard, shards=3
+            ).load()
+            for shard in range(3)
+        ]
+
+        patients = [set(shard.data["patient"]["patient_id"]) for shard in shards]
+        self.assertSetEqual(
+            set.union(*patients), set(full.data["patient"]["patient_id"])
+        )
+        self.assertEqual(sum(map(len, patients)), len(set.union(*patients)))
+        for tablename, table_df in full.data.items():
+            self.assertEqual(
+                sum(len(shard.data[tablename]) for shard in shards),
+                len(table_df),
+            )
+
+    def test_parallel_load_missing_file(self):
+        loader = CSVFileLoader(
+            Path("tests/csv"), SOURCE_MODELS, delimiter=";", workers=4
+        )
+        with self.assertRaises(ETLFatalErrorException):
+            loader.load()
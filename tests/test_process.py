@@ -1,13 +1,27 @@
 import logging
+import shutil
+import sys
+import tempfile
 import unittest
-from typing import Any, Final
+from pathlib import Path
+from types import ModuleType
+from typing import Any, Dict, Final
 from unittest.mock import patch
 
 import pandas as pd
-from sqlalchemy import func, insert, select
-
+from sqlalchemy import func, insert, select, text
+
+from etl.checkpoint import (
+    Checkpoints,
+    code_digest,
+    reusable_steps,
+    step_fingerprints,
+    steps_to_skip,
+)
 from etl.config import ETLConf
 from etl.context import ETLContext
+from etl.models.etl_logger import ETLLogger, ETLRunState
+from etl.models.lookupmodels import PatientDelta
 from etl.models.modelutils import (
     CharField,
     FloatField,
@@ -16,10 +30,38 @@ from etl.models.modelutils import (
     drop_tables_sql,
     make_model_base,
 )
+from etl.models.omopcdm54.clinical import Person, VisitOccurrence
+from etl.models.omopcdm54.health_systems import Location
 from etl.models.omopcdm54.registry import TARGET_SCHEMA
 from etl.models.omopcdm54.vocabulary import Concept, ConceptAncestor, Vocabulary
-from etl.process import ModelSummary, StepsDict, run_etl, run_transformations
-from etl.transform.transformutils import execute_sql_transform
+from etl.models.source import SOURCE_MODELS
+from etl.process import (
+    ModelSummary,
+    StepsDict,
+    critical_path,
+    run_etl,
+    run_transformations,
+    step_dependencies,
+)
+from etl.sql.create_omopcdm_tables import MODELS as OMOP_MODELS
+from etl.transform import (
+    condition,
+    create_lookup_tables,
+    create_omopcdm_tables,
+    drug_era,
+    drug_exposure,
+    measurement,
+    observation,
+    preprocessing,
+    visit_lookup,
+    visit_occurrence,
+)
+from etl.transform.patient_delta import clear_patient_state, has_patient_state
+from etl.transform.transformutils import (
+    CTXT_LOOKUPS,
+    execute_sql_transform,
+    step_tables,
+)
 from etl.util.db import df_to_sql
 from etl.util.exceptions import (
     ETLFatalErrorException,
@@ -76,6 +118,7 @@ class ProcessUnitTests(unittest.TestCase):
             "transform1": transform1,
             "transform2": transform2,
         }
+        mock_ctxt.config.step_workers = 1
         mock_cnxn = mock_ctxt.transaction.return_value.__enter__.return_value
         mock_cursor = mock_cnxn.connection.cursor.return_value.__enter__.return_value
         self.assertEqual(
@@ -96,6 +139,141 @@ class ProcessUnitTests(unittest.TestCase):
             2,
             len(mock_cursor.copy_expert.call_args_list),
         )
+        # the run executes no SQL of its own around the steps
+        self.assertEqual(
+            0,
+            len(mock_cnxn.execute.call_args_list),
+        )
+
+
+class StepSchedulerTests(unittest.TestCase):
+    """Unit test the dependencies between the steps"""
+
+    def test_step_dependencies(self):
+        steps: StepsDict = {
+            "visit_occurrence": visit_occurrence.transform,
+            "visit_lookup": visit_lookup.transform,
+            "drug_exposure": drug_exposure.transform,
+            "condition": condition.transform,
+            "measurement": measurement.transform,
+            "observation": observation.transform,
+            "drug_era": drug_era.transform,
+            "undeclared": lambda ctxt: None,
+        }
+        dependencies = step_dependencies(steps)
+        self.assertListEqual(dependencies["visit_lookup"], ["visit_occurrence"])
+        for stepname in ("drug_exposure", "condition"):
+            self.assertListEqual(dependencies[stepname], ["visit_lookup"])
+        # measurement reads the observations before they are written
+        self.assertListEqual(
+            dependencies["observation"], ["visit_lookup", "measurement"]
+        )
+        self.assertListEqual(dependencies["drug_era"], ["drug_exposure"])
+        self.assertListEqual(dependencies["undeclared"], list(steps)[:-1])
+
+    def test_in_memory_dependencies(self):
+        steps: StepsDict = {
+            "preprocess_data": preprocessing.transform,
+            "create_lookup": create_lookup_tables.transform,
+            "create_omop": create_omopcdm_tables.transform,
+        }
+        dependencies = step_dependencies(steps)
+        self.assertListEqual(dependencies["create_lookup"], ["preprocess_data"])
+        self.assertListEqual(dependencies["create_omop"], [])
+
+    def test_steps_to_skip(self):
+        dependencies = {"memory": [], "load": ["memory"], "a": [], "b": ["a"]}
+        # load runs again and needs the data kept in memory
+        self.assertSetEqual(
+            steps_to_skip({"memory", "a"}, {"memory"}, dependencies), {"a"}
+        )
+        self.assertSetEqual(
+            steps_to_skip({"memory", "load"}, {"memory"}, dependencies),
+            {"memory", "load"},
+        )
+
+    def test_step_fingerprints(self):
+        steps: StepsDict = {
+            "preprocess_data": preprocessing.transform,
+            "create_lookup": create_lookup_tables.transform,
+            "create_omop": create_omopcdm_tables.transform,
+        }
+        dependencies = step_dependencies(steps)
+        fingerprints = step_fingerprints(steps, dependencies, {CTXT_LOOKUPS: "lookups"})
+        self.assertDictEqual(
+            step_fingerprints(steps, dependencies, {CTXT_LOOKUPS: "lookups"}),
+            fingerprints,
+        )
+        # the new lookups reach the steps reading them through
+        # preprocess_data, which reads them first
+        changed = step_fingerprints(steps, dependencies, {CTXT_LOOKUPS: "new lookups"})
+        for stepname in steps:
+            self.assertEqual(
+                changed[stepname] == fingerprints[stepname],
+                stepname == "create_omop",
+            )
+
+    def test_code_digest_helper_module(self):
+        helper = ModuleType("etl._helper")
+        helper.SQL = "SELECT 1"
+        helper.render = lambda: helper.SQL
+        helper.render.__module__ = helper.__name__
+        step = ModuleType("etl._step")
+        step.render = helper.render
+        step.transform = lambda ctxt: None
+        step.transform.__module__ = step.__name__
+        other = ModuleType("etl._other")
+        with patch.dict(
+            sys.modules,
+            {module.__name__: module for module in (helper, step, other)},
+        ):
+            digest = code_digest(step.transform)
+            other.SQL = "SELECT 2"
+            self.assertEqual(code_digest(step.transform), digest)
+            # the step renders the SQL of the helper it imports
+            helper.SQL = "SELECT 2"
+            self.assertNotEqual(code_digest(step.transform), digest)
+
+    def test_reusable_steps(self):
+        steps: StepsDict = {
+            "create_lookup": create_lookup_tables.transform,
+            "create_omop": create_omopcdm_tables.transform,
+            "visit_occurrence": visit_occurrence.transform,
+            "visit_lookup": visit_lookup.transform,
+            "drug_era": drug_era.transform,
+        }
+        dependencies = step_dependencies(steps)
+        fingerprints = {stepname: "same" for stepname in steps}
+        completed = {stepname: ("done", "same") for stepname in steps}
+        self.assertSetEqual(
+            reusable_steps(steps, dependencies, fingerprints, completed),
+            set(steps),
+        )
+        # the OMOP CDM tables are created again with the new drug eras
+        self.assertSetEqual(
+            reusable_steps(
+                steps,
+                dependencies,
+                {**fingerprints, "drug_era": "new"},
+                completed,
+            ),
+            {"create_lookup"},
+        )
+        # a failed run resumes where it stopped
+        self.assertSetEqual(
+            reusable_steps(
+                steps,
+                dependencies,
+                {**fingerprints, "drug_era": "new"},
+                {**completed, "drug_era": ("failed", "new")},
+            ),
+            set(steps) - {"drug_era"},
+        )
+
+    def test_critical_path(self):
+        dependencies = {"a": [], "b": ["a"], "c": ["a"], "d": ["b", "c"]}
+        durations = {"a": 1.0, "b": 5.0, "c": 2.0, "d": 1.0}
+        self.assertListEqual(critical_path(dependencies, durations), ["a", "b", "d"])
 
 
 TestModelBase: Any = make_model_base()
@@ -290,6 +468,72 @@ class ProcessPostgresTests(PostgresBaseTest):
                 called = True
         self.assertTrue(called)
 
+    def test_resume_transformations(self):
+        self.addCleanup(self._drop_tables_and_schema, models=[ETLRunState])
+        self._drop_tables_and_schema(models=[ETLRunState])
+        calls = []
+        failing = [True]
+
+        # steps without declarations run again with the steps after them
+        @step_tables(writes=[self.DummyTable])
+        def transform1(ctxt: ETLContext):
+            calls.append("transform1")
+            with ctxt.transaction() as cnxn:
+                df_to_sql(
+                    cnxn,
+                    self.dummy_df,
+                    table=str(self.DummyTable.__table__),
+                    columns=self.dummy_df.columns,
+                )
+
+        @step_tables(reads=[self.DummyTable], writes=[self.DummyTableTwo])
+        def transform2(ctxt: ETLContext):
+            calls.append("transform2")
+            with ctxt.transaction() as cnxn:
+                df_to_sql(
+                    cnxn,
+                    self.dummy_df2,
+                    table=str(self.DummyTableTwo.__table__),
+                    columns=self.dummy_df2.columns,
+                )
+            if failing[0]:
+                raise TransformationErrorException("Transform 2 fails")
+
+        steps: StepsDict = {
+            "transform1": transform1,
+            "transform2": transform2,
+        }
+        config = ETLConf(cli_args=["--resume"])
+        fingerprints = step_fingerprints(steps, step_dependencies(steps), {})
+        with self.engine.connect() as cnxn:
+            ctxt = ETLContext(config=config, cnxn=cnxn, logger=logger)
+            with self.assertRaises(TransformationErrorException):
+                run_transformations(steps, ctxt, Checkpoints(fingerprints))
+            failing[0] = False
+            run_transformations(steps, ctxt, Checkpoints(fingerprints))
+
+            # the first step is committed and not run again, the failed one
+            # is rolled back
+            self.assertListEqual(calls, ["transform1", "transform2", "transform2"])
+            for model, count in ((self.DummyTable, 3), (self.DummyTableTwo, 2)):
+                self.assertEqual(self._get_table_count(model, ctxt).scalar(), count)
+            states = cnxn.execute(
+                select(
+                    ETLRunState.run_id,
+                    ETLRunState.step_name,
+                    ETLRunState.status,
+                ).order_by(ETLRunState.run_id, ETLRunState.step_name)
+            ).fetchall()
+        self.assertListEqual(
+            [tuple(state) for state in states],
+            [
+                (1, "transform1", "done"),
+                (1, "transform2", "failed"),
+                (2, "transform1", "skipped"),
+                (2, "transform2", "done"),
+            ],
+        )
+
     def test_model_summary(self):
         with self.engine.connect() as cnxn:
             ctxt = ETLContext(config=self.config, cnxn=cnxn, logger=logger)
@@ -320,6 +564,79 @@ class ProcessPostgresTests(PostgresBaseTest):
 class RunETLPostgresTests(PostgresBaseTest):
     """Unit test to run the ETL"""
 
+    def _run_with_fake_vocab(
+        self, config: ETLConf, schema: str = TARGET_SCHEMA
+    ) -> Dict[str, int]:
+        """Run the ETL over a fake vocabulary, giving the row count of every
+        OMOP CDM table it left in schema"""
+        with self.engine.connect() as cnxn:
+            ctxt = ETLContext(config=config, cnxn=cnxn)
+            sql = [
+                f"CREATE SCHEMA IF NOT EXISTS {TARGET_SCHEMA};",
+                drop_tables_sql([Concept, ConceptAncestor, Vocabulary]),
+                create_tables_sql([Concept, ConceptAncestor, Vocabulary]),
+                f"INSERT INTO {str(Vocabulary.__table__)} SELECT 'None', 'fake_vocab', 'fake_ref', 'fake_version', 1;",
+            ]
+            sql_stmt = " ".join(sql).strip().replace("\n", " ")
+            execute_sql_transform(ctxt, sql_stmt)
+            run_etl(config=config, cnxn=cnxn)
+            counts = {
+                model.__tablename__: cnxn.execute(
+                    text(f"SELECT COUNT(*) FROM {schema}.{model.__tablename__}")
+                ).scalar()
+                for model in OMOP_MODELS
+            }
+            execute_sql_transform(
+                ctxt, drop_tables_sql([Concept, ConceptAncestor, Vocabulary])
+            )
+        return counts
+
+    def _omop_tables(self) -> Dict[str, pd.DataFrame]:
+        """The sorted rows of the OMOP CDM tables and the ETL logger, without
+        their surrogate ids, the visits and locations referred to by their
+        start date and source value"""
+        with self.engine.connect() as cnxn:
+            visits = pd.read_sql(
+                select(
+                    VisitOccurrence.visit_occurrence_id,
+                    VisitOccurrence.visit_start_date,
+                ),
+                cnxn,
+                index_col="visit_occurrence_id",
+            )["visit_start_date"]
+            locations = pd.read_sql(
+                select(Location.location_id, Location.location_source_value),
+                cnxn,
+                index_col="location_id",
+            )["location_source_value"]
+            tables = {}
+            for model in OMOP_MODELS + [ETLLogger]:
+                table_df = pd.read_sql(select(model), cnxn).drop(
+                    columns=[
+                        column.key
+                        for column in model.__table__.primary_key.columns
+                        if column.key != "person_id"
+                    ]
+                )
+                for column, referred in (
+                    ("visit_occurrence_id", visits),
+                    ("preceding_visit_occurrence_id", visits),
+                    ("location_id", locations),
+                ):
+                    if column in table_df:
+                        table_df[column] = table_df[column].map(referred)
+                tables[model.__tablename__] = table_df.sort_values(
+                    by=list(table_df.columns), ignore_index=True
+                )
+        return tables
+
+    def _assert_tables_equal(
+        self, expected: Dict[str, pd.DataFrame], actual: Dict[str, pd.DataFrame]
+    ) -> None:
+        for tablename, table_df in expected.items():
+            with self.subTest(table=tablename):
+                pd.testing.assert_frame_equal(actual[tablename], table_df)
+
     def test_run_etl_with_empty_data(self):
         """Test running an etl with empty data"""
         config = ETLConf(
@@ -373,6 +690,205 @@ class RunETLPostgresTests(PostgresBaseTest):
                 ctxt, drop_tables_sql([Concept, ConceptAncestor, Vocabulary])
             )
 
+    def test_run_etl_with_load_options(self):
+        """Test that the load options all stage the same data"""
+        cli_args = ["--datadir=tests/csv/dummy_data", "--input-delimiter=;"]
+        staged = []
+        for config in (
+            ETLConf(cli_args=cli_args),
+            ETLConf(cli_args=cli_args + ["--chunksize=2"]),
+            ETLConf(cli_args=cli_args + ["--copy-format=binary"]),
+            ETLConf(cli_args=cli_args + ["--bulk-load", "--chunksize=3"]),
+            ETLConf(cli_args=cli_args + ["--copy-workers=4"]),
+            ETLConf(
+                cli_args=cli_args + ["--copy-workers=4", "--bulk-load", "--chunksize=3"]
+            ),
+        ):
+            with self.engine.connect() as cnxn:
+                ctxt = ETLContext(config=config, cnxn=cnxn)
+                sql = [
+                    f"CREATE SCHEMA IF NOT EXISTS {TARGET_SCHEMA};",
+                    drop_tables_sql([Concept, ConceptAncestor, Vocabulary]),
+                    create_tables_sql([Concept, ConceptAncestor, Vocabulary]),
+                    f"INSERT INTO {str(Vocabulary.__table__)} SELECT 'None', 'fake_vocab', 'fake_ref', 'fake_version', 1;",
+                ]
+                sql_stmt = " ".join(sql).strip().replace("\n", " ")
+                execute_sql_transform(ctxt, sql_stmt)
+                run_etl(config=config, cnxn=cnxn)
+                tables = {}
+                for model in SOURCE_MODELS.values():
+                    table_df = pd.read_sql(select(model), cnxn).drop(columns="_id")
+                    tables[model.__tablename__] = table_df.sort_values(
+                        by=list(table_df.columns), ignore_index=True
+                    )
+                # location ids follow the plan of the SELECT DISTINCT, which
+                # changes once the source tables are analyzed
+                tables["person"] = pd.read_sql(
+                    select(Person, Location.location_source_value)
+                    .outerjoin(Location, Person.location_id == Location.location_id)
+                    .order_by(Person.person_id),
+                    cnxn,
+                ).drop(columns="location_id")
+                staged.append(tables)
+                execute_sql_transform(
+                    ctxt, drop_tables_sql([Concept, ConceptAncestor, Vocabulary])
+                )
+
+        for tables in staged[1:]:
+            for tablename, table_df in staged[0].items():
+                pd.testing.assert_frame_equal(table_df, tables[tablename])
+
+    def test_run_etl_with_parallel_steps(self):
+        """Test that running steps in parallel gives the serial result"""
+        cli_args = ["--datadir=tests/csv/dummy_data", "--input-delimiter=;"]
+        counts = [
+            self._run_with_fake_vocab(ETLConf(cli_args=cli_args)),
+            self._run_with_fake_vocab(
+                ETLConf(
+                    cli_args=cli_args
+                    + ["--step-workers=4", "--publish-schema=published"]
+                ),
+                schema="published",
+            ),
+        ]
+        with self.engine.begin() as cnxn:
+            cnxn.execute(text("DROP SCHEMA IF EXISTS published CASCADE;"))
+
+        self.assertDictEqual(counts[0], counts[1])
+        self.assertGreater(counts[1]["person"], 0)
+
+    def test_run_etl_with_shards(self):
+        """Test that a sharded run gives the result of a run in one process"""
+        cli_args = ["--datadir=tests/csv/dummy_data", "--input-delimiter=;"]
+        tables = []
+        for config in (
+            ETLConf(cli_args=cli_args),
+            ETLConf(cli_args=cli_args + ["--shards=3"]),
+        ):
+            self._run_with_fake_vocab(config)
+            tables.append(self._omop_tables())
+
+        self.assertGreater(len(tables[1]["person"]), 0)
+        self._assert_tables_equal(tables[0], tables[1])
+
+    def test_run_etl_with_shards_incremental(self):
+        """Test that a sharded run cannot be incremental"""
+        config = ETLConf(
+            cli_args=[
+                "--datadir=tests/csv/dummy_data",
+                "--input-delimiter=;",
+                "--shards=2",
+                "--incremental",
+            ]
+        )
+        with self.engine.connect() as cnxn:
+            with self.assertRaises(ETLFatalErrorException):
+                run_etl(config=config, cnxn=cnxn)
+
+    def test_run_etl_with_insert_partitions(self):
+        """Test that splitting the inserts in ranges of persons gives the
+        result of a run without"""
+        cli_args = ["--datadir=tests/csv/dummy_data", "--input-delimiter=;"]
+        tables = []
+        for config in (
+            ETLConf(cli_args=cli_args),
+            ETLConf(cli_args=cli_args + ["--insert-partitions=3"]),
+        ):
+            self._run_with_fake_vocab(config)
+            tables.append(self._omop_tables())
+
+        self.assertGreater(len(tables[1]["person"]), 0)
+        self._assert_tables_equal(tables[0], tables[1])
+
+    def test_run_etl_with_insert_partitions_checkpoint(self):
+        """Test that a run with partitioned inserts cannot be checkpointed"""
+        config = ETLConf(
+            cli_args=[
+                "--datadir=tests/csv/dummy_data",
+                "--input-delimiter=;",
+                "--insert-partitions=2",
+                "--checkpoint",
+            ]
+        )
+        with self.engine.connect() as cnxn:
+            with self.assertRaises(ETLFatalErrorException):
+                run_etl(config=config, cnxn=cnxn)
+
+    def test_run_etl_incremental(self):
+        """Test that incremental runs, also without any changed patient,
+        give the result of a full run"""
+        cli_args = ["--datadir=tests/csv/dummy_data", "--input-delimiter=;"]
+        counts = []
+        tables = []
+        for config in (
+            ETLConf(cli_args=cli_args),
+            ETLConf(cli_args=cli_args + ["--incremental"]),
+            ETLConf(cli_args=cli_args + ["--incremental"]),
+        ):
+            counts.append(self._run_with_fake_vocab(config))
+            tables.append(self._omop_tables())
+            with self.engine.connect() as cnxn:
+                self.assertEqual(has_patient_state(cnxn), config.incremental)
+        with self.engine.begin() as cnxn:
+            clear_patient_state(cnxn)
+
+        self.assertGreater(counts[2]["person"], 0)
+        for incremental in tables[1:]:
+            self._assert_tables_equal(tables[0], incremental)
+
+    @staticmethod
+    def _change_export(datadir: Path) -> None:
+        """Change the dummy export copied to datadir: patient 1 has a new
+        relapse, patient 2 moves, patient 6 gets a valid sex and patient 3
+        is removed"""
+        for path in datadir.glob("*.csv"):
+            lines = path.read_text(encoding="utf-8").splitlines()
+            lines = [line for line in lines if line.split(";")[0] != "3"]
+            if path.name == "patient.csv":
+                lines = [
+                    line.replace("residence_VD", "residence_ZZ")
+                    if line.startswith("2;")
+                    else line.replace(";x;", ";male;")
+                    if line.startswith("6;")
+                    else line
+                    for line in lines
+                ]
+            elif path.name == "relapses.csv":
+                lines.append("1;01/02/1821;yes;15/01/1821;yes;compl_recovery")
+            path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+    def test_run_etl_incremental_changes(self):
+        """Test that an incremental run on a changed export rebuilds the
+        changed patients into the result of a full run on it"""
+        with tempfile.TemporaryDirectory() as datadir:
+            shutil.copytree("tests/csv/dummy_data", datadir, dirs_exist_ok=True)
+            self._change_export(Path(datadir))
+            changed_args = [f"--datadir={datadir}", "--input-delimiter=;"]
+            self._run_with_fake_vocab(
+                ETLConf(
+                    cli_args=[
+                        "--datadir=tests/csv/dummy_data",
+                        "--input-delimiter=;",
+                        "--incremental",
+                    ]
+                )
+            )
+            self._run_with_fake_vocab(
+                ETLConf(cli_args=changed_args + ["--incremental"])
+            )
+            with self.engine.connect() as cnxn:
+                delta = cnxn.execute(
+                    select(PatientDelta.patient_id).order_by(PatientDelta.patient_id)
+                ).scalars()
+                self.assertListEqual(list(delta), [1, 2, 3, 6])
+            incremental = self._omop_tables()
+            self._run_with_fake_vocab(ETLConf(cli_args=changed_args))
+            full = self._omop_tables()
+
+        self.assertIn(6, full["person"]["person_id"].tolist())
+        self.assertNotIn(3, full["person"]["person_id"].tolist())
+        self._assert_tables_equal(full, incremental)
+
     def test_run_etl_with_error(self):
         """Test running an etl that throws an error"""
         config = ETLConf(
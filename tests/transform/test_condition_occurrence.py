@@ -9,10 +9,10 @@ from etl.models.omopcdm54.clinical import (
     Person,
     VisitOccurrence,
 )
-from etl.models.source import DiseaseHistory, Relapses
+from etl.models.source import DiseaseHistory, Patient, Relapses
 from etl.sql.condition_transform import SQL as condition_occurrence_sql_stmt
 from etl.transform.condition import transform as condition_transform
-from etl.util.sql import cast_date_format
+from etl.transform.visit_lookup import transform as visit_lookup_transform
 from tests.transform.transform_base import TransformBaseTest
 from tests.transform.utils import get_sql_str_list
 
@@ -23,6 +23,7 @@ class ConditionOccurrenceTransformFunctionalTest(TransformBaseTest):
     SOURCE = {
         DiseaseHistory: "condition_occurrence/input_disease_history.csv",
         Relapses: "condition_occurrence/input_relapses.csv",
+        Patient: "condition_occurrence/input_patient.csv",
     }
     TARGET = {
         ConditionOccurrence: "condition_occurrence/output_condition_occurrence.csv",
@@ -32,6 +33,7 @@ class ConditionOccurrenceTransformFunctionalTest(TransformBaseTest):
         Person: "condition_occurrence/input_person.csv",
         VisitOccurrence: "condition_occurrence/input_visit_occurrence.csv",
     }
+    STEPS = [visit_lookup_transform]
 
     def test_transformation(self):
         """Test for condition_occurrence transform"""
@@ -57,7 +59,5 @@ class ConditionOccurrenceTransformUnitTest(unittest.TestCase):
         actual_str_queries = get_sql_str_list(mock_cnxn.execute.call_args_list)
 
         self.assertTrue(
-            set([condition_occurrence_sql_stmt, cast_date_format()]).issubset(
-                set(actual_str_queries)
-            ),
+            set([condition_occurrence_sql_stmt]).issubset(set(actual_str_queries)),
         )
@@ -8,7 +8,7 @@ from etl.models.omopcdm54.clinical import DrugExposure, Person, VisitOccurrence
 from etl.models.source import Dmt
 from etl.sql.drug_exposure_transform import SQL as drug_exposure_sql_stmt
 from etl.transform.drug_exposure import transform as drug_exposure_transform
-from etl.util.sql import cast_date_format
+from etl.transform.visit_lookup import transform as visit_lookup_transform
 from tests.transform.transform_base import TransformBaseTest
 from tests.transform.utils import get_sql_str_list
 
@@ -27,6 +27,7 @@ class DrugExposureTransformFunctionalTest(TransformBaseTest):
         Person: "drug_exposure/input_person.csv",
         VisitOccurrence: "drug_exposure/input_visit_occurrence.csv",
     }
+    STEPS = [visit_lookup_transform]
 
     def test_transformation(self):
         """Test for drug_exposure transform"""
@@ -36,6 +37,31 @@ class DrugExposureTransformFunctionalTest(TransformBaseTest):
         )
 
 
+class DrugExposureInvalidStopFunctionalTest(TransformBaseTest):
+    """Functional test class for drug_exposure transform, with a dmt_stop
+    that is not a valid date"""
+
+    SOURCE = {
+        Dmt: "drug_exposure/input_dmt_invalid_stop.csv",
+    }
+    TARGET = {
+        DrugExposure: "drug_exposure/output_drug_exposure_invalid_stop.csv",
+        ETLLogger: "drug_exposure/logger_drug_exposure_invalid_stop.csv",
+    }
+    OTHER = {
+        Person: "drug_exposure/input_person.csv",
+        VisitOccurrence: "drug_exposure/input_visit_occurrence.csv",
+    }
+    STEPS = [visit_lookup_transform]
+
+    def test_transformation(self):
+        """Test that the invalid dmt_stop is defaulted and logged"""
+        super()._test_transformation(
+            drug_exposure_transform,
+            sort_by=["person_id", "drug_exposure_start_date"],
+        )
+
+
 class DrugExposureTransformUnitTest(unittest.TestCase):
     """Unit test class for drug_exposure transform"""
 
@@ -48,7 +74,5 @@ class DrugExposureTransformUnitTest(unittest.TestCase):
         actual_str_queries = get_sql_str_list(mock_cnxn.execute.call_args_list)
 
         self.assertTrue(
-            set([drug_exposure_sql_stmt, cast_date_format()]).issubset(
-                set(actual_str_queries)
-            ),
+            set([drug_exposure_sql_stmt]).issubset(set(actual_str_queries)),
         )
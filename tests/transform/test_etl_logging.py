@@ -0,0 +1,140 @@
+"""ETL logging rule tests"""
+
+import unittest
+
+from sqlalchemy import select, text
+
+from etl.context import ETLContext
+from etl.models.etl_logger import ETLLogger
+from etl.models.lookupmodels import CodeLogger
+from etl.models.modelutils import create_tables_sql, drop_tables_sql
+from etl.models.omopcdm54.clinical import Observation, Person
+from etl.models.omopcdm54.registry import TARGET_SCHEMA
+from etl.models.source import SOURCE_SCHEMA, DiseaseHistory, Dmt, Patient
+from etl.transform.etl_logging import (
+    DRUG_EXPOSURE_LOGGER_DICT,
+    OBSERVATION_LOGGER_DICT,
+    PATIENT_LOGGER_DICT,
+    LogRule,
+    _log_rules_sql,
+    invalid_mri_records_rule,
+    log_errors,
+)
+from tests.testutils import PostgresBaseTest
+
+
+class LogRulesUnitTest(unittest.TestCase):
+    """Unit test class for the logging rule compiler"""
+
+    def test_one_scan_per_source(self):
+        # the DOB and gender rules both read patient without a join
+        sql = _log_rules_sql(PATIENT_LOGGER_DICT.values())
+        self.assertEqual(sql.count("INSERT INTO"), 1)
+        self.assertEqual(sql.count("CROSS JOIN LATERAL"), 3)
+
+        sql = _log_rules_sql(
+            [*OBSERVATION_LOGGER_DICT.values(), invalid_mri_records_rule(Observation)]
+        )
+        self.assertEqual(sql.count("INSERT INTO"), 1)
+        self.assertEqual(sql.count("CROSS JOIN LATERAL"), 9)
+
+
+class LogRulesPostgresTest(PostgresBaseTest):
+    """Postgres test class for the logging rules"""
+
+    SOURCE_MODELS = [Patient, DiseaseHistory, Dmt]
+    TARGET_MODELS = [Person, CodeLogger, ETLLogger]
+
+    def _drop_tables(self):
+        with self.engine.begin() as cnxn:
+            cnxn.execute(text(drop_tables_sql(self.SOURCE_MODELS + self.TARGET_MODELS)))
+
+    def setUp(self):
+        super().setUp()
+        self._drop_tables()
+        self._create_tables_and_schema(models=self.SOURCE_MODELS, schema=SOURCE_SCHEMA)
+        self._create_tables_and_schema(models=self.TARGET_MODELS, schema=TARGET_SCHEMA)
+        with self.engine.begin() as cnxn:
+            cnxn.execute(
+                text(
+                    f"""
+                    INSERT INTO {Patient.__table__}
+                    (_id, patient_id, date_birth, sex)
+                    VALUES (1, 1, '1970-01-01', 'male'), (2, 2, NULL, 'other'),
+                        (3, 3, '1980-01-01', 'other');
+                    INSERT INTO {DiseaseHistory.__table__}
+                    (_id, patient_id, date_diagnosis, date_onset)
+                    VALUES (1, 1, '2000-01-01', NULL), (2, 2, NULL, NULL);
+                    INSERT INTO {Dmt.__table__}
+                    (_id, patient_id, date_visit, dmt_status, dmt_start,
+                        dmt_stop, dmt_stop_valid)
+                    VALUES (1, 1, '2001-02-01', 'yes', '2001-01-01', NULL, FALSE),
+                        (2, 2, '2001-01-01', 'no', NULL, NULL, NULL),
+                        (3, 1, NULL, 'yes', '2001-01-01', '2002-01-01', TRUE);
+                    INSERT INTO {Person.__table__}
+                    (person_id, gender_concept_id, year_of_birth,
+                        race_concept_id, ethnicity_concept_id)
+                    VALUES (1, 0, 1970, 0, 0);
+                    INSERT INTO {CodeLogger.__table__}
+                    VALUES (1, 'missing DOB', 'WARNING'),
+                        (4, 'default date', 'DEBUG');
+                    """
+                )
+            )
+
+    def tearDown(self) -> None:
+        self._drop_tables()
+        super().tearDown()
+
+    def _insert_rule(self, cnxn, rule: LogRule):
+        """Log the rows of the rule in an insert of its own, the way the
+        rules were logged one by one"""
+        patient_id = rule.patient_id or rule.source_table.patient_id.key
+        cnxn.execute(
+            text(
+                f"""INSERT INTO {ETLLogger.__table__}
+                (patient_id, omop_table_name, source_table_name, error_code_id,
+                    error_code_description, error_code_level)
+                SELECT {patient_id}, '{rule.omop_table.__tablename__}',
+                    '{rule.source_table.__tablename__}', {rule.error_code},
+                    error_code_description, error_code_level
+                FROM {rule.source_table.__table__}
+                {rule.join}
+                LEFT JOIN {CodeLogger.__table__}
+                    ON error_code_id = {rule.error_code}
+                WHERE {rule.condition}"""
+            )
+        )
+
+    def _logged(self, cnxn):
+        return [
+            tuple(row) for row in cnxn.execute(select(ETLLogger).order_by(ETLLogger.id))
+        ]
+
+    def test_log_errors(self):
+        rules = {**PATIENT_LOGGER_DICT, **DRUG_EXPOSURE_LOGGER_DICT}
+        with self.engine.connect() as cnxn:
+            log_errors(ETLContext(self.config, cnxn=cnxn), rules)
+            logged = self._logged(cnxn)
+            # the same ids as one insert per rule
+            cnxn.execute(
+                text(drop_tables_sql([ETLLogger]) + create_tables_sql([ETLLogger]))
+            )
+            for rule in rules.values():
+                self._insert_rule(cnxn, rule)
+            self.assertListEqual(logged, self._logged(cnxn))
+
+        self.assertListEqual(
+            sorted(row[1:6] for row in logged),
+            [
+                (1, "drug_exposure", "dmt", 4, "default date"),
+                (1, "drug_exposure", "dmt", 4, "default date"),
+                (2, "drug_exposure", "dmt", 4, "default date"),
+                (2, "drug_exposure", "dmt", 4, "default date"),
+                (2, "person", "disease_history", 3, None),
+                (2, "person", "patient", 1, "missing DOB"),
+                (2, "person", "patient", 2, None),
+                (3, "person", "patient", 2, None),
+                (3, "person", "patient", 6, None),
+            ],
+        )
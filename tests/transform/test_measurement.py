@@ -8,7 +8,6 @@ from etl.models.omopcdm54.clinical import Measurement, Observation, Person
 from etl.models.source import DiseaseHistory, DiseaseStatus
 from etl.sql.measurement_transform import SQL_ENTRIES
 from etl.transform.measurement import transform as measurement_transform
-from etl.util.sql import cast_date_format
 from tests.transform.transform_base import TransformBaseTest
 from tests.transform.utils import get_sql_str_list
 
@@ -42,12 +41,11 @@ class MeasurementTransformUnitTest(unittest.TestCase):
     @patch("etl.transform.measurement.ETLContext")
     def test_meas_transform_query(self, mock_ctxt):
         """Mock sql calls"""
+        mock_ctxt.config.insert_partitions = 1
         mock_cnxn = mock_ctxt.transaction.return_value.__enter__.return_value
         measurement_transform(mock_ctxt)
 
         expected_sql_queries = [query for query in SQL_ENTRIES.values()]
-        expected_sql_queries.append(cast_date_format())
-
         actual_str_queries = get_sql_str_list(mock_cnxn.execute.call_args_list)
 
         self.assertTrue(set(expected_sql_queries).issubset(set(actual_str_queries)))
@@ -18,7 +18,7 @@ from etl.models.source import (
 )
 from etl.sql.observation_transform import SQL_ENTRIES
 from etl.transform.observation import transform as observation_transform
-from etl.util.sql import cast_date_format
+from etl.transform.visit_lookup import transform as visit_lookup_transform
 from tests.transform.transform_base import TransformBaseTest
 from tests.transform.utils import get_sql_str_list
 
@@ -45,6 +45,7 @@ class ObservationTransformFunctionalTest(TransformBaseTest):
         Person: "observation/input_person.csv",
         VisitOccurrence: "observation/input_visit_occurrence.csv",
     }
+    STEPS = [visit_lookup_transform]
 
     def test_transformation(self):
         """Test for observation transform"""
@@ -64,12 +65,11 @@ class ObservationTransformUnitTest(unittest.TestCase):
     @patch("etl.transform.observation.ETLContext")
     def test_obs_transform_query(self, mock_ctxt):
         """Mock sql calls"""
+        mock_ctxt.config.insert_partitions = 1
         mock_cnxn = mock_ctxt.transaction.return_value.__enter__.return_value
         observation_transform(mock_ctxt)
 
         expected_sql_queries = [query for query in SQL_ENTRIES.values()]
-        expected_sql_queries.append(cast_date_format())
-
         actual_str_queries = get_sql_str_list(mock_cnxn.execute.call_args_list)
 
         self.assertTrue(set(expected_sql_queries).issubset(set(actual_str_queries)))
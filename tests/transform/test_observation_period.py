@@ -0,0 +1,138 @@
+"""Observation period transformation tests"""
+
+import unittest
+from datetime import date
+from unittest.mock import patch
+
+from sqlalchemy import select, text
+
+from etl.context import ETLContext
+from etl.models.omopcdm54.clinical import (
+    ConditionOccurrence,
+    DrugExposure,
+    Measurement,
+    Observation,
+    ObservationPeriod,
+    Person,
+    ProcedureOccurrence,
+    VisitOccurrence,
+)
+from etl.models.omopcdm54.registry import TARGET_SCHEMA
+from etl.sql.observation_period import SQL
+from etl.transform.observation_period import transform as observation_period_transform
+from etl.transform.observation_period import update_persons
+from tests.testutils import PostgresBaseTest
+from tests.transform.utils import get_sql_str_list
+
+
+class ObservationPeriodPostgresTest(PostgresBaseTest):
+    """Postgres test class for the observation_period transform"""
+
+    MODELS = [
+        Person,
+        VisitOccurrence,
+        ConditionOccurrence,
+        DrugExposure,
+        Measurement,
+        Observation,
+        ProcedureOccurrence,
+        ObservationPeriod,
+    ]
+
+    def setUp(self):
+        super().setUp()
+        self._drop_tables_and_schema(models=self.MODELS)
+        self._create_tables_and_schema(models=self.MODELS, schema=TARGET_SCHEMA)
+        with self.engine.begin() as cnxn:
+            cnxn.execute(
+                text(
+                    f"""
+                    INSERT INTO {Person.__table__}
+                    (person_id, gender_concept_id, year_of_birth,
+                        race_concept_id, ethnicity_concept_id)
+                    VALUES (1, 0, 1970, 0, 0), (2, 0, 1970, 0, 0),
+                        (3, 0, 1970, 0, 0);
+                    INSERT INTO {VisitOccurrence.__table__}
+                    (visit_occurrence_id, person_id, visit_concept_id,
+                        visit_start_date, visit_end_date, visit_type_concept_id)
+                    VALUES (1, 1, 0, '2020-03-01', '2020-03-02', 0),
+                        (2, 1, 0, '2020-05-01', '1700-01-01', 0),
+                        (3, 2, 0, '1700-01-01', '1700-01-01', 0),
+                        (4, 4, 0, '2020-01-01', '2020-01-01', 0);
+                    INSERT INTO {Measurement.__table__}
+                    (measurement_id, person_id, measurement_concept_id,
+                        measurement_date, measurement_type_concept_id)
+                    VALUES (1, 1, 0, '2019-01-01', 0), (2, 2, 0, '1700-01-01', 0);
+                    INSERT INTO {Observation.__table__}
+                    (observation_id, person_id, observation_concept_id,
+                        observation_date, observation_type_concept_id)
+                    VALUES (1, 3, 0, '1700-01-01', 0);
+                    """
+                )
+            )
+
+    def tearDown(self) -> None:
+        self._drop_tables_and_schema(models=self.MODELS)
+        super().tearDown()
+
+    def _periods(self):
+        with self.engine.connect() as cnxn:
+            return sorted(
+                (
+                    row.person_id,
+                    row.observation_period_start_date,
+                    row.observation_period_end_date,
+                )
+                for row in cnxn.execute(select(ObservationPeriod))
+            )
+
+    def test_transformation(self):
+        with self.engine.connect() as cnxn:
+            with cnxn.begin():
+                observation_period_transform(ETLContext(self.config, cnxn=cnxn))
+
+        # default dates are skipped except for observations, person 2 has
+        # none left and person 4 is not a person
+        self.assertListEqual(
+            self._periods(),
+            [
+                (1, date(2019, 1, 1), date(2020, 5, 1)),
+                (3, date(1700, 1, 1), date(1700, 1, 1)),
+            ],
+        )
+
+    def test_update_persons(self):
+        with self.engine.connect() as cnxn:
+            with cnxn.begin():
+                ctxt = ETLContext(self.config, cnxn=cnxn)
+                observation_period_transform(ctxt)
+                cnxn.execute(
+                    text(
+                        f"UPDATE {Measurement.__table__}"
+                        " SET measurement_date = '2018-01-01'"
+                    )
+                )
+                update_persons(ctxt, [2])
+
+        self.assertListEqual(
+            self._periods(),
+            [
+                (1, date(2019, 1, 1), date(2020, 5, 1)),
+                (2, date(2018, 1, 1), date(1700, 1, 1)),
+                (3, date(1700, 1, 1), date(1700, 1, 1)),
+            ],
+        )
+
+
+class ObservationPeriodTransformUnitTest(unittest.TestCase):
+    """Unit test class for the observation_period transform"""
+
+    @patch("etl.transform.observation_period.ETLContext")
+    def test_observation_period_transform_query(self, mock_ctxt):
+        """Mock sql calls"""
+        mock_ctxt.config.incremental = False
+        mock_ctxt.config.shards = 1
+        mock_cnxn = mock_ctxt.transaction.return_value.__enter__.return_value
+        observation_period_transform(mock_ctxt)
+
+        self.assertListEqual(get_sql_str_list(mock_cnxn.execute.call_args_list), [SQL])
@@ -9,7 +9,6 @@ from etl.models.omopcdm54.health_systems import Location
 from etl.models.source import DiseaseHistory, Patient
 from etl.sql.person_transform import SQL as person_sql_stmt
 from etl.transform.person import transform as person_transform
-from etl.util.sql import cast_date_format
 from tests.transform.transform_base import TransformBaseTest
 from tests.transform.utils import get_sql_str_list
 
@@ -49,7 +48,5 @@ class PersonTransformUnitTest(unittest.TestCase):
         actual_str_queries = get_sql_str_list(mock_cnxn.execute.call_args_list)
 
         self.assertTrue(
-            set([person_sql_stmt, cast_date_format()]).issubset(
-                set(actual_str_queries)
-            ),
+            set([person_sql_stmt]).issubset(set(actual_str_queries)),
         )
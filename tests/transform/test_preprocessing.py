@@ -0,0 +1,139 @@
+"""Preprocessing tests"""
+
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from etl.config import ETLConf
+from etl.context import ETLContext
+from etl.models.modelutils import create_tables_sql, drop_tables_sql
+from etl.models.omopcdm54.registry import TARGET_SCHEMA
+from etl.models.omopcdm54.vocabulary import Concept, Vocabulary
+from etl.transform.preprocessing import format_dates, validate_concept_ids
+from etl.transform.transformutils import (
+    execute_sql_transform,
+    invalid_dates,
+    normalize_dates,
+    try_parsing_date,
+)
+from tests.testutils import PostgresBaseTest
+
+
+class PreprocessingUnitTest(unittest.TestCase):
+    """Unit test class for the preprocessing functions"""
+
+    def test_normalize_dates_matches_try_parsing_date(self):
+        values = pd.Series(
+            [
+                "07/03/1803",
+                "1850-10-28",
+                "05/02/18",
+                "1-2-3",
+                "31/02/2020",
+                "2019-02-29",
+                "29/02/2020 10:11",
+                "2020-1-5 1:2:3",
+                " 1/01/2020",
+                "01/01/0999",
+                "01/01/2300",
+                "20200105",
+                "unknown",
+                "",
+                np.nan,
+                None,
+                5,
+            ],
+            dtype=object,
+        )
+        expected = values.apply(try_parsing_date)
+        pd.testing.assert_series_equal(normalize_dates(values), expected)
+
+    def test_invalid_dates(self):
+        values = pd.Series(
+            ["999-01-01", "2020-02-29", "2019-02-29", "unknown", None],
+            dtype=object,
+        )
+        self.assertListEqual(
+            invalid_dates(values).tolist(), [False, False, True, True, False]
+        )
+
+    def test_format_dates_only_date_columns(self):
+        input_df = pd.DataFrame(
+            {
+                "patient_id": [1, 2],
+                "date_visit": ["07/03/1803", "not a date"],
+                "dmt_status": ["01/01/2001", "dmt_naive"],
+                "dmt_start": [np.nan, np.nan],
+            }
+        )
+        with self.assertLogs("etl.transform.preprocessing", "WARNING") as logs:
+            output_df = format_dates("dmt", input_df.copy())
+        self.assertListEqual(output_df["date_visit"].tolist()[:1], ["1803-03-07"])
+        self.assertTrue(pd.isna(output_df["date_visit"][1]))
+        self.assertIn("date_visit: 1 value(s)", logs.output[0])
+        pd.testing.assert_series_equal(output_df["dmt_status"], input_df["dmt_status"])
+        pd.testing.assert_series_equal(output_df["dmt_start"], input_df["dmt_start"])
+
+    def test_format_dates_valid_flag(self):
+        input_df = pd.DataFrame({"dmt_stop": ["07/03/1803", "31/02/1820", np.nan]})
+        with self.assertLogs("etl.transform.preprocessing", "WARNING"):
+            output_df = format_dates("dmt", input_df)
+        self.assertListEqual(output_df["dmt_stop_valid"].tolist(), [True, False, pd.NA])
+        self.assertTrue(output_df["dmt_stop"][1:].isna().all())
+
+
+class ConceptValidationPostgresTest(PostgresBaseTest):
+    """Postgres test class for the concept id validation"""
+
+    def setUp(self):
+        super().setUp()
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.config = ETLConf(cli_args=[f"--cache-dir={self.cache_dir.name}"])
+        sql = [
+            f"CREATE SCHEMA IF NOT EXISTS {TARGET_SCHEMA};",
+            drop_tables_sql([Concept, Vocabulary]),
+            create_tables_sql([Concept, Vocabulary]),
+            f"INSERT INTO {str(Vocabulary.__table__)} SELECT 'None', 'fake_vocab', 'fake_ref', 'fake_version', 1;",
+            f"""INSERT INTO {str(Concept.__table__)} VALUES
+            (1, 'one', 'd', 'v', 'c', 'S', '1', '1970-01-01', '2099-12-31', NULL),
+            (2, 'two', 'd', 'v', 'c', NULL, '2', '1970-01-01', '2099-12-31', NULL);""",
+        ]
+        with self.engine.connect() as cnxn:
+            ctxt = ETLContext(config=self.config, cnxn=cnxn)
+            execute_sql_transform(ctxt, " ".join(sql))
+
+    def tearDown(self):
+        with self.engine.connect() as cnxn:
+            ctxt = ETLContext(config=self.config, cnxn=cnxn)
+            execute_sql_transform(ctxt, drop_tables_sql([Concept, Vocabulary]))
+        self.cache_dir.cleanup()
+        super().tearDown()
+
+    def _validate(self):
+        input_df = pd.DataFrame(
+            {"standard_concept_id": pd.Series([1, 2, 3, None, 1], dtype="Int64")}
+        )
+        with self.engine.connect() as cnxn:
+            ctxt = ETLContext(config=self.config, cnxn=cnxn)
+            output_df = validate_concept_ids(input_df, ctxt)
+        return output_df["standard_concept_id"].tolist()
+
+    def test_validate_concept_ids(self):
+        self.assertListEqual(self._validate(), [1, 0, 0, 0, 1])
+
+        # the second run is answered from the cache of this vocabulary version
+        with self.engine.connect() as cnxn:
+            ctxt = ETLContext(config=self.config, cnxn=cnxn)
+            execute_sql_transform(ctxt, f"DELETE FROM {str(Concept.__table__)};")
+        self.assertListEqual(self._validate(), [1, 0, 0, 0, 1])
+
+        # a new vocabulary version is checked against the database again
+        with self.engine.connect() as cnxn:
+            ctxt = ETLContext(config=self.config, cnxn=cnxn)
+            execute_sql_transform(
+                ctxt,
+                f"UPDATE {str(Vocabulary.__table__)} SET vocabulary_version = 'v2';",
+            )
+        self.assertListEqual(self._validate(), [0, 0, 0, 0, 0])
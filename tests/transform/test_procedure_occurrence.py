@@ -12,7 +12,7 @@ from etl.models.omopcdm54.clinical import (
 from etl.models.source import Dmt, Mri
 from etl.sql.procedure_transform import SQL_ENTRIES
 from etl.transform.procedure import transform as procedure_occurrence_transform
-from etl.util.sql import cast_date_format
+from etl.transform.visit_lookup import transform as visit_lookup_transform
 from tests.transform.transform_base import TransformBaseTest
 from tests.transform.utils import get_sql_str_list
 
@@ -32,6 +32,7 @@ class ProcedureOccurrenceTransformFunctionalTest(TransformBaseTest):
         Person: "procedure_occurrence/input_person.csv",
         VisitOccurrence: "procedure_occurrence/input_visit_occurrence.csv",
     }
+    STEPS = [visit_lookup_transform]
 
     def test_transformation(self):
         """Test for procedure_occurrence transform"""
@@ -51,8 +52,6 @@ class ProcedureOccurrenceTransformUnitTest(unittest.TestCase):
         procedure_occurrence_transform(mock_ctxt)
 
         expected_sql_queries = [query for query in SQL_ENTRIES.values()]
-        expected_sql_queries.append(cast_date_format())
-
         actual_str_queries = get_sql_str_list(mock_cnxn.execute.call_args_list)
 
         self.assertTrue(set(expected_sql_queries).issubset(set(actual_str_queries)))
@@ -0,0 +1,108 @@
+"""Vocabulary reload transformation tests"""
+
+from datetime import date
+
+from sqlalchemy import select, text
+
+from etl.config import ETLConf
+from etl.context import ETLContext
+from etl.models.lookupmodels import DrugIngredientMap
+from etl.models.omopcdm54.clinical import DrugExposure
+from etl.models.omopcdm54.registry import TARGET_SCHEMA
+from etl.models.omopcdm54.standardized_derived_elements import DrugEra
+from etl.models.omopcdm54.vocabulary import Concept, ConceptAncestor, Vocabulary
+from etl.transform.drug_era import transform as drug_era_transform
+from etl.transform.reload_vocab import transform as reload_vocab_transform
+from tests.testutils import PostgresBaseTest
+
+
+class DrugIngredientMapPostgresTest(PostgresBaseTest):
+    """Postgres test class for the drug ingredient map"""
+
+    MODELS = [
+        Concept,
+        ConceptAncestor,
+        Vocabulary,
+        DrugExposure,
+        DrugEra,
+        DrugIngredientMap,
+    ]
+
+    def setUp(self):
+        super().setUp()
+        self._drop_tables_and_schema(models=self.MODELS)
+        self._create_tables_and_schema(models=self.MODELS, schema=TARGET_SCHEMA)
+        with self.engine.begin() as cnxn:
+            cnxn.execute(
+                text(
+                    f"""
+                    INSERT INTO {Vocabulary.__table__}
+                    VALUES ('None', 'fake_vocab', 'fake_ref', 'v1', 1);
+                    INSERT INTO {Concept.__table__} VALUES
+                    (5, 'ingredient', 'Drug', 'RxNorm', 'Ingredient', 'S', '5',
+                        '1970-01-01', '2099-12-31', NULL),
+                    (9, 'class', 'Drug', 'ATC', 'ATC 4th', 'C', '9',
+                        '1970-01-01', '2099-12-31', NULL);
+                    INSERT INTO {ConceptAncestor.__table__}
+                    (ancestor_concept_id, descendant_concept_id,
+                        min_levels_of_separation, max_levels_of_separation)
+                    VALUES (5, 5, 0, 0), (5, 7, 1, 1), (5, 8, 1, 1), (9, 7, 1, 1);
+                    INSERT INTO {DrugExposure.__table__}
+                    (drug_exposure_id, person_id, drug_concept_id,
+                        drug_exposure_start_date, drug_exposure_end_date,
+                        drug_type_concept_id)
+                    VALUES
+                    (1, 1, 7, '2020-01-01', '2020-01-10', 32879),
+                    (2, 1, 8, '2020-02-01', '2020-02-10', 32879),
+                    (3, 1, 7, '2020-06-01', '2020-06-02', 32879),
+                    (4, 2, 10, '2020-01-01', '2020-01-10', 32879);
+                    """
+                )
+            )
+
+    def tearDown(self) -> None:
+        self._drop_tables_and_schema(models=self.MODELS)
+        super().tearDown()
+
+    def _run(self, transform, config: ETLConf) -> None:
+        with self.engine.connect() as cnxn:
+            with cnxn.begin():
+                transform(ETLContext(config, cnxn=cnxn))
+
+    def _map(self):
+        with self.engine.connect() as cnxn:
+            return sorted(tuple(row) for row in cnxn.execute(select(DrugIngredientMap)))
+
+    def test_drug_ingredient_map(self):
+        self._run(reload_vocab_transform, self.config)
+        self.assertListEqual(self._map(), [(5, 5, "v1"), (7, 5, "v1"), (8, 5, "v1")])
+
+        with self.assertLogs("etl.transform.reload_vocab", level="INFO") as logs:
+            self._run(reload_vocab_transform, self.config)
+        self.assertIn("up to date", "".join(logs.output))
+
+        with self.engine.begin() as cnxn:
+            cnxn.execute(
+                text(f"UPDATE {Vocabulary.__table__} SET vocabulary_version = 'v2'")
+            )
+        self._run(reload_vocab_transform, self.config)
+        self.assertListEqual(self._map(), [(5, 5, "v2"), (7, 5, "v2"), (8, 5, "v2")])
+
+    def test_drug_era(self):
+        self._run(reload_vocab_transform, self.config)
+        for engine in ("sql", "numpy"):
+            with self.subTest(engine=engine):
+                self._run(
+                    drug_era_transform, ETLConf(cli_args=[f"--era-engine={engine}"])
+                )
+                with self.engine.connect() as cnxn:
+                    eras = sorted(
+                        tuple(row)[1:] for row in cnxn.execute(select(DrugEra))
+                    )
+                self.assertListEqual(
+                    eras,
+                    [
+                        (1, 5, date(2020, 1, 1), date(2020, 2, 10), 2, 30),
+                        (1, 5, date(2020, 6, 1), date(2020, 6, 2), 1, 30),
+                    ],
+                )
@@ -0,0 +1,27 @@
+"""Sharded run merge tests"""
+
+import unittest
+from unittest.mock import patch
+
+from etl.sql.shards import SQL_MERGE_LOCATIONS, drop_shard_schemas_sql
+from etl.transform.shards import merge as merge_transform
+from tests.transform.utils import get_sql_str_list
+
+
+class ShardsMergeUnitTest(unittest.TestCase):
+    """Unit test class for the merge of the shards"""
+
+    @patch("etl.transform.shards.ETLContext")
+    def test_merge_query(self, mock_ctxt):
+        """Mock sql calls"""
+        mock_ctxt.config.shards = 2
+        mock_cnxn = mock_ctxt.transaction.return_value.__enter__.return_value
+        merge_transform(mock_ctxt)
+
+        actual_str_queries = get_sql_str_list(mock_cnxn.execute.call_args_list)
+
+        self.assertIn(SQL_MERGE_LOCATIONS, set(actual_str_queries))
+        self.assertIn(drop_shard_schemas_sql(2), set(actual_str_queries))
+
+
+__all__ = ["ShardsMergeUnitTest"]
@@ -18,7 +18,6 @@ from etl.sql.visit_occurrence_transform import SQL as visit_occurrence_sql_stmt
 from etl.transform.visit_occurrence import (
     transform as visit_occurrence_transform,
 )
-from etl.util.sql import cast_date_format
 from tests.transform.transform_base import TransformBaseTest
 from tests.transform.utils import get_sql_str_list
 
@@ -57,13 +56,12 @@ class VisitOccurrenceTransformUnitTest(unittest.TestCase):
     @patch("etl.transform.visit_occurrence.ETLContext")
     def test_visit_occ_transform_query(self, mock_ctxt):
         """Mock sql calls"""
+        mock_ctxt.config.insert_partitions = 1
         mock_cnxn = mock_ctxt.transaction.return_value.__enter__.return_value
         visit_occurrence_transform(mock_ctxt)
 
         actual_str_queries = get_sql_str_list(mock_cnxn.execute.call_args_list)
 
         self.assertTrue(
-            set([visit_occurrence_sql_stmt, cast_date_format()]).issubset(
-                set(actual_str_queries)
-            ),
+            set([visit_occurrence_sql_stmt]).issubset(set(actual_str_queries)),
         )
@@ -2,7 +2,7 @@
 
 import os
 import unittest
-from typing import Callable, Dict, Final, Optional
+from typing import Callable, Dict, Final, List, Optional
 
 import pandas as pd
 from sqlalchemy import inspect, select
@@ -30,6 +30,9 @@ class TransformBaseTest(unittest.TestCase):
     # Mapping of additional tables to csv files
     OTHER: Dict = {}
 
+    # Transforms building the tables derived from OTHER, run before the test
+    STEPS: List[Callable] = []
+
     # Mapping to lookup files
     LOOKUPS: Final[Dict] = {
         CodeLogger: "src/etl/csv/code_logger.csv",
@@ -73,7 +76,7 @@ class TransformBaseTest(unittest.TestCase):
                     cls.engine,
                     index=False,
                     schema=table.metadata.schema,
-                    if_exists="replace",
+                    if_exists="append",
                 )
 
     def setUp(self) -> None:
@@ -167,6 +170,8 @@ class TransformBaseTest(unittest.TestCase):
         with self.engine.connect() as cnxn:
             with cnxn.begin():
                 ctxt = ETLContext(self.config, cnxn)
+                for step in self.STEPS:
+                    step(ctxt)
                 func(ctxt)
 
         for table, _ in self.TARGET.items():
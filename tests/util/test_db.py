@@ -0,0 +1,127 @@
+"""Database utilities tests"""
+
+import unittest
+from datetime import date
+from typing import Any, Final
+
+import pandas as pd
+from sqlalchemy import select
+
+from etl.models.modelutils import (
+    BigIntField,
+    BoolField,
+    CharField,
+    DateField,
+    FloatField,
+    IntField,
+    make_model_base,
+)
+from etl.util.db import CopyFormat, CopyStream, CSVCopyStream, df_to_sql
+from tests.testutils import PostgresBaseTest
+
+
+class CSVCopyStreamUnitTest(unittest.TestCase):
+    """Unit test class for the streaming COPY input"""
+
+    def setUp(self) -> None:
+        self.dummy_df = pd.DataFrame(
+            {
+                "a": range(10),
+                "b": ["x;y", "é", None, 'q"uote', "", "f", "g", "h", "i", "j"],
+                "c": [0.5, None] * 5,
+            }
+        )
+
+    def test_stream_matches_to_csv(self):
+        expected = self.dummy_df[["a", "b"]].to_csv(header=False, index=False, sep=";")
+        with CSVCopyStream(
+            self.dummy_df, ["a", "b"], batch_rows=3, sep=";"
+        ) as csv_stream:
+            chunks = []
+            while chunk := csv_stream.read(7):
+                chunks.append(chunk)
+
+        self.assertEqual(b"".join(chunks).decode("utf-8"), expected)
+        self.assertEqual(csv_stream.rows, 10)
+        self.assertEqual(csv_stream.bytes, len(expected.encode("utf-8")))
+
+    def test_stream_raises_producer_errors(self):
+        with CSVCopyStream(self.dummy_df, ["missing"], batch_rows=3) as csv_stream:
+            with self.assertRaises(KeyError):
+                csv_stream.read()
+
+    def test_close_before_reading(self):
+        csv_stream = CSVCopyStream(self.dummy_df, ["a"], batch_rows=1)
+        csv_stream.close()
+        self.assertFalse(csv_stream._thread.is_alive())
+
+    def test_render_is_abstract(self):
+        class NoRender(CopyStream):
+            pass
+
+        with self.assertRaises(TypeError):
+            NoRender(num_rows=1)
+
+
+TestModelBase: Any = make_model_base()
+
+
+class DfToSqlPostgresTest(PostgresBaseTest):
+    """Postgres test class for df_to_sql"""
+
+    class DummyTable(TestModelBase):
+        __tablename__: Final = "dummy_types"
+        __table_args__ = {"schema": "dummy"}
+
+        a: Final = IntField(primary_key=True)
+        b: Final = BigIntField()
+        c: Final = FloatField()
+        d: Final = DateField()
+        e: Final = CharField(20)
+        f: Final = BoolField()
+
+    def setUp(self):
+        super().setUp()
+        self._create_tables_and_schema(models=[self.DummyTable], schema="dummy")
+        self.dummy_df = pd.DataFrame(
+            {
+                "a": pd.Series([1, 2, 3, 4], dtype="Int64"),
+                "b": pd.Series([2**40, None, -1, 0], dtype="Int64"),
+                "c": [1.5, None, -0.25, 1e300],
+                "d": ["1700-01-01", None, "2024-02-29", "1999-12-31"],
+                "e": ["x;y", 'a"q', None, ""],
+                "f": [True, None, False, True],
+            }
+        )
+
+    def tearDown(self) -> None:
+        self._drop_tables_and_schema(models=[self.DummyTable], schema="dummy")
+        super().tearDown()
+
+    def _copy(self, dataframe: pd.DataFrame, copy_format: CopyFormat):
+        with self.engine.connect() as cnxn:
+            with cnxn.begin():
+                df_to_sql(
+                    cnxn,
+                    dataframe,
+                    table=str(self.DummyTable.__table__),
+                    copy_format=copy_format,
+                    table_def=self.DummyTable.__table__,
+                )
+            return pd.read_sql(
+                select(self.DummyTable).order_by(self.DummyTable.a), cnxn
+            )
+
+    def test_binary_matches_csv(self):
+        csv_df = self._copy(self.dummy_df, CopyFormat.CSV)
+        binary_df = self._copy(self.dummy_df, CopyFormat.BINARY)
+        pd.testing.assert_frame_equal(csv_df, binary_df)
+        self.assertEqual(binary_df["d"][0], date(1700, 1, 1))
+        self.assertEqual(binary_df["b"][0], 2**40)
+
+    def test_binary_falls_back_to_csv(self):
+        dummy_df = self.dummy_df.assign(d="01/02/2003")
+        with self.assertLogs("etl.util.db", level="WARNING") as logs:
+            binary_df = self._copy(dummy_df, CopyFormat.BINARY)
+        self.assertTrue(binary_df["d"].notna().all())
+        self.assertIn("using CSV", logs.output[0])
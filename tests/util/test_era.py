@@ -0,0 +1,144 @@
+"""NumPy era engine tests"""
+
+import unittest
+from datetime import date, timedelta
+from typing import Any, Final
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from etl.models.modelutils import DateField, IntField, make_model_base
+from etl.sql.era import era_intervals_sql, era_sql
+from etl.util.era import era_ends, era_ids, numpy_eras, read_intervals
+from tests.testutils import PostgresBaseTest
+
+
+class EraUnitTest(unittest.TestCase):
+    """Unit test class for the numpy era engine"""
+
+    def test_era_ends(self):
+        ends, has_era = era_ends(
+            group=np.array([0, 0, 0, 1, 1]),
+            start=np.array([0, 39, 100, 0, 50]),
+            end=np.array([9, 50, 101, 5, 20]),
+        )
+        self.assertListEqual(ends[has_era].tolist(), [50, 50, 101, 5])
+        self.assertListEqual(has_era.tolist(), [True, True, True, True, False])
+
+    def test_era_ends_empty(self):
+        empty = np.array([], dtype=np.int64)
+        ends, has_era = era_ends(empty, empty, empty)
+        self.assertEqual(len(ends), 0)
+        self.assertEqual(len(has_era), 0)
+
+    def test_numpy_eras(self):
+        intervals = pd.DataFrame(
+            {
+                "person_id": [1, 1, 1, 2],
+                "type_id": [7, 8, 7, 7],
+                "era_start": [0, 0, 20, 0],
+                "era_stop": [10, 10, 25, 1],
+            }
+        )
+        eras = numpy_eras(intervals, keys=["person_id"], columns=["type_id"])
+        self.assertListEqual(eras["type_id"].tolist(), [7, 8, 7])
+        self.assertListEqual(eras["interval_count"].tolist(), [2, 1, 1])
+        self.assertListEqual(
+            eras["era_end_date"].dt.date.tolist(),
+            [date(1970, 1, 26), date(1970, 1, 26), date(1970, 1, 2)],
+        )
+
+    def test_era_ids_sharded(self):
+        ids = [era_ids(None, None, shard=shard, shards=3) for shard in range(3)]
+        taken = [list(range(i["first_id"], 10, i["id_stride"])) for i in ids]
+        self.assertListEqual(taken, [[1, 4, 7], [2, 5, 8], [3, 6, 9]])
+
+
+TestModelBase: Any = make_model_base()
+
+
+class NumpyEraPostgresTest(PostgresBaseTest):
+    """Postgres test class comparing the numpy era engine to era_sql"""
+
+    class DummyTable(TestModelBase):
+        __tablename__: Final = "dummy_interval"
+        __table_args__ = {"schema": "dummy"}
+
+        pk: Final = IntField(primary_key=True)
+        person_id: Final = IntField()
+        concept_id: Final = IntField()
+        start_date: Final = DateField()
+        end_date: Final = DateField()
+
+    def setUp(self):
+        super().setUp()
+        self._create_tables_and_schema(models=[self.DummyTable], schema="dummy")
+        rng = np.random.default_rng(17)
+        origin = date(1990, 1, 1)
+        starts = rng.integers(0, 3000, size=3000)
+        # many equal dates and some intervals ending before they start
+        ends = starts + rng.integers(-60, 120, size=3000)
+        with self.engine.begin() as cnxn:
+            cnxn.execute(
+                text(
+                    f"INSERT INTO {self.DummyTable.__table__}"
+                    " VALUES (:pk, :person_id, :concept_id, :start_date, :end_date)"
+                ),
+                [
+                    dict(
+                        pk=pk,
+                        person_id=int(rng.integers(1, 20)),
+                        concept_id=int(rng.integers(1, 4)),
+                        start_date=origin + timedelta(days=int(start)),
+                        end_date=origin + timedelta(days=int(end)),
+                    )
+                    for pk, (start, end) in enumerate(zip(starts, ends))
+                ],
+            )
+
+    def tearDown(self) -> None:
+        self._drop_tables_and_schema(models=[self.DummyTable], schema="dummy")
+        super().tearDown()
+
+    def test_numpy_matches_sql(self):
+        source_args: Any = dict(
+            source=str(self.DummyTable.__table__),
+            keys=["person_id", "concept_id"],
+            start="start_date",
+            end="end_date",
+        )
+        with self.engine.connect() as cnxn:
+            sql_eras = sorted(
+                (row[0], row[1], row[2], row[3].date(), row[4])
+                for row in cnxn.execute(
+                    text(
+                        "SELECT person_id, concept_id, MIN(era_start),"
+                        " era_end_date, COUNT(DISTINCT era_start)"
+                        f" FROM ({era_sql(**source_args)}) e"
+                        " GROUP BY person_id, concept_id, era_end_date"
+                    )
+                )
+            )
+            intervals = read_intervals(
+                cnxn,
+                era_intervals_sql(**source_args),
+                ["person_id", "concept_id", "era_start", "era_stop"],
+                batch_rows=500,
+            )
+        eras = numpy_eras(intervals, keys=["person_id", "concept_id"])
+
+        self.assertEqual(len(intervals), 3000)
+        self.assertGreater(len(sql_eras), 100)
+        self.assertListEqual(
+            sorted(
+                zip(
+                    eras["person_id"].tolist(),
+                    eras["concept_id"].tolist(),
+                    eras["era_start"].dt.date.tolist(),
+                    eras["era_end_date"].dt.date.tolist(),
+                    eras["interval_count"].tolist(),
+                )
+            ),
+            sql_eras,
+        )
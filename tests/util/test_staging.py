@@ -0,0 +1,116 @@
+"""Parallel staging load tests"""
+
+from typing import Any, Final
+
+import pandas as pd
+from sqlalchemy import select, text
+
+from etl.models.modelutils import CharField, IntField, make_model_base
+from etl.util.db import WriteMode, df_to_sql
+from etl.util.staging import drop_staging_schemas, parallel_load, staging_schema
+from tests.testutils import PostgresBaseTest
+
+TestModelBase: Any = make_model_base()
+
+
+class ParallelLoadPostgresTest(PostgresBaseTest):
+    """Postgres test class for parallel_load"""
+
+    class DummyTable(TestModelBase):
+        __tablename__: Final = "dummy_staged"
+        __table_args__ = {"schema": "dummy"}
+
+        a: Final = IntField(primary_key=True)
+        b: Final = CharField(10)
+
+    class DummyTableTwo(TestModelBase):
+        __tablename__: Final = "dummy_staged2"
+        __table_args__ = {"schema": "dummy"}
+
+        x: Final = IntField(primary_key=True)
+
+    def setUp(self):
+        super().setUp()
+        self.models = [self.DummyTable, self.DummyTableTwo]
+        self._create_tables_and_schema(models=self.models, schema="dummy")
+        with self.engine.connect() as cnxn:
+            with cnxn.begin():
+                cnxn.execute(
+                    text(f"INSERT INTO {self.DummyTable.__table__} VALUES (9, 'old');")
+                )
+
+    def tearDown(self) -> None:
+        self._drop_tables_and_schema(models=self.models, schema="dummy")
+        super().tearDown()
+
+    def _job(self, dataframe: pd.DataFrame):
+        def load(cnxn, target):
+            df_to_sql(
+                cnxn,
+                dataframe,
+                table=str(target.__table__),
+                columns=dataframe.columns,
+                write_mode=WriteMode.APPEND,
+            )
+
+        return load
+
+    def _read(self, model: Any) -> pd.DataFrame:
+        with self.engine.connect() as cnxn:
+            return pd.read_sql(select(model), cnxn)
+
+    def _staging_exists(self) -> bool:
+        with self.engine.connect() as cnxn:
+            return bool(
+                cnxn.execute(
+                    text(
+                        "SELECT 1 FROM information_schema.schemata"
+                        f" WHERE schema_name = '{staging_schema('dummy')}'"
+                    )
+                ).first()
+            )
+
+    def test_parallel_load(self):
+        dummy_df = pd.DataFrame({"a": [1, 2], "b": ["p", "q"]})
+        jobs = [
+            (self.DummyTable, self._job(dummy_df)),
+            (self.DummyTableTwo, self._job(pd.DataFrame({"x": [3]}))),
+        ]
+        with self.engine.connect() as cnxn:
+            with cnxn.begin():
+                parallel_load(cnxn, "dummy", jobs, workers=2)
+
+        self.assertListEqual(self._read(self.DummyTable)["a"].tolist(), [1, 2])
+        self.assertListEqual(self._read(self.DummyTableTwo)["x"].tolist(), [3])
+        self.assertFalse(self._staging_exists())
+
+    def test_parallel_load_failure(self):
+        def fail(cnxn, target):
+            raise ValueError("broken input")
+
+        jobs = [
+            (self.DummyTable, self._job(pd.DataFrame({"a": [1], "b": ["p"]}))),
+            (self.DummyTableTwo, fail),
+        ]
+        with self.engine.connect() as cnxn:
+            with self.assertRaises(ValueError):
+                with cnxn.begin():
+                    parallel_load(cnxn, "dummy", jobs, workers=2)
+
+        self.assertListEqual(self._read(self.DummyTable)["b"].tolist(), ["old"])
+        self.assertFalse(self._staging_exists())
+
+    def test_drop_staging_schemas(self):
+        jobs = [(self.DummyTable, self._job(pd.DataFrame({"a": [1], "b": ["p"]})))]
+        with self.engine.connect() as cnxn:
+            transaction = cnxn.begin()
+            parallel_load(cnxn, "dummy", jobs, workers=1)
+            transaction.rollback()
+
+        # the rollback restored the staging schema with the loaded table
+        self.assertTrue(self._staging_exists())
+        self.assertListEqual(self._read(self.DummyTable)["b"].tolist(), ["old"])
+        with self.engine.connect() as cnxn:
+            with cnxn.begin():
+                drop_staging_schemas(cnxn)
+        self.assertFalse(self._staging_exists())